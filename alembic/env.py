@@ -24,7 +24,7 @@ from app.models.users import User
 from app.models.stations import Station, StationSettings, StationProgram, StationControl
 from app.models.washing import WashingAgent, WashingMachine
 from app.models.auth import RefreshToken
-from app.models.logs import Log, Error
+from app.models.logs import Log, Error, StationActivity, LogsHourlyStats, LogsStatsChangedHour
 from app.models.relations import LaundryStation
 
 target_metadata = Base.metadata
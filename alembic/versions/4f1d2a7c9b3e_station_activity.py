@@ -0,0 +1,34 @@
+"""station activity summary
+
+Revision ID: 4f1d2a7c9b3e
+Revises: c53c56ff083c
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1d2a7c9b3e'
+down_revision = 'c53c56ff083c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # после миграции сводку нужно заполнить по истории логов: python manage.py backfill_activity
+    op.create_table('station_activity',
+    sa.Column('station_id', sa.UUID(), nullable=False),
+    sa.Column('last_work_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('last_maintenance_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('last_error_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('errors_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('errors_counted_from', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['station_id'], ['station.id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('station_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('station_activity')
@@ -0,0 +1,26 @@
+"""station control and settings versions
+
+Revision ID: 7c3a9e5f1b42
+Revises: d2c8e41f7a63
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3a9e5f1b42'
+down_revision = 'd2c8e41f7a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('station_control', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('station_settings', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('station_settings', 'version')
+    op.drop_column('station_control', 'version')
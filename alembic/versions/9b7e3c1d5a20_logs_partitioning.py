@@ -0,0 +1,80 @@
+"""logs and errors monthly partitioning
+
+Revision ID: 9b7e3c1d5a20
+Revises: 4f1d2a7c9b3e
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+import datetime
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9b7e3c1d5a20'
+down_revision = '4f1d2a7c9b3e'
+branch_labels = None
+depends_on = None
+
+TABLES = ('logs', 'errors')
+MONTHS_AHEAD = 3  # дальше партиции создаются командой python manage.py create_partitions
+
+
+def execute(query: str):
+    # без text(): в границах партиций есть двоеточия
+    return op.get_bind().exec_driver_sql(query)
+
+
+def next_month(month: datetime.date) -> datetime.date:
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def upgrade() -> None:
+    # таблицы пересоздаются секционированными по времени создания, данные копируются, ИД (последовательности)
+    #  сохраняются; первичный ключ - (id, timestamp), т.к. ключ секционирования должен в него входить
+    for table in TABLES:
+        execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        execute(f"ALTER INDEX {table}_pkey RENAME TO {table}_old_pkey")
+        execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        execute(f"UPDATE {table}_old SET timestamp = now() WHERE timestamp IS NULL")
+
+        execute(f"CREATE TABLE {table} (LIKE {table}_old INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)")
+        execute(f"ALTER TABLE {table} ALTER COLUMN timestamp SET NOT NULL")
+        execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, timestamp)")
+        execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_station_id_fkey FOREIGN KEY (station_id) "
+                f"REFERENCES station (id) ON DELETE CASCADE ON UPDATE CASCADE")
+        execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        execute(f"CREATE INDEX ix_{table}_station_id_timestamp ON {table} (station_id, timestamp DESC)")
+        execute(f"CREATE INDEX ix_{table}_station_id_code_timestamp ON {table} (station_id, code, timestamp DESC)")
+        execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+        today = datetime.datetime.now(datetime.timezone.utc).date().replace(day=1)
+        first_log_at = execute(f"SELECT min(timestamp) FROM {table}_old").scalar()
+        month = min(first_log_at.date(), today).replace(day=1) if first_log_at else today
+        last_month = today
+        for _ in range(MONTHS_AHEAD - 1):
+            last_month = next_month(last_month)
+        while month <= last_month:
+            execute(f"CREATE TABLE {table}_y{month.year}m{month.month:02d} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{next_month(month).isoformat()} 00:00:00+00')")
+            month = next_month(month)
+
+        execute(f"INSERT INTO {table} SELECT * FROM {table}_old")
+        execute(f"DROP TABLE {table}_old")
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        execute(f"ALTER TABLE {table} RENAME TO {table}_partitioned")
+        execute(f"ALTER INDEX {table}_pkey RENAME TO {table}_partitioned_pkey")
+        execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+        execute(f"CREATE TABLE {table} (LIKE {table}_partitioned INCLUDING DEFAULTS)")
+        execute(f"ALTER TABLE {table} ALTER COLUMN timestamp DROP NOT NULL")
+        execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id)")
+        execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_station_id_fkey FOREIGN KEY (station_id) "
+                f"REFERENCES station (id) ON DELETE CASCADE ON UPDATE CASCADE")
+        execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+        execute(f"INSERT INTO {table} SELECT * FROM {table}_partitioned")
+        execute(f"DROP TABLE {table}_partitioned")
@@ -0,0 +1,40 @@
+"""logs hourly stats
+
+Revision ID: d2c8e41f7a63
+Revises: 9b7e3c1d5a20
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2c8e41f7a63'
+down_revision = '9b7e3c1d5a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # статистика заполнится по всей истории логов при первом пересчете (фоновая задача сервера)
+    op.create_table('logs_hourly_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('hour', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('station_id', sa.UUID(), nullable=False),
+    sa.Column('log_type', sa.Enum('LOG', 'ERROR', name='logtypeenum'), nullable=False),
+    sa.Column('code', sa.Float(), nullable=False),
+    sa.Column('action', postgresql.ENUM(name='logactionenum', create_type=False), nullable=True),
+    sa.Column('scope', postgresql.ENUM(name='errortypeenum', create_type=False), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['station_id'], ['station.id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_logs_hourly_stats_hour_station_id', 'logs_hourly_stats', ['hour', 'station_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_logs_hourly_stats_hour_station_id', table_name='logs_hourly_stats')
+    op.drop_table('logs_hourly_stats')
+    sa.Enum(name='logtypeenum').drop(op.get_bind(), checkfirst=True)
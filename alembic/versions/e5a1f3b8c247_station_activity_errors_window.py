@@ -0,0 +1,27 @@
+"""station activity errors window
+
+Revision ID: e5a1f3b8c247
+Revises: 7c3a9e5f1b42
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1f3b8c247'
+down_revision = '7c3a9e5f1b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # количество ошибок за период теперь считается по таблице ошибок (StationActivity.recent_errors_count)
+    op.drop_column('station_activity', 'errors_counted_from')
+    op.drop_column('station_activity', 'errors_count')
+
+
+def downgrade() -> None:
+    op.add_column('station_activity', sa.Column('errors_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('station_activity', sa.Column('errors_counted_from', sa.TIMESTAMP(timezone=True), nullable=True))
@@ -0,0 +1,44 @@
+"""logs stats changed hours
+
+Revision ID: f3b9d2a6c815
+Revises: e5a1f3b8c247
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.static import sql_queries
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d2a6c815'
+down_revision = 'e5a1f3b8c247'
+branch_labels = None
+depends_on = None
+
+TABLES = ('logs', 'errors')
+
+
+def upgrade() -> None:
+    op.create_table('logs_stats_changed_hours',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('hour', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(sql_queries.CREATE_STATS_CHANGED_HOURS_FUNCTION)
+    for table in TABLES:
+        op.execute(sql_queries.CREATE_STATS_CHANGED_HOURS_TRIGGER.format(table=table))
+        # часы, которые прежний пересчет еще пересчитал бы (с часа перед последним посчитанным)
+        op.execute(
+            f"INSERT INTO logs_stats_changed_hours (hour) "
+            f"SELECT DISTINCT timezone('UTC', date_trunc('hour', timezone('UTC', timestamp))) FROM {table} "
+            f"WHERE timestamp >= (SELECT max(hour) - interval '1 hour' FROM logs_hourly_stats)"
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER {table}_stats_changed_hours ON {table}")
+    op.execute("DROP FUNCTION mark_logs_stats_changed_hours()")
+    op.drop_table('logs_stats_changed_hours')
@@ -1,17 +1,31 @@
-from typing import Any
+from __future__ import annotations
 
+import csv
+import datetime
+import io
+import uuid
+from contextlib import nullcontext
+from typing import Any, AsyncGenerator
+
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, delete, tuple_, Select, func, literal
 
+import config
 import services
 from ..schemas import schemas_logs as schema, schemas_stations
 from ..models import logs
-from ..models.logs import Log, Error
-from ..static.enums import LogFromEnum, LogActionEnum, LogTypeEnum, StationParamsEnum, WashingServicesEnum, ErrorTypeEnum
+from ..models.logs import Log, Error, StationActivity, LogsHourlyStats, utc_trunc
+from ..models.stations import Station
+from ..static.enums import LogFromEnum, LogActionEnum, LogTypeEnum, StationParamsEnum, WashingServicesEnum, \
+	ErrorTypeEnum, RegionEnum, ExportFormatEnum, StatsBucketEnum, StatsGroupingEnum, CacheTagEnum
 from .managers.station import StationManager
 from .managers.washing import WashingServicesManager
 from ..utils.general import sa_object_to_dict
-from ..exceptions import ValidationError
+from ..utils.cache import station_auth_cache, station_data_cache, invalidate_cache
+from ..utils.locks import StationLock
+from ..utils.logs_buffer import logs_buffer
+from ..exceptions import ValidationError, AppException, VersionConflictError
 
 
 class CRUDLog:
@@ -37,79 +51,229 @@ class CRUDLog:
 		"""
 		Добавление лога.
 		По дефолту лог от станции, ибо от сервера логи намного реже будут нужны (мб поменять наоборот).
+		Лог без действия при включенной отложенной записи не пишется сразу, а ставится в очередь (logs_buffer).
+		Изменения станции по действию лога записываются вместе с ним - одним коммитом (см. StationManagerBase),
+		 под блокировкой станции (StationLock).
 		"""
-		data = dict(**self._instance.dict(), sended_from=log_from)
-		if self._model == "Error":
-			action = services.ERROR_ACTIONS[self._instance.scope].get(self._code)
-		elif self._model == "Log":
-			action = services.LOG_ACTIONS.get(self._code)
-		if action:
-			data.setdefault("action", action)
+		data, action = self._prepare_data(log_from)
+		if self._model == "Log" and not action and logs_buffer.active:
+			data = await logs_buffer.prepare(data)
+			if await logs_buffer.put(data):
+				return self._schema(**data)
+
 		model = getattr(logs, self._model)
 		instance = model(**data)
-		db.add(instance)
+		# действия по логам одной станции выполняются по очереди (даже в разных воркерах) - блокировка берется
+		#  до первого запроса в транзакции, чтобы не ждать ее, удерживая блокировки строк в БД
+		try:
+			async with StationLock(station.id) if action else nullcontext() as lock:
+				db.add(instance)
+				await StationActivity.register(db, station.id, [action], errors_amount=int(self._model == "Error"))
 
-		if action:
-			await self.__initiate_action(action, db, station, self._data)
+				if action:
+					await self.__initiate_action(action, db, station, self._data)
+					await lock.check()
 
-		await db.commit()
-		await db.refresh(instance)
+				await db.commit()  # ИД и время создания лога получены при вставке (RETURNING), refresh не нужен
+		finally:
+			if action:  # в т.ч. при ошибке: в кэш могли попасть данные из незакоммиченной транзакции
+				await station_auth_cache.invalidate(station.id)
+				await station_data_cache.invalidate(station.id)
+				await invalidate_cache(CacheTagEnum.STATIONS)
 
 		return self._schema(
 			**sa_object_to_dict(instance)
 		)
 
 	@staticmethod
-	async def get_station_logs(station: schemas_stations.StationGeneralParams, db: AsyncSession, limit: int,
-							   *args, schemas: bool = False):
+	def _station_logs_query(model: type[Log | Error], station: schemas_stations.StationGeneralParams, codes: tuple,
+							cursor: tuple[datetime.datetime, int] | None = None,
+							since: datetime.datetime | None = None, until: datetime.datetime | None = None,
+							action: LogActionEnum | None = None, sended_from: LogFromEnum | None = None) -> Select:
 		"""
-		:params args: нужные коды логов
+		Логи/ошибки станции с фильтрами, от новых к старым.
+		:params codes: нужные коды
+		:params cursor: (время, ИД) последнего лога предыдущей страницы - отдаются логи старше него
 		"""
 		code_type = int | float | None
-		if any((not isinstance(code, code_type) for code in args)):
+		if any((not isinstance(code, code_type) for code in codes)):
 			raise ValueError("Invalid log code type")
-		codes = [float(c) for c in args if c]
-		if not codes:
-			query = select(Log).where(Log.station_id == station.id).order_by(Log.timestamp.desc()).limit(limit)
-		else:
-			query = select(Log).where(
-				(Log.station_id == station.id) & (Log.code.in_(codes))
-			).order_by(Log.timestamp.desc()).limit(limit)
+		codes = [float(c) for c in codes if c]
+
+		query = select(model).where(model.station_id == station.id)
+		if codes:
+			query = query.where(model.code.in_(codes))
+		if since:
+			query = query.where(model.timestamp >= since)
+		if until:
+			query = query.where(model.timestamp < until)
+		if action:
+			query = query.where(model.action == action)
+		if sended_from:
+			query = query.where(model.sended_from == sended_from)
+		if cursor:
+			query = query.where(tuple_(model.timestamp, model.id) < tuple_(*cursor))
+		return query.order_by(model.timestamp.desc(), model.id.desc())
+
+	@classmethod
+	async def get_station_logs(cls, station: schemas_stations.StationGeneralParams, db: AsyncSession, limit: int,
+							   *args, schemas: bool = False, **filters):
+		"""
+		:params args: нужные коды логов
+		:params filters: курсор и фильтры (_station_logs_query)
+		"""
+		query = cls._station_logs_query(Log, station, args, **filters).limit(limit)
 		result = (await db.execute(query)).scalars().all()
 		if schemas:
 			result = [schema.Log(**l.__dict__) for l in result]
 		return result
 
-	@staticmethod
-	async def get_station_errors(station: schemas_stations.StationGeneralParams, db: AsyncSession, limit: int,
-								 errors_type: ErrorTypeEnum, code: int | float | None):
+	@classmethod
+	async def get_station_errors(cls, station: schemas_stations.StationGeneralParams, db: AsyncSession, limit: int,
+								 errors_type: ErrorTypeEnum, *args, **filters):
+		"""
+		:params args: нужные коды ошибок
+		:params filters: курсор и фильтры (_station_logs_query)
+		"""
+		query = cls._station_logs_query(Error, station, args, **filters).limit(limit)
 		match errors_type:
 			case errors_type.PUBLIC | errors_type.SERVICE:
-				if not code:
-					query = select(Error).where(
-						(Error.station_id == station.id)
-						& (Error.scope == errors_type)
-					).order_by(Error.timestamp.desc()).limit(limit)
-				else:
-					query = select(Error).where(
-						(Error.station_id == station.id)
-						& (Error.scope == errors_type) &
-						(Error.code == code)
-					).order_by(Error.timestamp.desc()).limit(limit)
-			case errors_type.ALL:
-				if not code:
-					query = select(Error).where(
-						Error.station_id == station.id
-					).order_by(Error.timestamp.desc()).limit(limit)
-				else:
-					query = select(Error).where(
-						(Error.station_id == station.id) &
-						(Error.code == code)
-					).order_by(Error.timestamp.desc()).limit(limit)
+				query = query.where(Error.scope == errors_type)
 		result = (await db.execute(query)).scalars().all()
 
 		return result
 
+	@staticmethod
+	async def export(db: AsyncSession, log_type: LogTypeEnum, export_format: ExportFormatEnum,
+					 since: datetime.datetime, until: datetime.datetime | None = None,
+					 station_id: uuid.UUID | None = None, region: RegionEnum | None = None,
+					 errors_type: ErrorTypeEnum = ErrorTypeEnum.ALL) -> AsyncGenerator[str, None]:
+		"""
+		Выгрузка логов/ошибок станции и/или региона за период (по возрастанию времени) в NDJSON/CSV.
+		Строки читаются серверным курсором по config.LOGS_EXPORT_CHUNK_SIZE и отдаются частями -
+		 память не зависит от объема выгрузки.
+		"""
+		match log_type:
+			case LogTypeEnum.LOG:
+				model, schema_ = Log, schema.Log
+			case LogTypeEnum.ERROR:
+				model, schema_ = Error, schema.Error
+		query = select(model).where(model.timestamp >= since)
+		if until:
+			query = query.where(model.timestamp < until)
+		if station_id:
+			query = query.where(model.station_id == station_id)
+		if region:
+			query = query.join(Station, Station.id == model.station_id).where(Station.region == region)
+		if log_type == LogTypeEnum.ERROR and errors_type != ErrorTypeEnum.ALL:
+			query = query.where(model.scope == errors_type)
+		query = query.order_by(model.timestamp, model.id).execution_options(yield_per=config.LOGS_EXPORT_CHUNK_SIZE)
+
+		fields = list(schema_.__fields__)
+		if export_format == ExportFormatEnum.CSV:
+			yield ",".join(fields) + "\r\n"
+		async for rows in (await db.stream_scalars(query)).partitions():
+			match export_format:
+				case ExportFormatEnum.NDJSON:
+					yield "".join(schema_.from_orm(row).json() + "\n" for row in rows)
+				case ExportFormatEnum.CSV:
+					chunk = io.StringIO()
+					writer = csv.writer(chunk)
+					for row in rows:
+						row = jsonable_encoder(schema_.from_orm(row))
+						writer.writerow([row[field] for field in fields])
+					yield chunk.getvalue()
+
+	@staticmethod
+	async def get_stats(db: AsyncSession, log_type: LogTypeEnum, bucket: StatsBucketEnum,
+						group_by: list[StatsGroupingEnum], since: datetime.datetime,
+						until: datetime.datetime | None = None, station_id: uuid.UUID | None = None,
+						region: RegionEnum | None = None,
+						errors_type: ErrorTypeEnum = ErrorTypeEnum.ALL) -> list[schema.LogsStats]:
+		"""
+		Количество логов/ошибок по периодам (UTC) с группировкой - по почасовой статистике (LogsHourlyStats).
+		Статистика обновляется с периодичностью config.LOGS_STATS_REFRESH_INTERVAL.
+		Если строк больше config.MAX_LOGS_STATS_ROWS - ValidationError (обрезанная статистика была бы неверной).
+		"""
+		stats = LogsHourlyStats
+		bucket_start = utc_trunc(bucket.value, stats.hour).label("bucket")
+		grouping_columns = {StatsGroupingEnum.CODE: stats.code, StatsGroupingEnum.ACTION: stats.action,
+							StatsGroupingEnum.REGION: Station.region, StatsGroupingEnum.STATION: stats.station_id}
+		columns = [grouping_columns[field].label(field.value) for field in grouping_columns if field in group_by]
+
+		query = select(bucket_start, *columns, func.sum(stats.count).label("count")).where(
+			(stats.log_type == log_type) & (stats.hour >= utc_trunc("hour", literal(since, stats.hour.type)))
+		)
+		if until:
+			query = query.where(stats.hour < until)
+		if station_id:
+			query = query.where(stats.station_id == station_id)
+		if region or StatsGroupingEnum.REGION in group_by:
+			query = query.join(Station, Station.id == stats.station_id)
+		if region:
+			query = query.where(Station.region == region)
+		if log_type == LogTypeEnum.ERROR and errors_type != ErrorTypeEnum.ALL:
+			query = query.where(stats.scope == errors_type)
+		query = query.group_by(bucket_start, *columns).order_by(bucket_start, *columns) \
+			.limit(config.MAX_LOGS_STATS_ROWS + 1)
+
+		result = (await db.execute(query)).mappings().all()
+		if len(result) > config.MAX_LOGS_STATS_ROWS:
+			raise ValidationError(f"Too many stats rows (more than {config.MAX_LOGS_STATS_ROWS}): "
+								  f"narrow the period or use a larger bucket / fewer grouping fields")
+		return [schema.LogsStats(**row) for row in result]
+
+	@classmethod
+	async def add_batch(cls, logs_: list[CRUDLog], station: schemas_stations.StationGeneralParams,
+						db: AsyncSession) -> list[schema.Log | schema.Error | AppException]:
+		"""
+		Пакетное добавление логов/ошибок станцией.
+		Логи и ошибки добавляются двумя multi-row INSERT'ами, затем по порядку выполняются их действия.
+		Если действие выполнить не удалось, его изменения откатываются, а лог удаляется (как и при одиночном
+		 добавлении) - вместо лога в результате будет исключение.
+
+		Сессия должна быть из get_async_session_in_transaction: коммиты здесь и в действиях фиксируют только
+		 savepoint'ы, всю транзакцию (проверив блокировку станции) коммитит и сбрасывает кэши станции
+		 вызывающая сторона.
+		"""
+		prepared_data = [crud_log._prepare_data(LogFromEnum.STATION) for crud_log in logs_]
+		results: list[schema.Log | schema.Error | AppException | None] = [None] * len(logs_)
+		for model_name in ("Log", "Error"):
+			indexes = [idx for idx, crud_log in enumerate(logs_) if crud_log._model == model_name]
+			if not indexes:
+				continue
+			model = getattr(logs, model_name)
+			instances = (await db.scalars(
+				insert(model).returning(model, sort_by_parameter_order=True),
+				[prepared_data[idx][0] for idx in indexes]
+			)).all()
+			for idx, instance in zip(indexes, instances):
+				results[idx] = logs_[idx]._schema(**sa_object_to_dict(instance))
+		await db.commit()
+
+		for idx, (crud_log, (_, action)) in enumerate(zip(logs_, prepared_data)):
+			if not action:
+				continue
+			try:
+				await cls.__initiate_action(action, db, station, crud_log._data)
+				await db.commit()
+			except AppException as e:
+				await db.rollback()
+				model = getattr(logs, crud_log._model)
+				await db.execute(delete(model).where(model.id == results[idx].id))
+				await db.commit()
+				results[idx] = e
+
+		created = [(crud_log, action) for crud_log, (_, action), result in zip(logs_, prepared_data, results)
+				   if not isinstance(result, AppException)]
+		await StationActivity.register(
+			db, station.id, [action for _, action in created],
+			errors_amount=len([crud_log for crud_log, _ in created if crud_log._model == "Error"])
+		)
+		await db.commit()
+
+		return results
+
 	@classmethod
 	async def server(cls, code: int | float, content: str,
 					 station: schemas_stations.StationGeneralParams, db: AsyncSession) -> None:
@@ -119,6 +283,18 @@ class CRUDLog:
 		log = schema.LogCreate(station_id=station.id, code=code, content=content)
 		await cls(log, LogTypeEnum.LOG).add(station, db, LogFromEnum.SERVER)
 
+	def _prepare_data(self, log_from: LogFromEnum) -> tuple[dict[str, Any], LogActionEnum | None]:
+		"""
+		Данные для записи лога в БД и действие, которое нужно выполнить после его добавления.
+		"""
+		data = dict(**self._instance.dict(), sended_from=log_from)
+		if self._model == "Error":
+			action = services.ERROR_ACTIONS[self._instance.scope].get(self._code)
+		elif self._model == "Log":
+			action = services.LOG_ACTIONS.get(self._code)
+		data.setdefault("action", action)
+		return data, action
+
 	def _check_additional_data(self) -> None:
 		if self._model == "Log":
 			expecting_data_dict = services.LOG_EXPECTING_DATA
@@ -141,11 +317,25 @@ class CRUDLog:
 							  station: schemas_stations.StationGeneralParams, data: dict[str, Any]) -> None:
 		"""
 		Осуществить действие, требуемое при получении лога.
+		Если данные станции параллельно изменили (VersionConflictError) - действие повторяется с новыми данными
+		 (из БД, кэш станции сбрасывается), но не больше config.STATION_UPDATE_ATTEMPTS раз.
 		:param data: Необходимые данные, полученные из строки лога.
 		"""
+		for attempt in range(1, config.STATION_UPDATE_ATTEMPTS + 1):
+			try:
+				return await CRUDLog.__run_action(action, db, station, data)
+			except VersionConflictError:
+				if attempt == config.STATION_UPDATE_ATTEMPTS:
+					raise
+				await station_data_cache.invalidate(station.id)
+
+	@staticmethod
+	async def __run_action(action: LogActionEnum, db: AsyncSession,
+						   station: schemas_stations.StationGeneralParams, data: dict[str, Any]) -> None:
 		match action:
 			case LogActionEnum.ERROR_STATION_CONTROL_STATUS_START:
-				await StationManager(station, db).raise_error()
+				async with StationManager(station, db) as sm:
+					await sm.raise_error()
 
 			case LogActionEnum.ERROR_STATION_CONTROL_STATUS_END:
 				async with StationManager(station, db, StationParamsEnum.CONTROL) as sm:
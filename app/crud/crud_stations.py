@@ -1,91 +1,108 @@
 import datetime
+import hashlib
+import json
 import uuid
 
+from fastapi.encoders import jsonable_encoder
 from pydantic import UUID4
-from sqlalchemy import select, delete, update
+from sqlalchemy import select, delete, case
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Session
 from loguru import logger
 
 from ..exceptions import UpdatingError, GettingDataError, CreatingError
 from ..models.stations import Station, StationSettings, StationControl, StationProgram
+from ..models.logs import StationActivity
 from ..models.relations import LaundryStation
-from .crud_logs import CRUDLog
 from ..models.washing import WashingAgent, WashingMachine
 from ..models.users import User
 from ..schemas import schemas_stations, schemas_users, schemas_washing
 from ..static.enums import StationParamsEnum, QueryFromEnum, StationStatusEnum, StationsSortingEnum, \
-	RoleEnum, LogActionEnum
+	RoleEnum, RegionEnum, CacheTagEnum
 from ..static.typing import StationParamsSet
-from ..utils.general import encrypt_data
+from ..utils.cache import station_auth_cache, station_data_cache, invalidate_cache
+from ..utils.general import encrypt_data, sa_object_to_dict, encode_etag
 from ..crud import crud_logs as log
-from ..utils.general import get_sa_tree
 
 
-async def read_all_stations(db: Session, async_db: AsyncSession, user: schemas_users.User,
-							order_by: StationsSortingEnum, desc: bool):
+async def read_all_stations(db: AsyncSession, user: schemas_users.User,
+							order_by: StationsSortingEnum, desc: bool,
+							limit: int | None = None, cursor: uuid.UUID | None = None) -> list[schemas_stations.StationInList]:
 	"""
-	:TODO: сделать асинхронный запрос - так и не смог понять, как сделать мульти-джоин...
-	:TODO: + желательно, естественно, объединить все в один запрос
+	Список станций (без подробных данных) одним запросом: станция, контроль, собственник (через LaundryStation),
+	 сводка активности станции (время последней работы/обслуживания/ошибки, см. StationActivity)
+	 и количество ошибок за период (StationActivity.recent_errors_count).
+
+	Сортировка делается в БД: станции без значения сортируемого поля (собственника, статуса, логов)
+	 всегда в конце списка, при равных значениях - по ИД станции.
+	Пагинация по ключу (keyset): cursor - ИД последней станции предыдущей страницы.
 	"""
-	query = db.query(Station, StationControl, LaundryStation)
+	def enum_rank(column, enum):
+		# в БД хранятся названия enum'ов, а сортировать нужно по значениям
+		return case(
+			*((column == member, rank) for rank, member in enumerate(sorted(enum, key=lambda m: m.value)))
+		)
+
+	last_work_at, last_maintenance_at = StationActivity.last_work_at, StationActivity.last_maintenance_at
+	sorting_keys = {StationsSortingEnum.NAME: Station.name.collate("C"),
+					StationsSortingEnum.REGION: enum_rank(Station.region, RegionEnum),
+					StationsSortingEnum.OWNER: User.last_name.collate("C"),
+					StationsSortingEnum.STATUS: enum_rank(StationControl.status, StationStatusEnum),
+					StationsSortingEnum.LAST_WORK: last_work_at,
+					StationsSortingEnum.MAINTENANCE: last_maintenance_at}
+	sorting_key = sorting_keys[order_by]
+
+	query = select(
+		Station, StationControl, User, StationActivity, StationActivity.recent_errors_count(Station.id)
+	).join(
+		StationControl, Station.id == StationControl.station_id
+	).outerjoin(
+		LaundryStation, Station.id == LaundryStation.station_id
+	).outerjoin(
+		User, User.id == LaundryStation.user_id
+	).outerjoin(
+		StationActivity, Station.id == StationActivity.station_id
+	)
 	if user.role in (RoleEnum.INSTALLER, RoleEnum.REGION_MANAGER):
-		query = (query.where(Station.region == user.region).
-			 join(StationControl, Station.id == StationControl.station_id).
-			 join(LaundryStation, Station.id == LaundryStation.station_id, isouter=True).all())
+		query = query.where(Station.region == user.region)
+
+	if cursor:
+		cursor_key = (await db.execute(
+			query.with_only_columns(sorting_key).where(Station.id == cursor)
+		)).first()
+		if cursor_key is None:
+			raise GettingDataError(f"Station {cursor} (cursor) not found")
+		cursor_key = cursor_key[0]
+		after = (lambda a, b: a < b) if desc else (lambda a, b: a > b)
+		if cursor_key is None:
+			query = query.where(sorting_key.is_(None) & after(Station.id, cursor))
+		else:
+			query = query.where(
+				after(sorting_key, cursor_key) |
+				((sorting_key == cursor_key) & after(Station.id, cursor)) |
+				sorting_key.is_(None)
+			)
+
+	if desc:
+		query = query.order_by(sorting_key.desc().nulls_last(), Station.id.desc())
 	else:
-		query = (query.join(StationControl, Station.id == StationControl.station_id).
-			 join(LaundryStation, Station.id == LaundryStation.station_id, isouter=True).all())
+		query = query.order_by(sorting_key.asc().nulls_last(), Station.id.asc())
+	if limit:
+		query = query.limit(limit)
 
-	instances = get_sa_tree(query)
 	stations_list = []
-	for step in range(len(instances) // 3):
-		obj_data = instances[step * 3:(step + 1) * 3]
-		general, control, owner = obj_data
-		general = schemas_stations.StationGeneralParams(**general)
-		if owner:  # потом объединить в один запрос
-			owner = await User.get_user_by_id(async_db, owner["user_id"])
-		logs = await CRUDLog.get_station_logs(general, async_db, 2, 9.17, 3.1,  # коды потом можно законфигить
-											  schemas=True)
-		last_maintenance_log_at = None
-		last_working_log_at = None
-		for log_ in logs:
-			if not last_maintenance_log_at and log_.action == LogActionEnum.STATION_MAINTENANCE_END:
-				last_maintenance_log_at = log_.timestamp
-			if not last_working_log_at and log_.action == LogActionEnum.STATION_WORKING_PROCESS:
-				last_working_log_at = log_.timestamp
-		stations_list.append(schemas_stations.StationInList(general=general, owner=owner, control=control,
-								  last_work_at=last_working_log_at, last_maintenance_at=last_maintenance_log_at))
-
-	def sort_stations(lst: list[schemas_stations.StationInList]) -> list[schemas_stations.StationInList]:
-		null_attr_objs = []
-		sorting_keys = {StationsSortingEnum.OWNER: lambda st_: st_.owner.last_name,
-						StationsSortingEnum.STATUS: lambda st_: st_.control.status.value,
-						StationsSortingEnum.MAINTENANCE: lambda st_: st_.last_maintenance_at,
-						StationsSortingEnum.LAST_WORK: lambda st_: st_.last_work_at,
-						StationsSortingEnum.NAME: lambda st_: st_.general.name,
-						StationsSortingEnum.REGION: lambda st_: st_.general.region.value}
-		for idx, st in enumerate(lst):
-			nullable_fields = {StationsSortingEnum.OWNER: st.owner,
-					  StationsSortingEnum.LAST_WORK: st.last_work_at,
-					  StationsSortingEnum.MAINTENANCE: st.last_maintenance_at,
-					  StationsSortingEnum.STATUS: st.control.status}
-			if order_by in nullable_fields:
-				field = nullable_fields[order_by]
-				if field is None:
-					null_attr_objs.append(st)
-		for st in null_attr_objs:
-			del lst[lst.index(st)]
-
-		sorting_params = {"key": sorting_keys[order_by]}
-		if desc:
-			sorting_params["reverse"] = True
-		result = sorted(lst, **sorting_params)
-		result.extend(null_attr_objs)
-
-		return result
+	# у собственника нескольких станций во всех строках один и тот же объект сессии - его нельзя менять (from_orm)
+	for general, control, owner, activity, errors_count in (await db.execute(query)).all():
+		activity = schemas_stations.StationActivity(**sa_object_to_dict(activity)) if activity \
+			else schemas_stations.StationActivity()
+		stations_list.append(schemas_stations.StationInList(
+			general=schemas_stations.StationGeneralParams(**sa_object_to_dict(general)),
+			owner=schemas_users.User.from_orm(owner) if owner else None,
+			control=schemas_stations.StationControl(**sa_object_to_dict(control)),
+			last_work_at=activity.last_work_at, last_maintenance_at=activity.last_maintenance_at,
+			last_error_at=activity.last_error_at, errors_count=errors_count
+		))
 
-	return sort_stations(stations_list)
+	return stations_list
 
 
 async def create_station(db: AsyncSession,
@@ -204,6 +221,34 @@ async def read_station(
 	return data
 
 
+async def read_station_etag(
+	station: schemas_stations.StationGeneralParamsForStation,
+	db: AsyncSession,
+	params_set: StationParamsEnum | None = None
+) -> str | None:
+	"""
+	ETag данных станции для станции (набора или всех данных, если набор не указан).
+	Берется ДО чтения данных (тогда он не новее их) и без запросов к БД:
+	 - основные параметры - общее для воркеров поколение станции (см. StationAuthCache) и хэш содержимого
+	   (станция из get_current_station уже сверена с этим поколением, поэтому во всех воркерах одинакова);
+	 - наборы - версия из кэша данных станций (см. StationDataCache.version).
+	None - версии сейчас нет (в т.ч. если Redis недоступен).
+	"""
+	generation = await station_auth_cache.generation(station.id)
+	if generation is None:
+		return
+	general_hash = hashlib.md5(
+		json.dumps(jsonable_encoder(station), sort_keys=True).encode()
+	).hexdigest()[:16]
+	general_version = f"{generation or 0}.{general_hash}"
+	if params_set == StationParamsEnum.GENERAL:
+		return encode_etag(general_version)
+	version = await station_data_cache.version(db, station.id, params_set)
+	if version is None:
+		return
+	return encode_etag(version if params_set else f"{version}.{general_version}")
+
+
 async def read_station_all(
 	station: schemas_stations.StationGeneralParamsForStation | schemas_stations.StationGeneralParams,
 	db: AsyncSession,
@@ -211,18 +256,13 @@ async def read_station_all(
 	user: schemas_users.User = None
 ) -> schemas_stations.StationForStation | schemas_stations.Station:
 	"""
-	Возвращает все данные по станции.
-
-	Надо обязательно сократить количество запросов... (отмечено в TODO).
+	Возвращает все данные по станции (один запрос к БД, см. Station.relations).
 	"""
 	if query_from == QueryFromEnum.USER:
 		if not user:
 			raise ValueError("Expected for user object")
 		Station.check_user_permissions(user, station)
-	settings, control = await Station.relations(db, station)
-	programs = await StationProgram.get_relation_data(station, db)
-	washing_machines = await WashingMachine.get_station_objects(station.id, db)
-	washing_agents = await WashingAgent.get_station_objects(station.id, db)
+	settings, control, programs, washing_machines, washing_agents = await Station.relations(db, station)
 
 	schema = schemas_stations.StationForStation if query_from == QueryFromEnum.STATION else schemas_stations.Station
 
@@ -249,6 +289,9 @@ async def delete_station(
 	query = delete(Station).where(Station.id == station_id)
 	await db.execute(query)
 	await db.commit()
+	await station_auth_cache.invalidate(station_id)
+	await station_data_cache.invalidate(station_id)
+	await invalidate_cache(CacheTagEnum.STATIONS)
 
 
 async def update_station_general(
@@ -320,10 +363,12 @@ async def update_station_control(
 	station: schemas_stations.StationGeneralParams,
 	updated_params: schemas_stations.StationControlUpdate,
 	db: AsyncSession,
-	action_by: schemas_users.User
+	action_by: schemas_users.User,
+	expected_version: int | None = None
 ) -> schemas_stations.StationControl:
 	"""
 	Обновление текущего состояния станции.
+	Если передана expected_version - только при условии, что версия состояния не изменилась (If-Match).
 
 	:raises Updating error
 	"""
@@ -367,7 +412,7 @@ async def update_station_control(
 	updated_params_list = [key for key, val in updated_params.dict().items()
 						   if getattr(current_station_control, key) != val]
 
-	result = await StationControl.update_relation_data(station, updated_params, db)
+	result = await StationControl.update_relation_data(station, updated_params, db, expected_version=expected_version)
 
 	if any(updated_params_list):
 		info_text = f"Состояние станции {station.id} было успешно изменено пользователем {action_by.email}.\n" \
@@ -381,10 +426,12 @@ async def update_station_settings(
 	station: schemas_stations.StationGeneralParams,
 	updated_params: schemas_stations.StationSettingsUpdate,
 	db: AsyncSession,
-	action_by: schemas_users.User
+	action_by: schemas_users.User,
+	expected_version: int | None = None
 ) -> schemas_stations.StationSettings:
 	"""
 	Обновление настроек станции.
+	Если передана expected_version - только при условии, что версия настроек не изменилась (If-Match).
 
 	:raises Updating error
 	"""
@@ -398,7 +445,8 @@ async def update_station_settings(
 		if updated_params.teh_power is None:
 			updated_params.teh_power = current_station_settings.teh_power
 
-		result = await StationSettings.update_relation_data(station, updated_params, db)
+		result = await StationSettings.update_relation_data(station, updated_params, db,
+															expected_version=expected_version)
 
 		updated_params_list = [key for key, val in updated_params.dict().items()
 							   if getattr(current_station_settings, key) != val]
@@ -409,12 +457,13 @@ async def update_station_settings(
 			await log.CRUDLog.server(6, info_text, station, db)
 
 		if updated_params.station_power is True and current_station_settings.station_power is False:
-			await db.execute(
-				update(StationControl).where(StationControl.station_id == station.id).values(
-					**schemas_stations.StationControlUpdate(status=StationStatusEnum.AWAITING).dict()
-				)
+			await StationControl.update_fields(
+				station.id, schemas_stations.StationControlUpdate(status=StationStatusEnum.AWAITING).dict(), db
 			)
 			await db.commit()
+			await station_auth_cache.invalidate(station.id)
+			await station_data_cache.invalidate(station.id, StationParamsEnum.CONTROL)
+			await invalidate_cache(CacheTagEnum.STATIONS)
 		return result
 	else:
 		return current_station_settings
@@ -493,6 +542,7 @@ async def delete_station_program(
 	)
 	await db.execute(query)
 	await db.commit()
+	await station_data_cache.invalidate(station.id, StationParamsEnum.PROGRAMS)
 
 	info_text = f"Шаг программы №{station_program.program_step} станции {station.id} был успешно " \
 				f"удален пользователем {action_by.email}"
@@ -5,8 +5,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 import services
 from ..models.users import User
 from ..schemas import schemas_users
-from ..static.enums import RoleEnum, UserSortingEnum
-from ..utils.general import sa_objects_dicts_list, get_data_hash
+from ..static.enums import RoleEnum, UserSortingEnum, CacheTagEnum
+from ..utils.cache import invalidate_cache, user_auth_cache
+from ..utils.general import sa_objects_dicts_list
+from ..utils.hashing import data_hashing
 from ..exceptions import UpdatingError
 
 
@@ -44,7 +46,7 @@ async def create_user(user: schemas_users.UserCreate, db: AsyncSession,
 	"""
 	:return: Возвращает словарь с данными созданного юзера.
 	"""
-	hashed_password = get_data_hash(user.password)
+	hashed_password = await data_hashing.hash(user.password)
 	user_params = dict(
 		email=user.email,
 		first_name=user.first_name,
@@ -61,6 +63,7 @@ async def create_user(user: schemas_users.UserCreate, db: AsyncSession,
 
 	await db.execute(query)
 	await db.commit()
+	await invalidate_cache(CacheTagEnum.USERS)
 
 	inserted_user = await User.get_user_by_email(db=db, email=user.email)
 
@@ -89,7 +92,7 @@ async def update_user(user_update: schemas_users.UserUpdate, user: schemas_users
 		if user_exists:
 			raise UpdatingError(f"User updating error: email {user_update.email} already exists")
 	if user_update.password:
-		user_update.password = get_data_hash(user_update.password)
+		user_update.password = await data_hashing.hash(user_update.password)
 	if user_update.role and user_update.role != user.role and user.id == action_by.id:
 		raise PermissionError  # сам себе роль не поменяет
 	params = user_update.dict(exclude_unset=True)
@@ -100,6 +103,8 @@ async def update_user(user_update: schemas_users.UserUpdate, user: schemas_users
 	query = update(User).where(User.id == user.id).values(**params)
 	await db.execute(query)
 	await db.commit()
+	await invalidate_cache(CacheTagEnum.USERS, CacheTagEnum.STATIONS)  # пользователь - и в списке станций (собственник)
+	await user_auth_cache.invalidate(*{user.email, params.get("email", user.email)})
 
 	for key in params:
 		val = params[key]
@@ -117,6 +122,8 @@ async def delete_user(user: schemas_users.User, action_by: schemas_users.User, d
 	query = delete(User).where(User.id == user.id)
 	await db.execute(query)
 	await db.commit()
+	await invalidate_cache(CacheTagEnum.USERS, CacheTagEnum.STATIONS)
+	await user_auth_cache.invalidate(user.email)
 
 	logger.info(f"User ID: {user.id} '{user.email}' was successfully deleted by user {action_by.email} with ID "
 				f"{action_by.id}")
@@ -13,8 +13,9 @@ from ...schemas.schemas_users import User
 from ...models.relations import LaundryStation
 from ...static.typing import SAQueryInstance
 from ...exceptions import CreatingError, DeletingError, GettingDataError
-from ...static.enums import RoleEnum, LaundryStationSorting, RegionEnum
+from ...static.enums import RoleEnum, LaundryStationSorting, RegionEnum, CacheTagEnum
 from ...models.stations import Station
+from ...utils.cache import invalidate_cache
 from ...utils.general import sa_objects_dicts_list
 from ...models import users as user_model
 
@@ -92,6 +93,7 @@ class CRUDLaundryStation(LaundryStationManagerBase):
 		except IntegrityError:
 			raise CreatingError(f"Station ID {self.station.id} already related")
 		await self._db.commit()
+		await invalidate_cache(CacheTagEnum.STATIONS)
 		logger.info(f"{self} was successfully created")
 		return await self._all()
 
@@ -109,6 +111,7 @@ class CRUDLaundryStation(LaundryStationManagerBase):
 			raise DeletingError(f"{self} doesn't exists")
 		await self._db.execute(self._query(delete))
 		await self._db.commit()
+		await invalidate_cache(CacheTagEnum.STATIONS)
 		logger.info(f"{self} was successfully deleted")
 		return {"deleted": {"user_id": self.user.id, "station_id": self.station.id}}
 
@@ -1,7 +1,9 @@
-from typing import Literal
+import datetime
+from typing import Literal, Any
+
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ...exceptions import ValidationError, UpdatingError
+from ...exceptions import ValidationError, UpdatingError, GettingDataError
 from ...models.stations import StationSettings, StationControl, StationProgram, Station
 from ...models.washing import WashingAgent, WashingMachine
 from ...schemas import schemas_stations, schemas_washing, schemas_users
@@ -17,7 +19,14 @@ class StationManagerBase:
 	В args передаются наборы данных, которые нужно обновить. И, естественно, они не должны быть определены в kwargs
 	 при этом.
 
-	Если получать никаких данных в ходе инициализации объекта не нужно - можно без менеджера контекста.
+	Работает как unit of work (только через менеджер контекста):
+	 - при входе все недостающие наборы данных загружаются одним запросом (Station.relations);
+	 - изменения общих параметров, настроек и контроля станции копятся в памяти (только измененные поля);
+	 - при выходе (если не было исключения) они записываются - по одному UPDATE на таблицу, БЕЗ коммита;
+	   контроль - условным UPDATE (StationControl.transition), условия которого проверяются уже в БД;
+	 - настройки и контроль записываются, только если их версии не изменились с момента загрузки
+	   (иначе - VersionConflictError, действие нужно повторить с новыми данными).
+	Коммит (и сброс кэша авторизации станции) делается вне менеджера - один на весь лог.
 	"""
 	_relations = {StationParamsEnum.CONTROL: "_control", StationParamsEnum.SETTINGS: "_settings",
 				 StationParamsEnum.PROGRAMS: "_programs", StationParamsEnum.WASHING_AGENTS: "_agents",
@@ -33,30 +42,111 @@ class StationManagerBase:
 		self._agents: list[schemas_washing.WashingAgent] | None = kwargs.get("agents")
 		self._owner: schemas_users.User | None = kwargs.get("owner")
 		self._datasets = args
+		self._dirty: dict[type[Station | StationSettings | StationControl], dict[str, Any]] = {}
+		self._expected_status: StationStatusEnum | None = None
+		self._versions: dict[type[StationSettings | StationControl], int | None] = {}
 
 	async def __aenter__(self):
 		for dataset in self._datasets:
 			if dataset not in list(StationParamsEnum):
 				raise ValueError("Unexpected station dataset")
-			attr = self._relations[dataset]
-			if not getattr(self, attr):
-				data = await CRUDStation.read_station(self._general, dataset, self._db)
-				setattr(self, attr, data)
+		# настройки и контроль нужны всегда (проверки при изменении и при выходе)
+		required = {StationParamsEnum.SETTINGS, StationParamsEnum.CONTROL, *self._datasets}
+		if any(getattr(self, self._relations[dataset]) is None for dataset in required):
+			settings, control, programs, machines, agents = await Station.relations(
+				self._db, self._general, required=False
+			)
+			loaded = {
+				StationParamsEnum.SETTINGS: settings, StationParamsEnum.CONTROL: control,
+				StationParamsEnum.PROGRAMS: programs,
+				StationParamsEnum.WASHING_MACHINES: [schemas_washing.WashingMachine(**m.dict()) for m in machines],
+				StationParamsEnum.WASHING_AGENTS: [schemas_washing.WashingAgent(**ag.dict()) for ag in agents]
+			}
+			for dataset, data in loaded.items():
+				attr = self._relations[dataset]
+				if getattr(self, attr) is None:
+					setattr(self, attr, data)
+		# машины и средства обязательны, только если они нужны действию (управление станцией работает и без них)
+		for dataset in {StationParamsEnum.WASHING_MACHINES, StationParamsEnum.WASHING_AGENTS} & set(self._datasets):
+			if not getattr(self, self._relations[dataset]):
+				raise GettingDataError(f"Getting {dataset.value} for station {self._general.id} error.\n"
+									   f"DB data not found")
+		self._versions = {StationSettings: self._settings.version, StationControl: self._control.version}
 		return self
 
 	async def __aexit__(self, exc_type, exc_val, exc_tb):
-		await self.__check()
+		if exc_type is None:
+			self.__check()
+			await self.flush()
 
-	async def __check(self) -> None:
-		if not self._settings:
-			self._settings = await CRUDStation.read_station(self._general, StationParamsEnum.SETTINGS, self._db)
-		if not self._control:
-			self._control = await CRUDStation.read_station(self._general, StationParamsEnum.CONTROL, self._db)
+	def __check(self) -> None:
 		if self._control.status:
 			if self._settings.station_power is False:
 				update_settings_schema = schemas_stations.StationSettingsUpdate(**self._settings.dict())
 				update_settings_schema.station_power = True
-				await StationSettings.update_relation_data(self._general, update_settings_schema, self._db)
+				self._update_settings(update_settings_schema)
+
+	async def flush(self) -> None:
+		"""
+		Запись накопленных изменений (по одному UPDATE на таблицу).
+		Контроль пишется последним - его условие (станция включена) проверяется с учетом новых настроек.
+		"""
+		if Station in self._dirty:
+			await Station.update(self._db, self._general.id, self._dirty[Station], commit=False)
+		if StationSettings in self._dirty:
+			self._versions[StationSettings] = await StationSettings.update_fields(
+				self._general.id, self._dirty[StationSettings], self._db,
+				expected_version=self._versions.get(StationSettings)
+			)
+		if StationControl in self._dirty:
+			self._control = await StationControl.transition(
+				self._general.id, StationControl.encode_values(self._dirty[StationControl]), self._db,
+				power_required=StationControl.requires_power(self._control), expected_status=self._expected_status,
+				expected_version=self._versions.get(StationControl)
+			)
+			self._versions[StationControl] = self._control.version
+		self._dirty = {}
+		self._expected_status = None
+
+	def _set_dirty(self, model: type[Station | StationSettings | StationControl], field: str, value: Any) -> None:
+		self._dirty.setdefault(model, {})[field] = value
+
+	def _update_general(self, updated_params: schemas_stations.StationGeneralParamsUpdate) -> None:
+		for field, value in updated_params.dict(exclude_unset=True).items():
+			if getattr(self._general, field) != value:
+				setattr(self._general, field, value)
+				self._set_dirty(Station, field, value)
+
+	def _update_settings(self, updated_params: schemas_stations.StationSettingsUpdate) -> None:
+		"""
+		Те же проверки, что и в StationSettings.update_relation_data.
+		"""
+		if updated_params.station_power is True and not self._general.is_active:
+			raise UpdatingError("Station currently is inactive, but got an station_power 'True'")
+		for field, value in updated_params.dict().items():
+			if getattr(self._settings, field) != value:
+				self._set_dirty(StationSettings, field, value)
+		self._settings = schemas_stations.StationSettings(
+			**updated_params.dict(), updated_at=datetime.datetime.now()
+		)
+		self._set_dirty(StationSettings, "updated_at", self._settings.updated_at)
+
+	def _update_control(self, updated_params: schemas_stations.StationControlUpdate,
+						expected_status: StationStatusEnum | None = None) -> None:
+		"""
+		Проверка по загруженным данным - сразу, а при записи - повторно, в самом UPDATE.
+		:param expected_status: статус, из которого возможен переход (проверяется при записи)
+		"""
+		if StationControl.requires_power(updated_params) and self._settings.station_power is False:
+			raise UpdatingError("Station power currently is False, but got non-nullable control params")
+		if expected_status is not None and self._expected_status is None:
+			self._expected_status = expected_status
+		if not updated_params.updated_at:
+			updated_params.updated_at = datetime.datetime.now()
+		for field, value in updated_params.dict().items():
+			if getattr(self._control, field) != value:
+				self._set_dirty(StationControl, field, value)
+		self._control = schemas_stations.StationControl(**updated_params.dict())
 
 
 class StationManager(StationManagerBase):
@@ -76,7 +166,7 @@ class StationManager(StationManagerBase):
 		update_control_schema = schemas_stations.StationControlUpdate(
 			status=StationStatusEnum.ERROR  # остальное нулевое
 		)
-		await StationControl.update_relation_data(self._general, update_control_schema, self._db)
+		self._update_control(update_control_schema)
 
 	async def pass_error(self) -> None:
 		"""
@@ -89,7 +179,7 @@ class StationManager(StationManagerBase):
 		update_control_schema = schemas_stations.StationControlUpdate(
 			status=StationStatusEnum.AWAITING
 		)
-		await StationControl.update_relation_data(self._general, update_control_schema, self._db)
+		self._update_control(update_control_schema, expected_status=StationStatusEnum.ERROR)
 
 	async def _change_station_power(self, do_power: Literal["on", "off"]) -> None:
 		if not self._settings:
@@ -103,17 +193,16 @@ class StationManager(StationManagerBase):
 				update_settings_schema.station_power = True
 			case "off":
 				update_settings_schema.station_power = False
-		await StationSettings.update_relation_data(self._general, update_settings_schema, self._db)
-		await StationControl.update_relation_data(self._general, update_control_schema, self._db)
+		self._update_settings(update_settings_schema)
+		self._update_control(update_control_schema)
 
 	async def _activate(self):
 		await self._change_station_power("on")
-		self._settings.station_power = True  # костылик. ORM в принципе не реализована. но надо бы =)
 		await self._change_teh_power("on")
 		update_general_schema = schemas_stations.StationGeneralParamsUpdate(
 			is_protected=True, is_active=True
 		)
-		await Station.update(self._db, self._general.id, update_general_schema)
+		self._update_general(update_general_schema)
 
 	async def _change_teh_power(self, do_power: Literal["on", "off"]) -> None:
 		if not self._settings:
@@ -123,7 +212,7 @@ class StationManager(StationManagerBase):
 		match do_power:
 			case "on":
 				update_settings_schema.teh_power = True
-		await StationSettings.update_relation_data(self._general, update_settings_schema, self._db)
+		self._update_settings(update_settings_schema)
 
 	async def _start_manual_working(self, washing_machine_number: int, washing_agent_number: int, volume: int) -> None:
 		if any((not dataset for dataset in (self._machines, self._agents, self._control))):
@@ -148,7 +237,7 @@ class StationManager(StationManagerBase):
 			for ag in update_control_schema.washing_agents:
 				if ag.agent_number == washing_agent_number:
 					ag.volume = volume
-		await StationControl.update_relation_data(self._general, update_control_schema, self._db)
+		self._update_control(update_control_schema)
 
 	async def _update_working_process(self, washing_machine_number: int, program_step_number: int,
 									  program_number: int, washing_machines_queue: list[int]) -> None:
@@ -165,7 +254,7 @@ class StationManager(StationManagerBase):
 			machine = next(m for m in self._machines if m.machine_number == washing_machine_number)
 		except StopIteration:
 			raise ValidationError(f"Got an non-existing program step or washing machine number. Station ID {self._general.id}")
-		ctrl = self._control
+		ctrl = self._control.copy(deep=True)
 		ctrl.washing_agents = []
 		ctrl.washing_machine = machine
 		ctrl.program_step = program
@@ -174,28 +263,28 @@ class StationManager(StationManagerBase):
 		if machine.machine_number in ctrl.washing_machines_queue:
 			del ctrl.washing_machines_queue[machine.machine_number]
 		ctrl = schemas_stations.StationControlUpdate(**ctrl.dict())
-		await StationControl.update_relation_data(self._general, ctrl, self._db)
+		self._update_control(ctrl)
 
 	async def _start_maintenance(self) -> None:
 		if not self._control:
 			raise AttributeError("Control wasn't defined")
-		ctrl = self._control
+		ctrl = self._control.copy(deep=True)
 		ctrl.program_step = None
 		ctrl.washing_agents = []
 		ctrl.washing_machine = None
 		ctrl.status = StationStatusEnum.MAINTENANCE
 		ctrl = schemas_stations.StationControlUpdate(**ctrl.dict())
-		await StationControl.update_relation_data(self._general, ctrl, self._db)
+		self._update_control(ctrl)
 
 	async def _end_maintenance(self) -> None:
 		if not self._control:
 			raise AttributeError("Control wasn't defined")
-		ctrl = self._control
+		ctrl = self._control.copy(deep=True)
 		if ctrl.status != StationStatusEnum.MAINTENANCE:
 			raise ValidationError("Station isn't in maintenance now")
 		ctrl.status = StationStatusEnum.AWAITING
 		ctrl = schemas_stations.StationControlUpdate(**ctrl.dict())
-		await StationControl.update_relation_data(self._general, ctrl, self._db)
+		self._update_control(ctrl, expected_status=StationStatusEnum.MAINTENANCE)
 
 	async def turn_off(self) -> None:
 		await self._change_station_power("off")
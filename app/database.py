@@ -1,4 +1,5 @@
 from psycopg2 import connect
+from redis import asyncio as aioredis
 from sqlalchemy import create_engine
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
@@ -25,3 +26,6 @@ Base = declarative_base()
 sync_db = connect(
     **config.DB_PARAMS
 )
+
+# redis connection instance (connections pool is created lazily, on first command)
+redis_client = aioredis.from_url(config.REDIS_URL)
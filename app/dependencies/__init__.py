@@ -1,5 +1,6 @@
 from typing import AsyncGenerator
 
+from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -17,6 +18,30 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
 		yield session
 
 
+async def get_async_session_in_transaction(
+	session: AsyncSession = Depends(get_async_session)
+) -> AsyncGenerator[AsyncSession, None]:
+	"""
+	SA-сессия внутри одной внешней транзакции (для пакетной обработки).
+	Коммиты в моделях и CRUD фиксируют только savepoint'ы, а откат - откатывает до последнего из них.
+	Всю транзакцию нужно закоммитить явно (commit_transaction), иначе она откатится.
+	Движок БД берется из обычной сессии (get_async_session).
+	"""
+	async with session.bind.connect() as connection:
+		transaction = await connection.begin()
+		async with async_session_maker(bind=connection, join_transaction_mode="create_savepoint") as session:
+			session.info["transaction"] = transaction
+			yield session
+
+
+async def commit_transaction(session: AsyncSession) -> None:
+	"""
+	Коммит внешней транзакции сессии из get_async_session_in_transaction.
+	"""
+	await session.commit()
+	await session.info["transaction"].commit()
+
+
 async def get_sync_session():
 	"""
 	Синхронная сессия.
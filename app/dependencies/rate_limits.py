@@ -0,0 +1,37 @@
+import uuid
+from typing import Annotated
+
+from fastapi import Request, Body, Header, HTTPException, status
+
+import config
+from ..utils.rate_limit import RateLimiter, login_rate_limiter, station_logs_rate_limiter
+
+
+async def check_rate_limit(limiter: RateLimiter, key: str, limit: int, period: float) -> None:
+	"""
+	Если лимит запросов исчерпан - ошибка 429 (в заголовке Retry-After - через сколько секунд можно повторить).
+	"""
+	retry_after = await limiter.hit(key, limit, period)
+	if retry_after is not None:
+		raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many requests",
+							headers={"Retry-After": str(retry_after)})
+
+
+async def limit_login_rate(
+	request: Request,
+	email: Annotated[str, Body(embed=True, title="Email пользователя")]
+) -> None:
+	"""
+	Ограничение попыток входа по IP и email (до проверки пароля).
+	"""
+	client_ip = request.client.host if request.client else "unknown"
+	await check_rate_limit(login_rate_limiter, f"{client_ip}:{email.lower()}", *config.LOGIN_RATE_LIMIT)
+
+
+async def limit_station_logs_rate(
+	x_station_uuid: Annotated[uuid.UUID, Header()]
+) -> None:
+	"""
+	Ограничение частоты отправки логов станцией (до ее аутентификации и обращений к БД).
+	"""
+	await check_rate_limit(station_logs_rate_limiter, str(x_station_uuid), *config.STATION_LOGS_RATE_LIMIT)
@@ -14,6 +14,7 @@ from ..schemas.schemas_stations import StationGeneralParams, StationGeneralParam
 from ..static.enums import StationStatusEnum
 from ..utils.general import decrypt_data
 from ..utils.general import sa_object_to_dict
+from ..utils.cache import station_auth_cache
 
 
 async def get_current_station(
@@ -30,34 +31,45 @@ async def get_current_station(
 	Расшифровывает wifi данные (возвращаемая схема используется ТОЛЬКО станцией).
 
 	Если станция в режиме "MAINTENANCE", то все запросы от нее блокируются.
+
+	Проверенная станция и ее статус кэшируются (station_auth_cache), поэтому при повторных запросах
+	 к БД не обращаемся. Кэш сбрасывается во всех воркерах при любом изменении станции или ее контроля.
 	"""
-	station = await Station.authenticate_station(db=db, station_id=x_station_uuid)
-	if not station:
-		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect station UUID")
-	if station.created_at is None:
-		raise PermissionsError("Not released station")
-	if not station.is_active:
-		raise PermissionsError("Inactive station")
-	try:
-		station_control = await StationControl.get_relation_data(station, db)
-	except GettingDataError as e:
-		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
-	if station_control.status == StationStatusEnum.MAINTENANCE:
+	cached, generation = await station_auth_cache.get(x_station_uuid)
+	if cached is None:
+		station = await Station.authenticate_station(db=db, station_id=x_station_uuid)
+		if not station:
+			raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect station UUID")
+		if station.created_at is None:
+			raise PermissionsError("Not released station")
+		if not station.is_active:
+			raise PermissionsError("Inactive station")
+		try:
+			station_control = await StationControl.get_relation_data(station, db)
+		except GettingDataError as e:
+			raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+		wifi_data = decrypt_data(station.hashed_wifi_data)
+		station = StationGeneralParamsForStation(
+			**station.dict(),
+			wifi_name=wifi_data.get("login"),
+			wifi_password=wifi_data.get("password")
+		)
+		station_status = station_control.status
+		station_auth_cache.set(x_station_uuid, (station, station_status), generation)
+	else:
+		station, station_status = cached
+
+	if station_status == StationStatusEnum.MAINTENANCE:
 		if not x_station_maintenance_end:
 			raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-								detail=f"Station status: {station_control.status.name}")
-	elif station_control.status == StationStatusEnum.ERROR:
+								detail=f"Station status: {station_status.name}")
+	elif station_status == StationStatusEnum.ERROR:
 		if not x_station_error_end:
 			raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-								detail=f"Station status: {station_control.status.name}")
+								detail=f"Station status: {station_status.name}")
 
-	wifi_data = decrypt_data(station.hashed_wifi_data)
-
-	return StationGeneralParamsForStation(
-		**station.dict(),
-		wifi_name=wifi_data.get("login"),
-		wifi_password=wifi_data.get("password")
-	)
+	return station.copy()
 
 
 async def get_station_by_id(
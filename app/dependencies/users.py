@@ -8,6 +8,7 @@ from . import oauth2_scheme, get_async_session
 from ..exceptions import CredentialsException, PermissionsError
 from ..models.users import User
 from ..schemas import schemas_users, schemas_token
+from ..utils.cache import user_auth_cache
 from ..utils.general import decode_jwt
 
 
@@ -20,18 +21,29 @@ async def get_current_user(
 	Если токен не содержит email или не поддается декодированию, поднимается ошибка авторизации.
 	Если токен корректный, но нет пользователя с указанным email - тоже.
 	Эта функция в dependency, потому что будет по дефолту срабатывать при каждом запросе от пользователей.
+
+	Проверенные токены и пользователи кэшируются (user_auth_cache), поэтому при повторных запросах
+	 подпись токена не проверяется, а к БД не обращаемся. Кэш сбрасывается при любом изменении пользователя.
 	"""
-	try:
-		access_payload = decode_jwt(token)
-		email: str = access_payload.get("sub")  # sub is std jwt token data param
-		if email is None:
+	email = user_auth_cache.token_subject(token)
+	if email is None:
+		try:
+			access_payload = decode_jwt(token)
+			email: str = access_payload.get("sub")  # sub is std jwt token data param
+			if email is None:
+				raise CredentialsException()
+			token_data = schemas_token.TokenData(email=email)
+		except JWTError:
 			raise CredentialsException()
-		token_data = schemas_token.TokenData(email=email)
-	except JWTError:
-		raise CredentialsException()
-	user = await User.get_user_by_email(db=db, email=token_data.email)
+		email = token_data.email
+		if access_payload.get("exp") is not None:
+			user_auth_cache.remember_token(token, email, access_payload["exp"])
+	user, generation = await user_auth_cache.get(email)
 	if user is None:
-		raise CredentialsException()
+		user = await User.get_user_by_email(db=db, email=email)
+		if user is None:
+			raise CredentialsException()
+		await user_auth_cache.fill(user, generation)
 
 	return user
 
@@ -51,6 +51,14 @@ class UpdatingError(AppException):
 		super().__init__(message)
 
 
+class VersionConflictError(UpdatingError):
+	"""
+	Данные станции были изменены параллельно (не совпала версия записи).
+	"""
+	def __init__(self, message="Station data was changed concurrently"):
+		super().__init__(message)
+
+
 class CreatingError(AppException):
 	"""
 	Ошибка при создании данных станции.
@@ -1,3 +1,6 @@
+import asyncio
+from contextlib import suppress
+
 from fastapi import FastAPI, APIRouter, status, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
@@ -5,12 +8,14 @@ from loguru import logger
 
 import config
 from config import LOGGING_PARAMS, CUSTOM_EXCEPTIONS_OUTPUT_PARAMS
-from . import fastapi_cache_init, check_connections
+from . import fastapi_cache_init, check_connections, tasks
 from .routers import auth, users, stations, management, logs, relations
 from .static import app_description
 from .static.openapi import tags_metadata, main_responses
 from .static.typing import PathOperation
 from .middlewares import ProcessTimeLogMiddleware
+from .utils.logs_buffer import logs_buffer
+from .utils.events import station_events
 
 app = FastAPI(
 	title="LFS company server",
@@ -44,6 +49,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"]
 )
 
 
@@ -76,6 +82,10 @@ async def startup():
 	logger.info("Starting server...")
 	await check_connections()
 	await fastapi_cache_init()
+	if config.LOGS_WRITE_BEHIND:
+		await logs_buffer.start()
+	app.state.logs_stats_task = asyncio.create_task(tasks.refresh_logs_stats())
+	app.state.users_activity_task = asyncio.create_task(tasks.flush_users_activity_periodically())
 	logger.info("All connections are available. Server started successfully.")
 
 
@@ -85,6 +95,18 @@ async def shutdown():
 	Действия при отключении сервера.
 	"""
 	logger.info("Stopping server")
+	await logs_buffer.stop()
+	await station_events.stop()
+	if getattr(app.state, "logs_stats_task", None):
+		app.state.logs_stats_task.cancel()
+		with suppress(asyncio.CancelledError):
+			await app.state.logs_stats_task
+	if getattr(app.state, "users_activity_task", None):
+		# прерванная запись возвращает взятые записи в Redis - дожидаемся этого до финальной записи
+		app.state.users_activity_task.cancel()
+		with suppress(asyncio.CancelledError):
+			await app.state.users_activity_task
+		await tasks.flush_users_activity()
 
 
 @app.get("/docs")
@@ -8,12 +8,14 @@ from sqlalchemy import Column, Integer, String, ForeignKey, \
 	select, delete, TIMESTAMP, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import config
 import services
 from . import users as users_models
 from ..database import Base
 from ..schemas import schemas_token
 from ..schemas.schemas_users import User
 from ..utils.general import create_jwt_token, generate_refresh_token
+from ..utils.refresh_tokens import refresh_tokens_store
 
 
 # class RegistrationCode(Base):
@@ -160,6 +162,10 @@ from ..utils.general import create_jwt_token, generate_refresh_token
 class RefreshToken(Base):
 	"""
 	Таблица для хранения рефреш-токенов.
+
+	Если config.REFRESH_TOKENS_BACKEND = "redis", токены хранятся в Redis (app.utils.refresh_tokens),
+	 а таблица не используется (действующие токены из нее переносятся командой python manage.py
+	 migrate_refresh_tokens).
 	"""
 	__tablename__ = "refresh_token"
 
@@ -179,11 +185,15 @@ class RefreshToken(Base):
 		access_token = create_jwt_token(payload, datetime.timedelta(minutes=services.ACCESS_TOKEN_EXPIRE_MINUTES))
 
 		refresh_token = generate_refresh_token() + access_token[-6:]
-		refresh_expiring = datetime.datetime.now() + datetime.timedelta(days=services.REFRESH_TOKEN_EXPIRE_DAYS)
+		refresh_lifetime = datetime.timedelta(days=services.REFRESH_TOKEN_EXPIRE_DAYS)
+		refresh_expiring = datetime.datetime.now() + refresh_lifetime
 
-		db_obj = RefreshToken(user_id=user.id, data=refresh_token, expires_at=refresh_expiring)
-		await session.merge(db_obj)
-		await session.commit()
+		if config.REFRESH_TOKENS_BACKEND == "redis":
+			await refresh_tokens_store.save(user.id, refresh_token, refresh_lifetime.total_seconds())
+		else:
+			db_obj = RefreshToken(user_id=user.id, data=refresh_token, expires_at=refresh_expiring)
+			await session.merge(db_obj)
+			await session.commit()
 
 		return schemas_token.Token(access_token=access_token, token_type="Bearer"), \
 			schemas_token.RefreshToken(
@@ -201,6 +211,12 @@ class RefreshToken(Base):
 		except IndexError:
 			return
 
+		if config.REFRESH_TOKENS_BACKEND == "redis":
+			user_id = await refresh_tokens_store.get_user_id(token)
+			if user_id is not None:
+				return await users_models.User.get_user_by_id(session, user_id)
+			return
+
 		result = (await session.execute(
 			select(RefreshToken).where(RefreshToken.data == token)
 		)).scalar()
@@ -217,7 +233,26 @@ class RefreshToken(Base):
 		"""
 		Удаляет рефреш-токен из БД при логауте.
 		"""
+		if config.REFRESH_TOKENS_BACKEND == "redis":
+			await refresh_tokens_store.revoke(user.id)
+			return
 		await session.execute(
 			delete(RefreshToken).where(RefreshToken.user_id == user.id)
 		)
 		await session.commit()
+
+	@staticmethod
+	async def migrate_to_redis(session: AsyncSession) -> int:
+		"""
+		Перенос действующих рефреш-токенов из таблицы в Redis (с оставшимся сроком жизни) и очистка таблицы.
+		:return: количество перенесенных токенов
+		"""
+		now = datetime.datetime.now(datetime.timezone.utc)
+		tokens = (await session.execute(
+			select(RefreshToken.user_id, RefreshToken.data, RefreshToken.expires_at).where(RefreshToken.expires_at > now)
+		)).all()
+		for user_id, token, expires_at in tokens:
+			await refresh_tokens_store.save(user_id, token, (expires_at - now).total_seconds())
+		await session.execute(delete(RefreshToken))
+		await session.commit()
+		return len(tokens)
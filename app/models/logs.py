@@ -1,7 +1,17 @@
-from sqlalchemy import Column, Integer, Float, String, UUID, ForeignKey, Enum, TIMESTAMP, func
+import datetime
+import uuid
+from typing import Iterable
 
+from sqlalchemy import Column, Integer, Float, String, UUID, ForeignKey, Enum, TIMESTAMP, func, select, \
+	Index, DDL, event, delete, literal, null
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import services
+from .stations import Station
 from ..database import Base
-from ..static.enums import LogFromEnum, ErrorTypeEnum, LogActionEnum
+from ..static import sql_queries
+from ..static.enums import LogFromEnum, ErrorTypeEnum, LogActionEnum, LogTypeEnum
 
 
 class Log(Base):
@@ -9,14 +19,15 @@ class Log(Base):
 	Логирование событий станцией/сервером.
 	"""
 	__tablename__ = "logs"
+	__table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
 
-	id = Column(Integer, primary_key=True)
+	id = Column(Integer, primary_key=True, autoincrement=True)
 	station_id = Column(UUID(as_uuid=True), ForeignKey("station.id", ondelete="CASCADE", onupdate="CASCADE"))
 	code = Column(Float, nullable=False)
 	event = Column(String, nullable=False)
 	content = Column(String, nullable=False)
 	sended_from = Column(Enum(LogFromEnum), nullable=False)
-	timestamp = Column(TIMESTAMP(timezone=True), server_default=func.now())
+	timestamp = Column(TIMESTAMP(timezone=True), server_default=func.now(), primary_key=True)
 	action = Column(Enum(LogActionEnum), nullable=True)
 
 
@@ -25,14 +36,221 @@ class Error(Base):
 	Логирование ошибок станцией/сервером.
 	"""
 	__tablename__ = "errors"
+	__table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
 
-	id = Column(Integer, primary_key=True)
+	id = Column(Integer, primary_key=True, autoincrement=True)
 	station_id = Column(UUID(as_uuid=True), ForeignKey("station.id", ondelete="CASCADE", onupdate="CASCADE"))
 	code = Column(Float, nullable=False)
 	event = Column(String, nullable=False)
 	content = Column(String, nullable=False)
 	sended_from = Column(Enum(LogFromEnum), nullable=False)
-	timestamp = Column(TIMESTAMP(timezone=True), server_default=func.now())
+	timestamp = Column(TIMESTAMP(timezone=True), server_default=func.now(), primary_key=True)
 	action = Column(Enum(LogActionEnum), nullable=True)
 	scope = Column(Enum(ErrorTypeEnum), nullable=False)
 
+
+PARTITIONED_MODELS = (Log, Error)
+
+# Логи и ошибки секционированы по месяцам (по времени создания).
+# Партиции создаются заранее (create_monthly_partitions, python manage.py create_partitions);
+#  то, что не попало ни в одну из них, пишется в DEFAULT-партицию ({table}_default).
+for partitioned_model in PARTITIONED_MODELS:
+	Index(f"ix_{partitioned_model.__tablename__}_station_id_timestamp",
+		  partitioned_model.station_id, partitioned_model.timestamp.desc())
+	Index(f"ix_{partitioned_model.__tablename__}_station_id_code_timestamp",
+		  partitioned_model.station_id, partitioned_model.code, partitioned_model.timestamp.desc())
+	event.listen(
+		partitioned_model.__table__, "after_create",
+		DDL(sql_queries.CREATE_DEFAULT_PARTITION.format(table=partitioned_model.__tablename__))
+	)
+	for query in (sql_queries.CREATE_STATS_CHANGED_HOURS_FUNCTION, sql_queries.CREATE_STATS_CHANGED_HOURS_TRIGGER):
+		event.listen(partitioned_model.__table__, "after_create",
+					 DDL(query.format(table=partitioned_model.__tablename__)))
+
+
+async def create_monthly_partitions(db: AsyncSession, months: int,
+									since: datetime.date | None = None) -> list[str]:
+	"""
+	Создание месячных партиций логов и ошибок: months месяцев начиная с месяца since (по умолчанию - текущего).
+	Существующие партиции пропускаются. Строки за месяц новой партиции, попавшие в DEFAULT-партицию,
+	 переносятся в нее.
+	:return: названия созданных партиций
+	"""
+	month = (since or datetime.datetime.now(datetime.timezone.utc).date()).replace(day=1)
+	created = []
+	for _ in range(months):
+		next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+		for model in PARTITIONED_MODELS:
+			table = model.__tablename__
+			partition = f"{table}_y{month.year}m{month.month:02d}"
+			if await db.scalar(select(func.to_regclass(partition))):
+				continue
+			params = dict(table=table, partition=partition,
+						  start=f"{month.isoformat()} 00:00:00+00", end=f"{next_month.isoformat()} 00:00:00+00")
+			connection = await db.connection()
+			for query in sql_queries.CREATE_MONTHLY_PARTITION:
+				await connection.exec_driver_sql(query.format(**params))
+			created.append(partition)
+		month = next_month
+	await db.commit()
+	return created
+
+
+class StationActivity(Base):
+	"""
+	Сводка активности станции: время последней работы/обслуживания/ошибки.
+	Обновляется при добавлении логов и ошибок (в той же транзакции), чтобы не сканировать логи при
+	 получении списка станций.
+
+	Количество ошибок за последние services.STATION_ACTIVITY_ERRORS_PERIOD в сводке не хранится (счетчик
+	 не может "скользить" вместе с периодом) - оно считается по таблице ошибок (см. recent_errors_count).
+	"""
+	__tablename__ = "station_activity"
+
+	LOG_ACTIONS_FIELDS = {LogActionEnum.STATION_WORKING_PROCESS: "last_work_at",
+						  LogActionEnum.STATION_MAINTENANCE_END: "last_maintenance_at"}
+
+	station_id = Column(UUID(as_uuid=True), ForeignKey("station.id", ondelete="CASCADE", onupdate="CASCADE"),
+						primary_key=True)
+	last_work_at = Column(TIMESTAMP(timezone=True))
+	last_maintenance_at = Column(TIMESTAMP(timezone=True))
+	last_error_at = Column(TIMESTAMP(timezone=True))
+
+	@classmethod
+	async def register(cls, db: AsyncSession, station_id: uuid.UUID, actions: Iterable[LogActionEnum | None],
+					   errors_amount: int = 0) -> None:
+		"""
+		Обновление сводки при добавлении логов/ошибок (действия добавленных логов и количество ошибок).
+		Коммит не делается - изменения сохраняются вместе с самими логами.
+		"""
+		values = {}
+		for action in actions:
+			field = cls.LOG_ACTIONS_FIELDS.get(action)
+			if field:
+				values[field] = func.now()
+		if errors_amount:
+			values.update(last_error_at=func.now())
+		if not values:
+			return
+
+		query = insert(cls).values(station_id=station_id, **values)
+		updated_values = {key: query.excluded[key] for key in values}
+		await db.execute(query.on_conflict_do_update(index_elements=[cls.station_id], set_=updated_values))
+
+	@staticmethod
+	def recent_errors_count(station_id):
+		"""
+		Количество ошибок станции за последние services.STATION_ACTIVITY_ERRORS_PERIOD (подзапрос;
+		 station_id - ИД или колонка с ним). Считается по индексу ошибок (станция, время).
+		"""
+		return select(func.count()).where(
+			(Error.station_id == station_id) & (Error.timestamp > func.now() - services.STATION_ACTIVITY_ERRORS_PERIOD)
+		).scalar_subquery()
+
+	@classmethod
+	async def rebuild(cls, db: AsyncSession, station_id: uuid.UUID | None = None) -> None:
+		"""
+		Пересборка сводки по истории логов и ошибок (для всех станций или одной).
+		"""
+		def last_log_at(action: LogActionEnum):
+			return select(func.max(Log.timestamp)).where(
+				(Log.station_id == Station.id) & (Log.action == action)
+			).scalar_subquery()
+
+		activity = select(
+			Station.id,
+			*(last_log_at(action) for action in cls.LOG_ACTIONS_FIELDS),
+			select(func.max(Error.timestamp)).where(Error.station_id == Station.id).scalar_subquery()
+		)
+		if station_id:
+			activity = activity.where(Station.id == station_id)
+
+		fields = ["station_id", *cls.LOG_ACTIONS_FIELDS.values(), "last_error_at"]
+		query = insert(cls).from_select(fields, activity)
+		query = query.on_conflict_do_update(
+			index_elements=[cls.station_id], set_={field: query.excluded[field] for field in fields[1:]}
+		)
+		await db.execute(query)
+		await db.commit()
+
+
+def utc_trunc(precision: str, column):
+	"""
+	date_trunc по UTC (независимо от часового пояса сессии БД).
+	"""
+	return func.timezone("UTC", func.date_trunc(precision, func.timezone("UTC", column)))
+
+
+class LogsStatsChangedHour(Base):
+	"""
+	Часы, за которые добавлены логи/ошибки с прошлого пересчета статистики (LogsHourlyStats.refresh).
+	Заполняется триггером на добавление логов и ошибок (в той же транзакции, что и сами логи).
+	"""
+	__tablename__ = "logs_stats_changed_hours"
+
+	id = Column(Integer, primary_key=True)
+	hour = Column(TIMESTAMP(timezone=True), nullable=False)
+
+
+class LogsHourlyStats(Base):
+	"""
+	Почасовая статистика логов и ошибок (количество по станции, коду, действию и типу ошибок).
+	Пересчитывается периодически фоновой задачей (refresh), чтобы отчеты не сканировали сами логи.
+	Логи старше срока хранения удаляются, а статистика по ним остается.
+	"""
+	__tablename__ = "logs_hourly_stats"
+	__table_args__ = (Index("ix_logs_hourly_stats_hour_station_id", "hour", "station_id"),)
+
+	ADVISORY_LOCK_KEY = 4_242_001  # pg advisory lock: пересчет одновременно выполняет только один процесс
+
+	id = Column(Integer, primary_key=True)
+	hour = Column(TIMESTAMP(timezone=True), nullable=False)
+	station_id = Column(UUID(as_uuid=True), ForeignKey("station.id", ondelete="CASCADE", onupdate="CASCADE"),
+						nullable=False)
+	log_type = Column(Enum(LogTypeEnum), nullable=False)
+	code = Column(Float, nullable=False)
+	action = Column(Enum(LogActionEnum), nullable=True)
+	scope = Column(Enum(ErrorTypeEnum), nullable=True)
+	count = Column(Integer, nullable=False)
+
+	@classmethod
+	async def refresh(cls, db: AsyncSession) -> bool:
+		"""
+		Пересчет статистики за часы, в которые с прошлого пересчета добавлены логи (LogsStatsChangedHour),
+		 при первом запуске - по всей истории.
+		Часы отмечаются в транзакции добавления логов, поэтому учитываются и логи, закоммиченные позже
+		 более новых (отложенная запись, долгие транзакции), - сколько бы времени ни прошло.
+		Если пересчет уже выполняется другим процессом - ничего не делает и возвращает False.
+		"""
+		if not await db.scalar(select(func.pg_try_advisory_xact_lock(cls.ADVISORY_LOCK_KEY))):
+			await db.rollback()
+			return False
+		changed_hours = sorted(set((await db.scalars(
+			delete(LogsStatsChangedHour).returning(LogsStatsChangedHour.hour)
+		)).all()))
+		full = await db.scalar(select(cls.id).limit(1)) is None
+		if not full:
+			if not changed_hours:
+				await db.commit()
+				return True
+			await db.execute(delete(cls).where(cls.hour.in_(changed_hours)))
+
+		fields = ["hour", "station_id", "log_type", "code", "action", "scope", "count"]
+		for model, log_type in ((Log, LogTypeEnum.LOG), (Error, LogTypeEnum.ERROR)):
+			hour = utc_trunc("hour", model.timestamp)
+			grouping = [hour, model.station_id, model.code, model.action]
+			if model is Error:
+				grouping.append(model.scope)
+			rows = select(
+				hour, model.station_id, literal(log_type, cls.log_type.type), model.code, model.action,
+				model.scope if model is Error else null(), func.count()
+			).where(model.station_id.is_not(None)).group_by(*grouping)
+			if not full:  # границы периода - для отсечения партиций
+				rows = rows.where(
+					(model.timestamp >= changed_hours[0]) &
+					(model.timestamp < changed_hours[-1] + datetime.timedelta(hours=1)) &
+					hour.in_(changed_hours)
+				)
+			await db.execute(insert(cls).from_select(fields, rows))
+		await db.commit()
+		return True
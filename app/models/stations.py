@@ -2,11 +2,12 @@ from __future__ import annotations
 
 import datetime
 import uuid
-from typing import Optional
+from typing import Optional, Any
 
 from fastapi.encoders import jsonable_encoder
 from sqlalchemy import Enum, Column, Integer, String, Boolean, ForeignKey, \
-	UUID, JSON, func, insert, select, PrimaryKeyConstraint, update, TIMESTAMP, Row
+	UUID, JSON, func, insert, select, PrimaryKeyConstraint, update, TIMESTAMP
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import error_wrappers
 
@@ -14,12 +15,13 @@ import config
 import services
 from .washing import WashingAgent, WashingMachine, WashingMixin
 from ..database import Base
-from ..exceptions import GettingDataError, UpdatingError, CreatingError
+from ..exceptions import GettingDataError, UpdatingError, CreatingError, VersionConflictError
 from ..schemas import schemas_stations, schemas_washing, schemas_users
 from ..schemas.schemas_washing import WashingMachineCreate, WashingAgentCreate, \
 	WashingAgentCreateMixedInfo, WashingMachineCreateMixedInfo
-from ..static.enums import StationStatusEnum, RegionEnum, RoleEnum
+from ..static.enums import StationStatusEnum, RegionEnum, RoleEnum, StationParamsEnum, CacheTagEnum
 from ..static.typing import StationParamsSet
+from ..utils.cache import station_auth_cache, station_data_cache, invalidate_cache
 from ..utils.general import sa_object_to_dict, sa_objects_dicts_list
 from ..utils.google_sheets import get_sheet_data
 
@@ -54,26 +56,71 @@ class Station(Base):
 	comment = Column(String)
 
 	@staticmethod
-	async def relations(db: AsyncSession, station: schemas_stations.StationGeneralParams) -> \
-		list[StationSettings, StationControl]:
+	async def relations(db: AsyncSession, station: schemas_stations.StationGeneralParams, required: bool = True) -> \
+		tuple[schemas_stations.StationSettings, schemas_stations.StationControl,
+			  list[schemas_stations.StationProgram], list[schemas_washing.WashingMachineBase],
+			  list[schemas_washing.WashingAgentBase]]:
 		"""
-		Объединил сбор данных по станции.
+		Собирает все данные по станции из побочных таблиц ОДНИМ запросом.
+
+		Настройки и контроль объединяются джойном, а программы, машины и средства агрегируются в JSON
+		 коррелированными подзапросами (json_agg по строкам таблицы).
+		Если нет настроек или контроля - GettingDataError (программ может не быть).
+		Если нет машин или средств - GettingDataError при required=True, иначе - пустые списки.
+		Если все наборы есть в кэше (station_data_cache) - БД не запрашивается.
 		"""
-		relations = (await db.execute(
-			select(StationSettings, StationControl).join_from(
-				StationSettings, StationControl, StationSettings.station_id == StationControl.station_id
-			).where(StationSettings.station_id == station.id)
-		)).all()
-		objs = []
-		for entry in relations:
-			entry: Row
-			for j in entry:
-				objs.append(j)
+		datasets = (StationParamsEnum.SETTINGS, StationParamsEnum.CONTROL, StationParamsEnum.PROGRAMS,
+					StationParamsEnum.WASHING_MACHINES, StationParamsEnum.WASHING_AGENTS)
+		cached, tag = await station_data_cache.get(db, station.id, *datasets)
+		if all(data is not None for data in cached):
+			settings, control, programs, washing_machines, washing_agents = cached
+		else:
+			settings, control, programs, washing_machines, washing_agents = await Station._query_relations(
+				db, station, tag, datasets
+			)
+		if required and (not washing_machines or not washing_agents):
+			raise GettingDataError(f"Getting washing objects for station {station.id} error.\nDB data not found")
+
+		return (
+			schemas_stations.StationSettings(**settings),
+			schemas_stations.StationControl(**control),
+			[schemas_stations.StationProgram(**program) for program in programs],
+			[schemas_washing.WashingMachineBase(**machine) for machine in washing_machines],
+			[schemas_washing.WashingAgentBase(**agent) for agent in washing_agents]
+		)
 
-		if len(objs) != 2:
-			raise GettingDataError()
+	@staticmethod
+	async def _query_relations(db: AsyncSession, station: schemas_stations.StationGeneralParams, tag: str | None,
+							   datasets: tuple[StationParamsEnum, ...]) -> tuple[dict, dict, list, list, list]:
+		"""
+		Запрос данных станции из БД (см. Station.relations) и заполнение кэша.
+		Нет машин или средств - пустые списки (они тоже кэшируются).
+		"""
 
-		return objs
+		def aggregate(model, order_by: str):
+			# алиас обязателен: имя таблицы washing_machine совпадает с колонкой station_control
+			table = model.__table__.alias()
+			return select(
+				func.json_agg(aggregate_order_by(table.table_valued(), table.c[order_by]), type_=JSON)
+			).where(table.c.station_id == StationSettings.station_id).scalar_subquery()
+
+		query = select(
+			StationSettings, StationControl,
+			aggregate(StationProgram, "program_step"),
+			aggregate(WashingMachine, "machine_number"),
+			aggregate(WashingAgent, "agent_number")
+		).join_from(
+			StationSettings, StationControl, StationSettings.station_id == StationControl.station_id
+		).where(StationSettings.station_id == station.id)
+
+		row = (await db.execute(query)).first()
+		if row is None:
+			raise GettingDataError(f"Getting relations for station {station.id} error.\nDB data not found")
+		settings, control, programs, washing_machines, washing_agents = row
+		settings, control = sa_object_to_dict(settings), sa_object_to_dict(control)
+		data = (settings, control, programs or [], washing_machines or [], washing_agents or [])
+		await station_data_cache.fill(db, station.id, tag, dict(zip(datasets, data)))
+		return data
 
 	@staticmethod
 	async def get_station_by_id(db: AsyncSession,
@@ -191,7 +238,10 @@ class Station(Base):
 
 	@classmethod
 	async def update(cls, db: AsyncSession, station_id: uuid.UUID,
-					 updated_params: schemas_stations.StationGeneralParamsUpdate | dict) -> None:
+					 updated_params: schemas_stations.StationGeneralParamsUpdate | dict, commit: bool = True) -> None:
+		"""
+		Если commit=False - коммит (и сброс кэшей станции) делается вне функции.
+		"""
 		try:
 			data = updated_params.dict(exclude_unset=True)
 		except AttributeError:
@@ -201,7 +251,10 @@ class Station(Base):
 		).values(**data)
 
 		await db.execute(query)
-		await db.commit()
+		if commit:
+			await db.commit()
+			await station_auth_cache.invalidate(station_id)
+			await invalidate_cache(CacheTagEnum.STATIONS)
 
 	@staticmethod
 	def check_user_permissions(user: schemas_users.User,
@@ -211,38 +264,42 @@ class Station(Base):
 
 
 class StationMixin:
+	DATASET: StationParamsEnum
 	station_id: uuid.UUID
 
 	@classmethod
 	async def get_relation_data(cls, station: schemas_stations.StationGeneralParams | uuid.UUID,
 								db: AsyncSession) -> StationParamsSet:
 		"""
-		Поиск записей по станции в побочных таблицах.
+		Поиск записей по станции в побочных таблицах (сначала - в кэше station_data_cache).
 		"""
 		station_id = station.id if isinstance(station, schemas_stations.StationGeneralParams) else station
-		query = select(cls).where(cls.station_id == station_id)
-		result = await db.execute(query)
+		(data,), tag = await station_data_cache.get(db, station_id, cls.DATASET)
+		if data is None:
+			query = select(cls).where(cls.station_id == station_id)
+			if cls.__name__ == "StationProgram":
+				query = query.order_by(cls.program_step)  # как в Station.relations
+			result = await db.execute(query)
+			match cls.__name__:
+				case "StationProgram":
+					data = sa_objects_dicts_list(result.scalars().all())
+				case "StationControl" | "StationSettings":
+					row = result.scalar()
+					if row is None:
+						raise GettingDataError(f"Getting {cls.__name__} for station {station_id} error.\n"
+											   f"DB data not found")
+					data = sa_object_to_dict(row)
+			await station_data_cache.fill(db, station_id, tag, {cls.DATASET: data})
 
+		schema = getattr(schemas_stations, cls.__name__)
 		match cls.__name__:
 			case "StationProgram":
-				data = result.scalars().all()
-				station_programs = sa_objects_dicts_list(data)
-				schema = schemas_stations.StationProgram
 				return [
-					schema(**item) for item in station_programs
+					schema(**item) for item in data
 				]
-
 			case "StationControl" | "StationSettings":
-				schema = getattr(
-					schemas_stations,
-					cls.__name__
-				)
-				data = result.scalar()
-				if data is None:
-					raise GettingDataError(f"Getting {cls.__name__} for station {station.id} error.\n"
-										   f"DB data not found")
 				return schema(
-					**sa_object_to_dict(data)
+					**data
 				)
 
 	@classmethod
@@ -254,6 +311,9 @@ class StationMixin:
 	) -> schemas_stations.StationSettings | schemas_stations.StationProgram:
 		"""
 		Обновление данных по станции в побочных таблицах.
+		Настройки можно обновить при условии, что их версия не изменилась (kwargs expected_version),
+		 иначе - VersionConflictError.
+		Новые настройки записываются в кэш (station_data_cache), программы в нем сбрасываются.
 		"""
 		match cls.__name__:
 			case "StationSettings":
@@ -285,17 +345,49 @@ class StationMixin:
 					(cls.program_step == current_program_number)
 					).values(**updated_params_dict)
 			case "StationSettings":
+				cache_tag = await station_data_cache.tag(db, station.id)
 				query = update(cls).where(
 					cls.station_id == station.id
-				).values(**updated_params_dict)
+				).values(**updated_params_dict, version=cls.version + 1).returning(cls.version, cls.updated_at)
+				expected_version: int | None = kwargs.get("expected_version")
+				if expected_version is not None:
+					query = query.where(cls.version == expected_version)
 
-		await db.execute(query)
+		result = await db.execute(query)
+		if cls.__name__ == "StationSettings":
+			row = result.first()
+			if row is None:
+				raise VersionConflictError(f"Station {station.id} settings version isn't {expected_version}")
+			updated_params_dict["version"] = row.version
 		await db.commit()
+		if cls.__name__ == "StationSettings":
+			await station_data_cache.set(db, station.id, cache_tag,
+										 {cls.DATASET: dict(updated_params_dict, updated_at=row.updated_at)})
+		else:
+			await station_data_cache.invalidate(station.id, cls.DATASET)
 
 		schema = getattr(schemas_stations, cls.__name__)
 
 		return schema(**updated_params_dict)
 
+	@classmethod
+	async def update_fields(cls, station_id: uuid.UUID, values: dict[str, Any], db: AsyncSession,
+							expected_version: int | None = None) -> int | None:
+		"""
+		Обновление отдельных полей записи станции в побочной таблице (значения записываются как есть, без проверок).
+		Если передана expected_version - запись обновляется, только если ее версия не изменилась
+		 (иначе - VersionConflictError).
+		БЕЗ коммита (нужно сделать его вне функции).
+		:return: новая версия записи
+		"""
+		query = update(cls).where(cls.station_id == station_id).values(**values, version=cls.version + 1)
+		if expected_version is not None:
+			query = query.where(cls.version == expected_version)
+		version = await db.scalar(query.returning(cls.version))
+		if version is None:
+			raise VersionConflictError(f"Station {station_id} {cls.__tablename__} version isn't {expected_version}")
+		return version
+
 
 class StationSettings(Base, StationMixin):
 	"""
@@ -304,8 +396,10 @@ class StationSettings(Base, StationMixin):
 	Station_power- вкл/выкл.
 	Teh_power - вкл/выкл ТЭНа.
 	Updated_at - дата и время последнего обновления.
+	Version - версия записи (увеличивается при каждом изменении, для обнаружения параллельных изменений).
 	"""
 	FIELDS = ["station_power", "teh_power"]
+	DATASET = StationParamsEnum.SETTINGS
 
 	__tablename__ = "station_settings"
 
@@ -314,6 +408,7 @@ class StationSettings(Base, StationMixin):
 	station_power = Column(Boolean, default=services.DEFAULT_STATION_POWER)
 	teh_power = Column(Boolean, default=services.DEFAULT_STATION_TEH_POWER)
 	updated_at = Column(TIMESTAMP(timezone=True), onupdate=func.now())
+	version = Column(Integer, nullable=False, default=1, server_default="1")
 
 	@classmethod
 	async def create(cls, db: AsyncSession, station_id: uuid.UUID, **kwargs) -> schemas_stations.StationSettingsCreate:
@@ -344,6 +439,8 @@ class StationProgram(Base, StationMixin):
 	Washing_agents - объекты стиральных средств.
 	Updated_at - дата и время последнего обновления.
 	"""
+	DATASET = StationParamsEnum.PROGRAMS
+
 	__tablename__ = "station_program"
 	__table_args__ = (
 		PrimaryKeyConstraint("station_id", "program_step"),
@@ -443,7 +540,10 @@ class StationControl(Base, StationMixin):
 	Washing_agents - стиральные средства станции.
 	Washing_machines_queue - ни на что не влияющий параметр. Получается от станции.
 	Updated_at - дата и время последнего обновления.
+	Version - версия записи (увеличивается при каждом изменении, для обнаружения параллельных изменений).
 	"""
+	DATASET = StationParamsEnum.CONTROL
+
 	__tablename__ = "station_control"
 
 	station_id = Column(UUID(as_uuid=True), ForeignKey("station.id", onupdate="CASCADE",
@@ -454,6 +554,7 @@ class StationControl(Base, StationMixin):
 	washing_agents = Column(JSON, default=[])
 	washing_machines_queue = Column(JSON, default=[])
 	updated_at = Column(TIMESTAMP(timezone=True), onupdate=func.now())
+	version = Column(Integer, nullable=False, default=1, server_default="1")
 
 	@staticmethod
 	async def create(db: AsyncSession, station_id: uuid.UUID, **kwargs) -> schemas_stations.StationControl:
@@ -474,6 +575,73 @@ class StationControl(Base, StationMixin):
 			status=kwargs["status"] if "status" in kwargs else services.DEFAULT_STATION_STATUS,
 		)
 
+	@staticmethod
+	def requires_power(control: schemas_stations.StationControl) -> bool:
+		"""
+		Ненулевые параметры контроля можно установить только включенной станции.
+		"""
+		return any(
+			(any(control.washing_agents), control.program_step, control.washing_machine, control.status)
+		)
+
+	@staticmethod
+	def encode_values(values: dict[str, Any]) -> dict[str, Any]:
+		"""
+		Значения для записи в JSON-колонки контроля.
+		"""
+		for k, v in values.items():
+			match k:
+				case "program_step" | "washing_machine":
+					values[k] = jsonable_encoder(v)
+				case "washing_agents":
+					values[k] = [jsonable_encoder(ag) for ag in v]
+		return values
+
+	@classmethod
+	async def transition(cls, station_id: uuid.UUID, values: dict[str, Any], db: AsyncSession,
+						 power_required: bool = False, expected_status: StationStatusEnum | None = None,
+						 expected_version: int | None = None) -> schemas_stations.StationControl:
+		"""
+		Переход состояния станции ОДНИМ запросом:
+		 UPDATE station_control SET ... FROM station_settings WHERE <условия> RETURNING station_control.*
+		Условия проверяются в самом UPDATE, поэтому между проверкой и записью состояние не изменится
+		 параллельным запросом:
+		 - power_required - станция должна быть включена;
+		 - expected_status - текущий статус станции должен быть именно таким;
+		 - expected_version - версия контроля не должна измениться с момента чтения (иначе - VersionConflictError).
+		Если условия не выполнены - UpdatingError (причина уточняется отдельным запросом).
+		Версия контроля увеличивается при каждом изменении.
+		БЕЗ коммита (нужно сделать его вне функции).
+		"""
+		control, settings = cls.__table__, StationSettings.__table__
+		query = update(control).where(control.c.station_id == station_id)
+		if power_required:
+			query = query.where(
+				(settings.c.station_id == control.c.station_id) & settings.c.station_power.is_not(False)
+			)
+		if expected_status is not None:
+			query = query.where(control.c.status == expected_status)
+		if expected_version is not None:
+			query = query.where(control.c.version == expected_version)
+		query = query.values(**values, version=control.c.version + 1).returning(*control.c)
+
+		ctrl = (await db.execute(query)).first()
+		if ctrl is None:
+			station_power, status, version = (await db.execute(
+				select(StationSettings.station_power, cls.status, cls.version).join_from(
+					cls, StationSettings, StationSettings.station_id == cls.station_id
+				).where(cls.station_id == station_id)
+			)).first() or (None, None, None)
+			if expected_version is not None and version != expected_version:
+				raise VersionConflictError(f"Station {station_id} control version isn't {expected_version}")
+			if power_required and station_power is False:
+				raise UpdatingError("Station power currently is False, but got non-nullable control params")
+			if expected_status is not None and status != expected_status:
+				raise UpdatingError(f"Station {station_id} status isn't {expected_status.name}")
+			raise UpdatingError(f"Station {station_id} control wasn't updated")
+
+		return schemas_stations.StationControl(**ctrl._mapping)
+
 	@classmethod
 	async def update_relation_data(cls,
 		station: schemas_stations.StationGeneralParams,
@@ -481,35 +649,22 @@ class StationControl(Base, StationMixin):
 		db: AsyncSession, **kwargs
 	) -> schemas_stations.StationControl:
 		"""
-		Переопределяю метод, ибо непонятная ошибка
+		Переопределяю метод, ибо непонятная ошибка.
+		Контроль перезаписывается целиком одним условным UPDATE (см. transition).
+		Если передана kwargs expected_version - только при условии, что версия контроля не изменилась.
+		Новый контроль записывается в кэш (station_data_cache).
 		"""
-		if any(
-			(any(updated_params.washing_agents), updated_params.program_step,
-			 updated_params.washing_machine, updated_params.status)
-		):
-			station_settings = await StationSettings.get_relation_data(station, db)
-			if station_settings.station_power is False:
-				raise UpdatingError("Station power currently is False, but got non-nullable control params")
-
-		ctrl: schemas_stations.StationControl = await cls.get_relation_data(station, db)
-
 		if not updated_params.updated_at:
 			updated_params.updated_at = datetime.datetime.now()
+		cache_tag = await station_data_cache.tag(db, station.id)
 
-		for k, v in updated_params.dict().items():
-			if getattr(ctrl, k) != v:
-				match k:
-					case "program_step" | "washing_machine":
-						setattr(ctrl, k, jsonable_encoder(v))
-					case "washing_agents":
-						setattr(ctrl, k, [jsonable_encoder(ag) for ag in v])
-					case _:
-						setattr(ctrl, k, v)
-
-		await db.execute(
-			update(StationControl).where(StationControl.station_id == station.id).
-			values(**ctrl.dict())
+		ctrl = await cls.transition(
+			station.id, cls.encode_values(updated_params.dict()), db,
+			power_required=cls.requires_power(updated_params), expected_version=kwargs.get("expected_version")
 		)
 		await db.commit()
+		await station_auth_cache.invalidate(station.id)
+		await station_data_cache.set(db, station.id, cache_tag, {cls.DATASET: dict(ctrl)})
+		await invalidate_cache(CacheTagEnum.STATIONS)
 
 		return ctrl
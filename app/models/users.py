@@ -1,14 +1,17 @@
 import datetime
 from typing import Optional, Any
 
-from sqlalchemy import Column, Integer, String, Boolean, select, Enum, update, TIMESTAMP, func
+from sqlalchemy import Column, Integer, String, Boolean, select, Enum, update, TIMESTAMP, func, values, column
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import services
 from ..database import Base
 from ..schemas import schemas_users
 from ..static.enums import RoleEnum, RegionEnum
-from ..utils.general import sa_object_to_dict, verify_data_hash
+from ..utils.general import sa_object_to_dict
+from ..utils.activity import users_activity
+from ..utils.cache import user_auth_cache
+from ..utils.hashing import data_hashing
 
 
 class User(Base):
@@ -38,15 +41,33 @@ class User(Base):
 		"""
 		При каждом действии пользователя обновляется колонка last_action_at.
 
-		ВОЗМОЖНО, можно как-то обновлять время без передачи конкретного времени.
-		Например, если установить onupdate=func.now() и просто вызвать запрос без
-		 аргументов для обновления. Потом мб попробую.
+		Время действия накапливается в Redis и записывается в БД пачками (см. bulk_update_last_action),
+		 чтобы строка пользователя не обновлялась при каждом запросе. Если Redis недоступен - обновляется сразу.
 		"""
+		if await users_activity.record(user.id):
+			return
 		query = update(User).where(
 			User.id == user.id
-		).values(last_action_at=datetime.datetime.now())
+		).values(last_action_at=datetime.datetime.now(datetime.timezone.utc))
+
+		await db.execute(query)
 
+	@staticmethod
+	async def bulk_update_last_action(db: AsyncSession, activity: dict[int, datetime.datetime]) -> None:
+		"""
+		Запись накопленного времени последних действий пользователей одним запросом
+		 (UPDATE ... FROM (VALUES ...)); более позднее время в БД не затирается.
+		"""
+		if not activity:
+			return
+		activity_values = values(
+			column("id", Integer), column("last_action_at", TIMESTAMP(timezone=True)), name="activity"
+		).data(list(activity.items()))
+		query = update(User).where(User.id == activity_values.c.id).values(
+			last_action_at=func.greatest(User.last_action_at, activity_values.c.last_action_at)
+		).execution_options(synchronize_session=False)
 		await db.execute(query)
+		await db.commit()
 
 	@staticmethod
 	def check_user_permissions(action_by_user: schemas_users.User, user: schemas_users.User) -> bool:
@@ -88,12 +109,19 @@ class User(Base):
 		Аутентификация пользователя: если пользователя с таким email не существует или
 		был введен неправильный пароль - возвращает False; иначе возвращает pydantic-модель пользователя
 		с хеш-паролем.
+		Если хеш пароля посчитан с устаревшими параметрами (config.PASSWORD_HASHING_ROUNDS), он пересчитывается.
 		"""
 		user = await User.get_user_by_email(db=db, email=email)
 		if not user:
 			return
-		if not verify_data_hash(password, user.hashed_password):
+		verified, new_hash = await data_hashing.verify_and_update(password, user.hashed_password)
+		if not verified:
 			return
+		if new_hash:
+			await db.execute(update(User).where(User.id == user.id).values(hashed_password=new_hash))
+			await db.commit()
+			await user_auth_cache.invalidate(user.email)
+			user.hashed_password = new_hash
 		return user
 
 	# @staticmethod
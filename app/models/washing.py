@@ -9,6 +9,8 @@ import services
 from ..database import Base
 from ..exceptions import GettingDataError, CreatingError
 from ..schemas import schemas_washing
+from ..static.enums import StationParamsEnum
+from ..utils.cache import station_data_cache
 from ..utils.general import sa_object_to_dict, sa_objects_dicts_list
 
 
@@ -18,6 +20,7 @@ class WashingMixin:
 		"WashingAgent": "agent_number"
 	}
 	FIELDS: list[str]
+	DATASET: StationParamsEnum
 
 	station_id: uuid.UUID
 
@@ -30,7 +33,8 @@ class WashingMixin:
 		Метод для создания нового объекта в БД для аналогичных классов
 		 (стиральная машина и стиральное средство). Возвращает pydantic-схему добавленного объекта.
 
-		Создает запись в БД БЕЗ КОММИТА, его нужно сделать вне метода.
+		Создает запись в БД БЕЗ КОММИТА, его нужно сделать вне метода
+		 (и после него сбросить объекты станции в кэше - station_data_cache.invalidate).
 
 		Если defaults = True, то не делается проверка на существование объекта (используется при создании
 		 станции).
@@ -83,23 +87,23 @@ class WashingMixin:
 		cls, station_id: uuid.UUID, db: AsyncSession
 	) -> list[schemas_washing.WashingMachine] | list[schemas_washing.WashingAgent]:
 		"""
-		Ищет все объекты, относящиеся к станции.
+		Ищет все объекты, относящиеся к станции (сначала - в кэше station_data_cache).
 		"""
-		query = select(cls).where(
-			cls.station_id == station_id  # хз, почему ошибка
-		)
-		result = await db.execute(query)
-		data = result.scalars().all()
-		if not any(data):
+		(data,), tag = await station_data_cache.get(db, station_id, cls.DATASET)
+		if data is None:
+			query = select(cls).where(
+				cls.station_id == station_id  # хз, почему ошибка
+			).order_by(getattr(cls, cls.NUMERIC_FIELDS[cls.__name__]))  # как в Station.relations
+			result = await db.execute(query)
+			data = sa_objects_dicts_list(result.scalars().all())
+			await station_data_cache.fill(db, station_id, tag, {cls.DATASET: data})
+		if not data:  # пустой список тоже кэшируется (Station.relations с required=False)
 			raise GettingDataError(f"Getting {cls.__name__} for station {station_id} error.\nDB data not found")
 
 		schema = getattr(schemas_washing, cls.__name__ + "Base")
 
 		return [
-			schema(**obj) for obj in
-			sa_objects_dicts_list(
-				data
-			)
+			schema(**obj) for obj in data
 		]
 
 	@classmethod
@@ -109,7 +113,7 @@ class WashingMixin:
 		obj_number: int
 	) -> schemas_washing.WashingMachine | schemas_washing.WashingAgent:
 		"""
-		Обновление объекта.
+		Обновление объекта (объекты станции в кэше сбрасываются).
 		"""
 		numeric_field = cls.NUMERIC_FIELDS[cls.__name__]
 		query = update(cls).where(
@@ -121,6 +125,7 @@ class WashingMixin:
 
 		await db.execute(query)
 		await db.commit()
+		await station_data_cache.invalidate(station_id, cls.DATASET)
 
 		schema = getattr(schemas_washing, cls.__name__)
 
@@ -133,7 +138,7 @@ class WashingMixin:
 		cls, station_id: uuid.UUID, db: AsyncSession, object_number: int
 	) -> None:
 		"""
-		Удаление объекта.
+		Удаление объекта (объекты станции в кэше сбрасываются).
 		"""
 		query = delete(cls).where(
 			(cls.station_id == station_id) &
@@ -142,6 +147,7 @@ class WashingMixin:
 
 		await db.execute(query)
 		await db.commit()
+		await station_data_cache.invalidate(station_id, cls.DATASET)
 
 
 class WashingMachine(Base, WashingMixin):
@@ -154,6 +160,7 @@ class WashingMachine(Base, WashingMixin):
 	Track_length - длина трассы (м).
 	"""
 	FIELDS = ["volume", "is_active", "track_length"]
+	DATASET = StationParamsEnum.WASHING_MACHINES
 
 	__tablename__ = "washing_machine"
 	__table_args__ = (
@@ -176,6 +183,7 @@ class WashingAgent(Base, WashingMixin):
 	Rollback - "откат" средства.
 	"""
 	FIELDS = ["volume", "rollback"]
+	DATASET = StationParamsEnum.WASHING_AGENTS
 
 	__tablename__ = "washing_agent"
 	__table_args__ = (
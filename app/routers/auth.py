@@ -7,6 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..dependencies import get_async_session
 from ..dependencies.users import get_current_user
+from ..dependencies.rate_limits import limit_login_rate
 from ..exceptions import CredentialsException
 from ..models.auth import RefreshToken
 from ..models.users import User
@@ -21,7 +22,7 @@ router = APIRouter(
 
 
 @router.post("/login", responses=openapi.login_post,
-			 response_model=schemas_token.RefreshToken)
+			 response_model=schemas_token.RefreshToken, dependencies=[Depends(limit_login_rate)])
 async def login(
 	email: Annotated[str, Body(title="Email пользователя")],
 	password: Annotated[str, Body(title="Пароль пользователя")],
@@ -31,6 +32,7 @@ async def login(
 	Проверка логина и пароля (хэша) пользователя при авторизации.
 	Если они верны, то создаются access_token и refresh_token (JWT token) и возвращаются.
 	Refresh - в body, access - в body.
+	Попытки входа ограничены (config.LOGIN_RATE_LIMIT) по IP и email - при превышении ошибка 429.
 	"""
 	user = await User.authenticate_user(
 		db=db, email=email, password=password
@@ -1,20 +1,29 @@
+import datetime
+import uuid
 from typing import Annotated
 
-from fastapi import APIRouter, status, Depends, Body, HTTPException, Query
+from fastapi import APIRouter, status, Depends, Body, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import config
 from ..static import openapi
 from ..dependencies.stations import get_current_station, get_station_by_id
-from ..dependencies import get_async_session
+from ..dependencies import get_async_session, get_async_session_in_transaction, commit_transaction
 from ..dependencies.users import get_current_active_user
+from ..dependencies.rate_limits import limit_station_logs_rate
 from ..schemas.schemas_stations import StationGeneralParams
-from ..schemas.schemas_logs import ErrorCreate, LogCreate, Log, Error
+from ..schemas.schemas_logs import ErrorCreate, LogCreate, Log, Error, LogBatchItem, LogBatchItemResult, LogsStats
 from ..schemas.schemas_users import User
 from ..crud.crud_logs import CRUDLog
-from ..static.enums import LogTypeEnum, ErrorTypeEnum, RoleEnum
-from ..exceptions import ValidationError, UpdatingError, PermissionsError
-from ..dependencies.roles import get_manager_user
+from ..models.stations import Station
+from ..static.enums import LogTypeEnum, ErrorTypeEnum, RoleEnum, RegionEnum, ExportFormatEnum, LogActionEnum, \
+	LogFromEnum, StatsBucketEnum, StatsGroupingEnum, CacheTagEnum
+from ..utils.cache import station_auth_cache, station_data_cache, invalidate_cache
+from ..utils.general import encode_logs_cursor, decode_logs_cursor
+from ..utils.locks import StationLock
+from ..exceptions import ValidationError, UpdatingError, PermissionsError, GettingDataError, AppException
+from ..dependencies.roles import get_manager_user, get_region_manager_user
 
 router = APIRouter(
 	prefix="/logs",
@@ -23,7 +32,7 @@ router = APIRouter(
 
 
 @router.post("/log", responses=openapi.create_log_post, status_code=status.HTTP_201_CREATED,
-			 response_model=Log)
+			 response_model=Log, dependencies=[Depends(limit_station_logs_rate)])
 async def create_log(
 	station: Annotated[StationGeneralParams, Depends(get_current_station)],
 	log: Annotated[LogCreate, Body(title="Параметры лога", embed=True)],
@@ -53,11 +62,13 @@ async def create_log(
 		raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
 	except UpdatingError as e:
 		raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+	except GettingDataError as e:  # у станции нет машин/средств, нужных действию
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 	return created_log
 
 
 @router.post("/error", responses=openapi.create_error_post, status_code=status.HTTP_201_CREATED,
-			 response_model=Error)
+			 response_model=Error, dependencies=[Depends(limit_station_logs_rate)])
 async def create_error(
 	station: Annotated[StationGeneralParams, Depends(get_current_station)],
 	error: Annotated[ErrorCreate, Body(title="Параметры ошибки", embed=True)],
@@ -87,26 +98,100 @@ async def create_error(
 		raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
 	except UpdatingError as e:
 		raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+	except GettingDataError as e:  # у станции нет машин/средств, нужных действию
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
 	return created_log
 
 
+@router.post("/batch", responses=openapi.create_logs_batch_post, response_model=list[LogBatchItemResult],
+			 dependencies=[Depends(limit_station_logs_rate)])
+async def create_logs_batch(
+	station: Annotated[StationGeneralParams, Depends(get_current_station)],
+	items: Annotated[list[LogBatchItem], Body(title="Логи и ошибки (по порядку)", embed=True, min_items=1,
+											   max_items=config.MAX_LOGS_BATCH_SIZE)],
+	db: Annotated[AsyncSession, Depends(get_async_session_in_transaction)]
+):
+	"""
+	Пакетное создание логов и ошибок станцией (в одной транзакции).
+	Каждый элемент - как тело запроса одиночного создания лога/ошибки, плюс тип (лог/ошибка).
+
+	Сначала проверяются все логи: если хоть один невалиден - ошибка 422, ничего не добавляется.
+	Затем логи добавляются и по порядку выполняются их действия.
+	Результат - для каждого лога по порядку: код (201 - добавлен, 409/422/404 - действие не выполнено,
+	 лог не добавлен) и добавленный лог либо описание ошибки.
+
+	Хедеры для прекращения статуса обслуживания/ошибки - как при одиночном создании лога.
+	Пакет обрабатывается под блокировкой станции (как действия одиночных логов).
+	"""
+	crud_logs = []
+	for idx, item in enumerate(items):
+		match item.type:
+			case LogTypeEnum.LOG:
+				log = LogCreate(**item.log.dict(exclude={"scope"}))
+			case LogTypeEnum.ERROR:
+				log = item.log
+		if not log.station_id:
+			log.station_id = station.id
+		try:
+			crud_logs.append(CRUDLog(log, log_type=item.type, **item.data))
+		except ValidationError as e:
+			raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Item {idx}: {e}")
+
+	try:
+		async with StationLock(station.id) as lock:
+			results = await CRUDLog.add_batch(crud_logs, station, db)
+			await lock.check()
+			await commit_transaction(db)
+		# изменения пакета видны другим только после коммита - до него кэши могли заполниться прежними данными
+		await station_auth_cache.invalidate(station.id)
+		await station_data_cache.invalidate(station.id)
+		await invalidate_cache(CacheTagEnum.STATIONS)
+	except UpdatingError as e:  # станция занята или блокировка истекла
+		raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+	errors_status_codes = {ValidationError: status.HTTP_422_UNPROCESSABLE_ENTITY,
+						   UpdatingError: status.HTTP_409_CONFLICT,
+						   GettingDataError: status.HTTP_404_NOT_FOUND}
+	return [
+		LogBatchItemResult(status_code=errors_status_codes.get(type(result), status.HTTP_409_CONFLICT),
+						   detail=str(result))
+		if isinstance(result, AppException) else
+		LogBatchItemResult(status_code=status.HTTP_201_CREATED, log=result)
+		for result in results
+	]
+
+
 @router.get("/log/station/{station_id}", response_model=list[Log], responses=openapi.get_station_logs_get)
 async def get_station_logs(
 	current_user: Annotated[User, Depends(get_current_active_user)],
 	station: Annotated[StationGeneralParams, Depends(get_station_by_id)],
 	db: Annotated[AsyncSession, Depends(get_async_session)],
+	response: Response,
 	limit: Annotated[int, Query(title="Количество записей", ge=1,
 								le=config.MAX_LOGS_GETTING_AMOUNT)] = config.STD_LOGS_GETTING_AMOUNT,
-	code: Annotated[int | float, Query(title="Код логов")] = None
+	code: Annotated[list[float], Query(title="Коды логов")] = None,
+	cursor: Annotated[str, Query(title="Курсор следующей страницы (хедер X-Next-Cursor)")] = None,
+	since: Annotated[datetime.datetime, Query(title="Начало периода")] = None,
+	until: Annotated[datetime.datetime, Query(title="Конец периода (не включительно)")] = None,
+	action: Annotated[LogActionEnum, Query(title="Совершенное действие")] = None,
+	sended_from: Annotated[LogFromEnum, Query(title="От станции/сервера")] = None
 ):
 	"""
-	Получение логов станции пользователем.
+	Получение логов станции пользователем (от новых к старым).
 	По умолчанию возвращаются только 100 записей.
 
+	Можно указать несколько кодов, период, действие и отправителя.
+	Если записей больше, чем limit, в хедере X-Next-Cursor возвращается курсор следующей страницы -
+	 его нужно передать в параметре cursor (с теми же фильтрами).
+
 	Доступно для пользователей с любой ролью.
 	"""
-	return await CRUDLog.get_station_logs(station, db, limit, code)
+	filters = dict(cursor=decode_cursor_param(cursor), since=since, until=until, action=action,
+				   sended_from=sended_from)
+	result = await CRUDLog.get_station_logs(station, db, limit, *(code or []), **filters)
+	set_next_cursor(response, result, limit)
+	return result
 
 
 @router.get("/error/station/{station_id}", response_model=list[Error], responses=openapi.get_station_errors_get)
@@ -114,18 +199,124 @@ async def get_station_errors(
 	current_user: Annotated[User, Depends(get_manager_user)],
 	station: Annotated[StationGeneralParams, Depends(get_station_by_id)],
 	db: Annotated[AsyncSession, Depends(get_async_session)],
+	response: Response,
 	scope: Annotated[ErrorTypeEnum, Query(title="Тип ошибок (видимость)")] = ErrorTypeEnum.PUBLIC,
 	limit: Annotated[int, Query(title="Количество записей", ge=1,
 								le=config.MAX_LOGS_GETTING_AMOUNT)] = config.STD_LOGS_GETTING_AMOUNT,
-	code: Annotated[int | float, Query(title="Код ошибок")] = None
+	code: Annotated[list[float], Query(title="Коды ошибок")] = None,
+	cursor: Annotated[str, Query(title="Курсор следующей страницы (хедер X-Next-Cursor)")] = None,
+	since: Annotated[datetime.datetime, Query(title="Начало периода")] = None,
+	until: Annotated[datetime.datetime, Query(title="Конец периода (не включительно)")] = None,
+	action: Annotated[LogActionEnum, Query(title="Совершенное действие")] = None,
+	sended_from: Annotated[LogFromEnum, Query(title="От станции/сервера")] = None
 ):
 	"""
-	Получение ошибок станции пользователем.
+	Получение ошибок станции пользователем (от новых к старым).
 	По умолчанию возвращаются только публичные ошибки.
 	Сисадмин может получить все ошибки (или отдельно служебные).
 
+	Фильтры и постраничное получение - как у логов станции.
+
 	Доступно для MANAGER-пользователей и выше.
 	"""
 	if scope != ErrorTypeEnum.PUBLIC and current_user.role != RoleEnum.SYSADMIN:
 		raise PermissionsError()
-	return await CRUDLog.get_station_errors(station, db, limit, scope, code)
+	filters = dict(cursor=decode_cursor_param(cursor), since=since, until=until, action=action,
+				   sended_from=sended_from)
+	result = await CRUDLog.get_station_errors(station, db, limit, scope, *(code or []), **filters)
+	set_next_cursor(response, result, limit)
+	return result
+
+
+@router.get("/stats", response_model=list[LogsStats], responses=openapi.get_logs_stats_get)
+async def get_logs_stats(
+	current_user: Annotated[User, Depends(get_region_manager_user)],
+	db: Annotated[AsyncSession, Depends(get_async_session)],
+	since: Annotated[datetime.datetime, Query(title="Начало периода")],
+	until: Annotated[datetime.datetime, Query(title="Конец периода (не включительно)")] = None,
+	log_type: Annotated[LogTypeEnum, Query(title="Логи/ошибки")] = LogTypeEnum.LOG,
+	bucket: Annotated[StatsBucketEnum, Query(title="Период группировки")] = StatsBucketEnum.DAY,
+	group_by: Annotated[list[StatsGroupingEnum], Query(title="Группировка")] = None,
+	station_id: Annotated[uuid.UUID, Query(title="ИД станции")] = None,
+	region: Annotated[RegionEnum, Query(title="Регион")] = None,
+	scope: Annotated[ErrorTypeEnum, Query(title="Тип ошибок (видимость)")] = ErrorTypeEnum.PUBLIC
+):
+	"""
+	Количество логов или ошибок по периодам (час/день/неделя/месяц, UTC) с группировкой по коду, действию,
+	 региону и/или станции (например, рабочие циклы по дням или ошибки по часам).
+	Считается по почасовой статистике, которая обновляется раз в несколько минут.
+
+	По умолчанию считаются только публичные ошибки, сисадмин может посчитать все (или отдельно служебные).
+	Если строк статистики больше допустимого (config.MAX_LOGS_STATS_ROWS) - ошибка 422:
+	 нужно сузить период или укрупнить группировку.
+
+	Доступно для REGION_MANAGER-пользователей и выше (региональный менеджер - только по своему региону).
+	"""
+	if scope != ErrorTypeEnum.PUBLIC and current_user.role != RoleEnum.SYSADMIN:
+		raise PermissionsError()
+	if current_user.role < RoleEnum.MANAGER:
+		if region and region != current_user.region:
+			raise PermissionsError()
+		region = current_user.region
+	try:
+		return await CRUDLog.get_stats(db, log_type, bucket, group_by or [], since, until, station_id, region, scope)
+	except ValidationError as e:
+		raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+def decode_cursor_param(cursor: str | None) -> tuple[datetime.datetime, int] | None:
+	if cursor is None:
+		return
+	try:
+		return decode_logs_cursor(cursor)
+	except ValueError as e:
+		raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+def set_next_cursor(response: Response, result: list, limit: int) -> None:
+	"""
+	Если страница полная - в хедере X-Next-Cursor курсор следующей.
+	"""
+	if len(result) == limit:
+		response.headers["X-Next-Cursor"] = encode_logs_cursor(result[-1].timestamp, result[-1].id)
+
+
+@router.get("/export", response_class=StreamingResponse, responses=openapi.export_logs_get)
+async def export_logs(
+	current_user: Annotated[User, Depends(get_region_manager_user)],
+	db: Annotated[AsyncSession, Depends(get_async_session)],
+	since: Annotated[datetime.datetime, Query(title="Начало периода")],
+	until: Annotated[datetime.datetime, Query(title="Конец периода (не включительно)")] = None,
+	log_type: Annotated[LogTypeEnum, Query(title="Логи/ошибки")] = LogTypeEnum.LOG,
+	export_format: Annotated[ExportFormatEnum, Query(alias="format", title="Формат выгрузки")] = ExportFormatEnum.NDJSON,
+	station_id: Annotated[uuid.UUID, Query(title="ИД станции")] = None,
+	region: Annotated[RegionEnum, Query(title="Регион")] = None,
+	scope: Annotated[ErrorTypeEnum, Query(title="Тип ошибок (видимость)")] = ErrorTypeEnum.PUBLIC
+):
+	"""
+	Выгрузка логов или ошибок станции и/или региона за период - без ограничения количества.
+	Нужно указать станцию или регион.
+	Формат - NDJSON (по одному логу в строке) или CSV; данные отдаются потоком, по возрастанию времени.
+
+	По умолчанию выгружаются только публичные ошибки, сисадмин может выгрузить все (или отдельно служебные).
+
+	Доступно для REGION_MANAGER-пользователей и выше (региональный менеджер - только по своему региону).
+	"""
+	if not station_id and not region:
+		raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Station ID or region is required")
+	if scope != ErrorTypeEnum.PUBLIC and current_user.role != RoleEnum.SYSADMIN:
+		raise PermissionsError()
+	if current_user.role < RoleEnum.MANAGER:
+		if region and region != current_user.region:
+			raise PermissionsError()
+		region = current_user.region
+	if station_id and not await Station.get_station_by_id(db=db, station_id=station_id):
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
+
+	media_types = {ExportFormatEnum.NDJSON: "application/x-ndjson", ExportFormatEnum.CSV: "text/csv"}
+	filename = f"{log_type.value}s_{since.date().isoformat()}.{export_format.value}"
+	return StreamingResponse(
+		CRUDLog.export(db, log_type, export_format, since, until, station_id, region, scope),
+		media_type=media_types[export_format],
+		headers={"Content-Disposition": f"attachment; filename=\"{filename}\""}
+	)
@@ -1,19 +1,21 @@
-from typing import Annotated
+from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, Path, HTTPException, status, Body
+from fastapi import APIRouter, Depends, Path, HTTPException, status, Body, Header, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..crud import crud_stations, crud_washing
 from ..dependencies import get_async_session
 from ..dependencies.roles import get_sysadmin_user, get_installer_user
 from ..dependencies.stations import get_station_by_id, get_station_program_by_number
-from ..exceptions import GettingDataError, UpdatingError
+from ..exceptions import GettingDataError, UpdatingError, VersionConflictError
 from ..exceptions import PermissionsError, CreatingError, DeletingError
 from ..models.stations import StationControl, StationSettings, StationProgram, Station
 from ..models.washing import WashingAgent, WashingMachine
 from ..schemas import schemas_stations as stations, schemas_users as users, schemas_washing as washing
 from ..static import openapi
 from ..static.enums import StationParamsEnum, QueryFromEnum, WashingServicesEnum
+from ..utils.cache import station_data_cache
+from ..utils.general import encode_etag, decode_etag
 
 router = APIRouter(
 	prefix="/manage",
@@ -26,16 +28,20 @@ async def read_station_partial_by_user(
 	current_user: Annotated[users.User, Depends(get_installer_user)],
 	station: Annotated[stations.StationGeneralParams, Depends(get_station_by_id)],
 	db: Annotated[AsyncSession, Depends(get_async_session)],
-	dataset: Annotated[StationParamsEnum, Path(title="Набор параметров станции")]
+	dataset: Annotated[StationParamsEnum, Path(title="Набор параметров станции")],
+	response: Response
 ):
 	"""
 	Получение выборочных данных по станции пользователем.
+	Для состояния и настроек станции в заголовке ETag - их текущая версия (для If-Match при изменении).
 
 	Доступно для INSTALLER-пользователей и выше.
 	REGION_MANAGER и INSTALLER для доступа должны иметь тот же регион, что и станция.
 	"""
 	try:
-		return await crud_stations.read_station(station, dataset, db, current_user)
+		result = await crud_stations.read_station(station, dataset, db, current_user)
+		set_etag(response, result)
+		return result
 	except GettingDataError as e:
 		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 	except PermissionError:
@@ -110,7 +116,9 @@ async def update_station_control(
 	station: Annotated[stations.StationGeneralParams, Depends(get_station_by_id)],
 	updating_params: Annotated[stations.StationControlUpdate, Body(embed=True,
 																	  title="Измененные параметры состояния станции")],
-	db: Annotated[AsyncSession, Depends(get_async_session)]
+	db: Annotated[AsyncSession, Depends(get_async_session)],
+	response: Response,
+	if_match: Annotated[str | None, Header(title="ETag состояния станции, которое изменяется")] = None
 ):
 	"""
 	Обновление текущего состояния станции.
@@ -129,14 +137,22 @@ async def update_station_control(
 	Если передать статус не нулевой, но при этом в настройках стация выключена - вернется ошибка.
 	Если переданная стиральная машина неактивна - вернется ошибка.
 
+	Если передан заголовок If-Match (ETag из ответа на получение состояния), состояние изменится, только если
+	 его с тех пор никто не изменил, иначе - 412. Новый ETag - в заголовке ответа.
+
 	Доступно только для INSTALLER-пользователей и выше.
 	REGION_MANAGER и INSTALLER для доступа должны иметь тот же регион, что и станция.
 	"""
+	expected_version = decode_if_match(if_match)
 	try:
 		Station.check_user_permissions(current_user, station)
-		return await crud_stations.update_station_control(
-			station, updating_params, db, action_by=current_user
+		result = await crud_stations.update_station_control(
+			station, updating_params, db, action_by=current_user, expected_version=expected_version
 		)
+		set_etag(response, result)
+		return result
+	except VersionConflictError as e:
+		raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(e))
 	except UpdatingError as e:
 		raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
 	except PermissionError:
@@ -150,7 +166,9 @@ async def update_station_settings(
 	station: Annotated[stations.StationGeneralParams, Depends(get_station_by_id)],
 	updating_params: Annotated[stations.StationSettingsUpdate, Body(embed=True,
 																   title="Измененные настройки станции")],
-	db: Annotated[AsyncSession, Depends(get_async_session)]
+	db: Annotated[AsyncSession, Depends(get_async_session)],
+	response: Response,
+	if_match: Annotated[str | None, Header(title="ETag настроек станции, которые изменяются")] = None
 ):
 	"""
 	Изменение настроек станции.
@@ -161,15 +179,25 @@ async def update_station_settings(
 	Если station_power был 'False' и стал 'True' - статус автоматически становится "ожидание".
 	Выключение/включение ТЭН'а ни на что не влияет.
 
+	Если передан заголовок If-Match (ETag из ответа на получение настроек), настройки изменятся, только если
+	 их с тех пор никто не изменил, иначе - 412. Новый ETag - в заголовке ответа.
+
 	Доступно только для INSTALLER-пользователей и выше.
 	REGION_MANAGER и INSTALLER для доступа должны иметь тот же регион, что и станция.
 	"""
-	if updating_params.station_power is False:
-		await StationControl.update_relation_data(station, stations.StationControlUpdate(), db)
-		# StationControlUpdate() - все нулевое
+	expected_version = decode_if_match(if_match)
 	try:
 		Station.check_user_permissions(current_user, station)
-		return await crud_stations.update_station_settings(station, updating_params, db, action_by=current_user)
+		result = await crud_stations.update_station_settings(
+			station, updating_params, db, action_by=current_user, expected_version=expected_version
+		)
+		if updating_params.station_power is False:
+			await StationControl.update_relation_data(station, stations.StationControlUpdate(), db)
+			# StationControlUpdate() - все нулевое
+		set_etag(response, result)
+		return result
+	except VersionConflictError as e:
+		raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(e))
 	except UpdatingError as e:
 		raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
 	except PermissionError:
@@ -215,6 +243,7 @@ async def create_station_program(
 			station_full_data, programs, db
 		)
 		await db.commit()
+		await station_data_cache.invalidate(station.id, StationProgram.DATASET)
 	except CreatingError as e:
 		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 	return [program for program in station_with_created_programs.station_programs
@@ -346,6 +375,7 @@ async def create_station_washing_services(
 			db=db, station_id=station.id, object_number=object_number, **params_dict
 		)
 		await db.commit()
+		await station_data_cache.invalidate(station.id, model.DATASET)
 	except CreatingError as e:
 		raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
 	return created_obj
@@ -477,3 +507,21 @@ async def delete_station_washing_services(
 		f"{cls.__class__.__name__}_number": object_number,
 		"station_id": station.id
 	}}
+
+
+def decode_if_match(if_match: str | None) -> int | None:
+	if if_match is None:
+		return
+	try:
+		return decode_etag(if_match)
+	except ValueError as e:
+		raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+def set_etag(response: Response, result: Any) -> None:
+	"""
+	Для версионируемых данных (состояние и настройки станции) в хедере ETag - их версия.
+	"""
+	version = getattr(result, "version", None)
+	if version is not None:
+		response.headers["ETag"] = encode_etag(version)
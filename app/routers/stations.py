@@ -1,22 +1,28 @@
+import asyncio
 import datetime
+import json
 import uuid
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Body, status, HTTPException, Path, Query
+from fastapi import APIRouter, Depends, Body, status, HTTPException, Path, Query, Header, Response
+from fastapi.responses import StreamingResponse
 from fastapi_cache.decorator import cache
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Session
 
+import config
 from ..crud import crud_stations, crud_logs as log
 from ..models.stations import Station
-from ..dependencies import get_async_session, get_sync_session
+from ..dependencies import get_async_session
 from ..dependencies.roles import get_sysadmin_user, get_installer_user
 from ..dependencies.stations import get_current_station
 from ..exceptions import GettingDataError, CreatingError
 from ..schemas import schemas_stations
 from ..schemas.schemas_users import User
 from ..static import openapi
-from ..static.enums import StationParamsEnum, QueryFromEnum, StationsSortingEnum
+from ..static.enums import StationParamsEnum, QueryFromEnum, StationsSortingEnum, CacheTagEnum
+from ..utils.cache import cache_key_builder, invalidate_cache
+from ..utils.events import station_events
+from ..utils.general import etag_matches
 from .config import CACHE_EXPIRING_DEFAULT
 
 router = APIRouter(
@@ -27,23 +33,34 @@ router = APIRouter(
 
 @router.get("/", responses=openapi.read_all_stations_get,
 			response_model=list[schemas_stations.StationInList])
-@cache(expire=CACHE_EXPIRING_DEFAULT)
+@cache(expire=CACHE_EXPIRING_DEFAULT, key_builder=cache_key_builder(
+	CacheTagEnum.STATIONS, CacheTagEnum.USERS, current_user=("role", "region")
+))
 async def read_all_stations(
 	current_user: Annotated[User, Depends(get_installer_user)],
-	db: Annotated[Session, Depends(get_sync_session)],
-	async_db: Annotated[AsyncSession, Depends(get_async_session)],
+	db: Annotated[AsyncSession, Depends(get_async_session)],
 	order_by: Annotated[StationsSortingEnum, Query(title="Сортировка по столбцам")] = StationsSortingEnum.NAME,
-	desc: Annotated[bool, Query(title="В обратном порядке или нет")] = False
+	desc: Annotated[bool, Query(title="В обратном порядке или нет")] = False,
+	limit: Annotated[int, Query(title="Количество станций на странице", ge=1,
+								le=config.MAX_STATIONS_GETTING_AMOUNT)] = None,
+	cursor: Annotated[uuid.UUID, Query(title="ИД последней станции предыдущей страницы")] = None
 ):
 	"""
 	Получение списка всех станций (без подробных данных по каждой).
 	Доступно только для SYSADMIN-пользователей.
 
+	Если передан limit, список возвращается постранично: для следующей страницы нужно передать
+	 в cursor ИД последней станции из текущей (с теми же order_by и desc).
+	Если limit не передан - возвращаются все станции.
+
 	Основные параметры станций будут меняться редко, поэтому здесь делаю кэширование
-	 ответа на час. Можно сократить время, если потребуется.
+	 ответа (общего для пользователей с одной ролью и регионом). При изменении станций и пользователей
+	 кэш сбрасывается.
 	"""
-	return await crud_stations.read_all_stations(db, async_db, current_user,
-												 order_by, desc)
+	try:
+		return await crud_stations.read_all_stations(db, current_user, order_by, desc, limit, cursor)
+	except GettingDataError as e:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
 
 @router.post("/", response_model=schemas_stations.Station, status_code=status.HTTP_201_CREATED,
@@ -109,19 +126,68 @@ async def create_station(
 	await log.CRUDLog.server(6.4, log_text, created_station, db)
 
 	await db.commit()
+	await invalidate_cache(CacheTagEnum.STATIONS)
 	return created_station
 
 
+@router.get("/me/events", response_class=StreamingResponse, responses=openapi.read_stations_events_get)
+async def read_stations_events(
+	current_station: Annotated[schemas_stations.StationGeneralParamsForStation, Depends(get_current_station)],
+	db: Annotated[AsyncSession, Depends(get_async_session)]
+):
+	"""
+	Поток изменений данных станции (Server-Sent Events) - вместо периодического опроса.
+
+	Событие - изменившийся набор данных ("event" - название набора, "data" - JSON с набором, его новой версией
+	 и новыми данными; если данных нет - набор нужно перечитать).
+	Версия - та же, что в ETag набора (GET /me/{dataset}), ее можно передавать в If-None-Match.
+	Раз в STATION_EVENTS_HEARTBEAT_INTERVAL секунд отправляется комментарий-пинг.
+	Через STATION_EVENTS_STREAM_DURATION секунд поток закрывается - станция должна переподключиться
+	 и перечитать данные (события между подключениями не сохраняются).
+	"""
+	try:
+		await station_events.start(timeout=config.STATION_EVENTS_SUBSCRIBE_TIMEOUT)
+	except ConnectionError as e:
+		raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+	await db.close()  # соединение с БД не держится, пока открыт поток
+
+	async def stream():
+		loop = asyncio.get_running_loop()
+		deadline = loop.time() + config.STATION_EVENTS_STREAM_DURATION
+		async with station_events.subscribe(current_station.id) as queue:
+			while (remaining := deadline - loop.time()) > 0:
+				try:
+					event = await asyncio.wait_for(
+						queue.get(), timeout=min(config.STATION_EVENTS_HEARTBEAT_INTERVAL, remaining)
+					)
+				except asyncio.TimeoutError:
+					yield ": heartbeat\n\n"
+					continue
+				yield f"event: {event['dataset']}\ndata: {json.dumps(event)}\n\n"
+
+	return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @router.get("/me/{dataset}", responses=openapi.read_stations_params_get)
 async def read_stations_params(
 	current_station: Annotated[schemas_stations.StationGeneralParamsForStation, Depends(get_current_station)],
 	db: Annotated[AsyncSession, Depends(get_async_session)],
-	dataset: Annotated[StationParamsEnum, Path(title="Набор параметров станции")]
+	dataset: Annotated[StationParamsEnum, Path(title="Набор параметров станции")],
+	response: Response,
+	if_none_match: Annotated[str | None, Header(title="ETag из предыдущего ответа")] = None
 ):
 	"""
 	Получение параметров станции самой станцией.
 	Если станция неактивна, возвращается ошибка 403.
+
+	В заголовке ETag - версия набора. Если передан заголовок If-None-Match с ней (набор не менялся),
+	 возвращается 304 без тела (данные при этом не читаются).
 	"""
+	etag = await crud_stations.read_station_etag(current_station, db, dataset)
+	if etag is not None:
+		if etag_matches(if_none_match, etag):
+			return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+		response.headers["ETag"] = etag
 	match dataset:
 		case StationParamsEnum.GENERAL:
 			return current_station
@@ -135,11 +201,21 @@ async def read_stations_params(
 @router.get("/me", response_model=schemas_stations.StationForStation, responses=openapi.read_stations_me_get)
 async def read_stations_me(
 	current_station: Annotated[schemas_stations.StationGeneralParamsForStation, Depends(get_current_station)],
-	db: Annotated[AsyncSession, Depends(get_async_session)]
+	db: Annotated[AsyncSession, Depends(get_async_session)],
+	response: Response,
+	if_none_match: Annotated[str | None, Header(title="ETag из предыдущего ответа")] = None
 ):
 	"""
 	Получение ВСЕХ параметров станции станцией.
+
+	В заголовке ETag - версия данных станции. Если передан заголовок If-None-Match с ней (данные не менялись),
+	 возвращается 304 без тела (данные при этом не читаются).
 	"""
+	etag = await crud_stations.read_station_etag(current_station, db)
+	if etag is not None:
+		if etag_matches(if_none_match, etag):
+			return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+		response.headers["ETag"] = etag
 	try:
 		return await crud_stations.read_station_all(current_station, db, query_from=QueryFromEnum.STATION)
 	except GettingDataError as e:
@@ -13,6 +13,7 @@ from ..exceptions import PermissionsError
 from ..models.users import User
 from ..schemas import schemas_users
 from ..static import openapi, enums
+from ..utils.cache import cache_key_builder
 from ..exceptions import UpdatingError
 
 router = APIRouter(
@@ -27,7 +28,9 @@ special_router = APIRouter(
 
 
 @router.get("/", responses=openapi.read_users_get, response_model=list[schemas_users.User])
-@cache(expire=CACHE_EXPIRING_DEFAULT)
+@cache(expire=CACHE_EXPIRING_DEFAULT, key_builder=cache_key_builder(
+	enums.CacheTagEnum.USERS, current_user=("id", "role", "region")  # себя в списке нет
+))
 async def read_users(
 	current_user: Annotated[schemas_users.User, Depends(get_region_manager_user)],
 	db: Annotated[AsyncSession, Depends(get_async_session)],
@@ -93,7 +96,7 @@ async def create_user_by_sysadmin(
 
 
 @special_router.get("/user", responses=openapi.read_users_me_get, response_model=schemas_users.User)
-@cache(expire=CACHE_EXPIRING_DEFAULT)
+@cache(expire=CACHE_EXPIRING_DEFAULT, key_builder=cache_key_builder(enums.CacheTagEnum.USERS, current_user=("id",)))
 async def read_users_me(
 	current_user: Annotated[schemas_users.User, Depends(get_current_active_user)]
 ):
@@ -104,7 +107,9 @@ async def read_users_me(
 
 
 @router.get("/{user_id}", responses=openapi.read_user_get, response_model=schemas_users.User)
-@cache(expire=CACHE_EXPIRING_DEFAULT)
+@cache(expire=CACHE_EXPIRING_DEFAULT, key_builder=cache_key_builder(
+	enums.CacheTagEnum.USERS, current_user=("id", "role", "region"), user=("id",)
+))
 async def read_user(
 	current_user: Annotated[schemas_users.User, Depends(get_current_active_user)],
 	user: Annotated[schemas_users.User, Depends(get_user_by_id)],
@@ -4,7 +4,7 @@ from typing import Optional
 from pydantic import BaseModel, Field, root_validator, UUID4
 
 import services
-from ..static.enums import LogCaseEnum, ErrorTypeEnum, LogFromEnum, LogActionEnum
+from ..static.enums import LogCaseEnum, ErrorTypeEnum, LogFromEnum, LogActionEnum, LogTypeEnum, RegionEnum
 
 
 class LogCreate(BaseModel):
@@ -65,3 +65,34 @@ class Error(Log):
 	Вывод ошибки.
 	"""
 	scope: ErrorTypeEnum = Field(title="Видимость ошибки (публичная/служебная)")
+
+
+class LogBatchItem(BaseModel):
+	"""
+	Лог или ошибка в пакете логов станции.
+	"""
+	type: LogTypeEnum = Field(title="Лог или ошибка")
+	log: ErrorCreate = Field(title="Параметры лога/ошибки (видимость - только для ошибки)")
+	data: dict = Field(title="Дополнительные данные", default_factory=dict)
+
+
+class LogBatchItemResult(BaseModel):
+	"""
+	Результат добавления лога/ошибки из пакета.
+	Status_code - такой же код, как при одиночном добавлении лога (201 - добавлен).
+	"""
+	status_code: int = Field(title="Код результата")
+	log: Error | Log | None = Field(title="Добавленный лог/ошибка")
+	detail: str | None = Field(title="Описание ошибки, если лог не добавлен")
+
+
+class LogsStats(BaseModel):
+	"""
+	Количество логов/ошибок за период (с группировкой по выбранным полям - остальные пустые).
+	"""
+	bucket: datetime.datetime = Field(title="Начало периода")
+	code: Optional[float] = Field(title="Код")
+	action: Optional[LogActionEnum] = Field(title="Действие")
+	region: Optional[RegionEnum] = Field(title="Регион")
+	station_id: Optional[UUID4] = Field(title="ИД станции")
+	count: int = Field(title="Количество")
@@ -107,6 +107,8 @@ class StationSettings(BaseModel):
 	station_power: bool = Field(title="Включена/выключена")
 	teh_power: bool = Field(title="ТЭН включен/выключен")
 	updated_at: Optional[datetime.datetime] = Field(title="Дата и время последнего обновления (настроек станции)")
+	version: Optional[int] = Field(title="Версия настроек станции", description="Отдается в заголовке ETag",
+								   exclude=True)
 
 	class Config:
 		orm_mode = True
@@ -280,6 +282,8 @@ class StationControl(BaseModel):
 		default_factory=list
 	)
 	updated_at: Optional[datetime.datetime] = Field(title="Дата и время последнего обновления (состояния станции)")
+	version: Optional[int] = Field(title="Версия состояния станции", description="Отдается в заголовке ETag",
+								   exclude=True)
 
 	@validator("program_step")
 	def validate_program_step(cls, program_step):
@@ -437,9 +441,21 @@ class StationCreate(BaseModel):
 		return values
 
 
+class StationActivity(BaseModel):
+	"""
+	Сводка активности станции (таблица station_activity).
+	"""
+	last_work_at: datetime.datetime | None
+	last_maintenance_at: datetime.datetime | None
+	last_error_at: datetime.datetime | None
+
+
 class StationInList(BaseModel):
 	general: StationGeneralParams
 	owner: User | None
 	control: StationControl
 	last_work_at: datetime.datetime | None
 	last_maintenance_at: datetime.datetime | None
+	last_error_at: datetime.datetime | None
+	errors_count: int = Field(title="Количество ошибок за период (services.STATION_ACTIVITY_ERRORS_PERIOD)",
+							  default=0)
@@ -40,6 +40,14 @@ class StationParamsEnum(Enum):
 	WASHING_AGENTS = "agents"
 
 
+class CacheTagEnum(Enum):
+	"""
+	Теги закэшированных ответов эндпоинтов (app.utils.cache.cache_key_builder).
+	"""
+	STATIONS = "stations"
+	USERS = "users"
+
+
 class WashingServicesEnum(Enum):
 	WASHING_MACHINES = "machines"
 	WASHING_AGENTS = "agents"
@@ -147,6 +155,25 @@ class LogTypeEnum(Enum):
 	ERROR = "error"
 
 
+class ExportFormatEnum(Enum):
+	NDJSON = "ndjson"
+	CSV = "csv"
+
+
+class StatsBucketEnum(Enum):
+	HOUR = "hour"
+	DAY = "day"
+	WEEK = "week"
+	MONTH = "month"
+
+
+class StatsGroupingEnum(Enum):
+	CODE = "code"
+	ACTION = "action"
+	REGION = "region"
+	STATION = "station"
+
+
 class LogActionEnum(Enum):
 	"""
 	Действия для осуществления после добавления лога.
@@ -65,6 +65,9 @@ login_post = {
 	},
 	403: {
 		"description": "Disabled user"
+	},
+	429: {
+		"description": "Too many requests (Retry-After - через сколько секунд можно повторить)"
 	}
 }
 
@@ -139,6 +142,9 @@ create_log_post = {
 	},
 	409: {
 		"description": "Updating conflict"
+	},
+	429: {
+		"description": "Too many requests (Retry-After - через сколько секунд можно повторить)"
 	}
 }
 
@@ -158,32 +164,94 @@ create_error_post = {
 	},
 	409: {
 		"description": "Updating conflict"
+	},
+	429: {
+		"description": "Too many requests (Retry-After - через сколько секунд можно повторить)"
+	}
+}
+
+create_logs_batch_post = {
+	200: {
+		"description": "Результаты добавления логов/ошибок (по порядку, для каждого - свой код).",
+		"model": list[logs.LogBatchItemResult]
+	},
+	401: {
+		"description": "Incorrect station UUID"
+	},
+	403: {
+		"description": "Inactive station / Not released station / Not released station / Station status: ERROR / MAINTENANCE"
+	},
+	409: {
+		"description": "Station is busy (previous actions are still in progress)"
+	},
+	422: {
+		"description": "Invalid log/error data (nothing was added)"
+	},
+	429: {
+		"description": "Too many requests (Retry-After - через сколько секунд можно повторить)"
 	}
 }
 
 get_station_logs_get = {
 	200: {
 		"description": "Логи станции",
-		"model": list[logs.Log]
+		"model": list[logs.Log],
+		"headers": {"X-Next-Cursor": {"description": "Курсор следующей страницы (если страница полная)"}}
 	},
 	403: {
 		"description": "Permissions error / Disabled user / Not released station / Station status: ERROR / MAINTENANCE"
 	},
 	404: {
 		"description": "Station not found / Getting *DATASET* for station *UUID* error. DB data not found"
+	},
+	422: {
+		"description": "Invalid cursor"
 	}
 }
 
 get_station_errors_get = {
 	200: {
 		"description": "Ошибки станции",
-		"model": list[logs.Error]
+		"model": list[logs.Error],
+		"headers": {"X-Next-Cursor": {"description": "Курсор следующей страницы (если страница полная)"}}
 	},
 	403: {
 		"description": "Permissions error / Disabled user / Not released station / Station status: ERROR / MAINTENANCE"
 	},
 	404: {
 		"description": "Station not found / Getting *DATASET* for station *UUID* error. DB data not found"
+	},
+	422: {
+		"description": "Invalid cursor"
+	}
+}
+
+export_logs_get = {
+	200: {
+		"description": "Логи/ошибки (NDJSON или CSV)",
+		"content": {"application/x-ndjson": {}, "text/csv": {}}
+	},
+	403: {
+		"description": "Permissions error / Disabled user"
+	},
+	404: {
+		"description": "Station not found"
+	},
+	422: {
+		"description": "Station ID or region is required"
+	}
+}
+
+get_logs_stats_get = {
+	200: {
+		"description": "Количество логов/ошибок по периодам",
+		"model": list[logs.LogsStats]
+	},
+	403: {
+		"description": "Permissions error / Disabled user"
+	},
+	422: {
+		"description": "Too many stats rows (narrow the period or the grouping)"
 	}
 }
 
@@ -266,6 +334,9 @@ read_all_stations_get = {
 	403: {
 		"description": "Permissions error / Disabled user "
 	},
+	404: {
+		"description": "Station from cursor not found"
+	},
 	422: {
 		"description": "Invalid station *UUID* data"
 	}
@@ -291,6 +362,9 @@ read_stations_params_get = {
 				 stations.StationSettings | list[stations.StationProgram] | list[washing.WashingAgent] | list[
 					 washing.WashingMachine]
 	},
+	304: {
+		"description": "Набор не изменился (If-None-Match)"
+	},
 	401: {
 		"description": "Incorrect station UUID"
 	},
@@ -302,11 +376,29 @@ read_stations_params_get = {
 	}
 }
 
+read_stations_events_get = {
+	200: {
+		"description": "Поток изменений данных станции (text/event-stream)"
+	},
+	401: {
+		"description": "Incorrect station UUID"
+	},
+	403: {
+		"description": "Inactive station / Not released station / Not released station / Station status: ERROR / MAINTENANCE"
+	},
+	503: {
+		"description": "Station events are unavailable now"
+	}
+}
+
 read_stations_me_get = {
 	200: {
 		"description": "Полные данные станции",
 		"model": stations.StationForStation
 	},
+	304: {
+		"description": "Данные станции не изменились (If-None-Match)"
+	},
 	401: {
 		"description": "Incorrect station UUID"
 	},
@@ -323,7 +415,8 @@ read_station_partial_by_user_get = {
 		"description": "Запрошенные данные станции",
 		"model": stations.StationGeneralParams | stations.StationControl | \
 				 stations.StationSettings | list[stations.StationProgram] | list[washing.WashingAgent] | list[
-					 washing.WashingMachine]
+					 washing.WashingMachine],
+		"headers": {"ETag": {"description": "Версия состояния/настроек станции (только для этих наборов данных)"}}
 	},
 	403: {
 		"description": "Permissions error / Disabled user / Not released station / Station status: ERROR / MAINTENANCE"
@@ -362,7 +455,8 @@ update_station_general_put = {
 update_station_control_put = {
 	200: {
 		"description": "Обновленные параметры текущего состояния станции",
-		"model": stations.StationControl
+		"model": stations.StationControl,
+		"headers": {"ETag": {"description": "Версия (для заголовка If-Match при следующем изменении)"}}
 	},
 	403: {
 		"description": "Permissions error / Disabled user / Not released station / Station status: ERROR / MAINTENANCE"
@@ -372,13 +466,20 @@ update_station_control_put = {
 	},
 	409: {
 		"description": "Updating error (data conflict)"
+	},
+	412: {
+		"description": "Station data was changed concurrently (If-Match doesn't match current version)"
+	},
+	422: {
+		"description": "Invalid ETag"
 	}
 }
 
 update_station_settings_put = {
 	200: {
 		"description": "Обновленные настройки станции",
-		"model": stations.StationSettings
+		"model": stations.StationSettings,
+		"headers": {"ETag": {"description": "Версия (для заголовка If-Match при следующем изменении)"}}
 	},
 	403: {
 		"description": "Permissions error / Disabled user / Not released station / Station status: ERROR / MAINTENANCE"
@@ -388,6 +489,12 @@ update_station_settings_put = {
 	},
 	409: {
 		"description": "Updating error (data conflict)"
+	},
+	412: {
+		"description": "Station data was changed concurrently (If-Match doesn't match current version)"
+	},
+	422: {
+		"description": "Invalid ETag"
 	}
 }
 
@@ -681,6 +788,8 @@ for _ in [
 	update_station_washing_machine_put,
 	delete_station_washing_services_delete,
 	get_station_logs_get,
+	export_logs_get,
+	get_logs_stats_get,
 	delete_station_delete,
 	add_laundry_station_post,
 	get_laundry_stations_get,
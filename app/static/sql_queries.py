@@ -1 +1,23 @@
 GET_ALL_TABLES = "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'"
+
+# партиции логов и ошибок (app.models.logs)
+CREATE_DEFAULT_PARTITION = "CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"
+CREATE_MONTHLY_PARTITION = (
+	"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+	"WITH moved AS (DELETE FROM {table}_default WHERE timestamp >= '{start}' AND timestamp < '{end}' RETURNING *) "
+	"INSERT INTO {partition} SELECT * FROM moved",
+	"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM ('{start}') TO ('{end}')"
+)
+
+# часы, за которые добавлены логи/ошибки, - для пересчета почасовой статистики (app.models.logs.LogsHourlyStats)
+CREATE_STATS_CHANGED_HOURS_FUNCTION = """
+CREATE OR REPLACE FUNCTION mark_logs_stats_changed_hours() RETURNS trigger AS $$
+BEGIN
+	INSERT INTO logs_stats_changed_hours (hour)
+	SELECT DISTINCT timezone('UTC', date_trunc('hour', timezone('UTC', timestamp))) FROM new_rows;
+	RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+CREATE_STATS_CHANGED_HOURS_TRIGGER = "CREATE TRIGGER {table}_stats_changed_hours AFTER INSERT ON {table} " \
+	"REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION mark_logs_stats_changed_hours()"
@@ -1,3 +1,4 @@
+import asyncio
 import smtplib
 from email.message import EmailMessage
 
@@ -6,7 +7,11 @@ from sqlalchemy.orm import Session
 
 import config
 import services
+from .database import async_session_maker
+from .models.logs import LogsHourlyStats
+from .models.users import User as UserModel
 from .schemas.schemas_users import User
+from .utils.activity import users_activity
 
 
 # def send_verifying_email_code(registering_user: User, db: Session):
@@ -48,3 +53,55 @@ from .schemas.schemas_users import User
 # 			logger.error(f"Registration code wasn't sended to user email {registering_user.email} "
 # 						f"from {services.SMTP_USER}. "
 # 						f"Error: {e}")
+
+
+async def refresh_logs_stats() -> None:
+	"""
+	Периодический пересчет почасовой статистики логов (запускается при старте сервера).
+	Пересчет выполняет только один воркер одновременно (остальные пропускают его).
+	"""
+	while True:
+		try:
+			async with async_session_maker() as session:
+				await LogsHourlyStats.refresh(session)
+		except Exception as e:  # фоновая задача не должна падать
+			logger.error(f"Logs stats refreshing error: {e}")
+		await asyncio.sleep(config.LOGS_STATS_REFRESH_INTERVAL)
+
+
+async def flush_users_activity() -> None:
+	"""
+	Запись накопленного времени последних действий пользователей в БД (app.utils.activity.users_activity).
+	Выполняется раз в USERS_ACTIVITY_FLUSH_INTERVAL секунд и при отключении сервера.
+	Пишется пачками по USERS_ACTIVITY_FLUSH_BATCH_SIZE пользователей (ограничение на число параметров запроса).
+	Если записать не удалось (или запись прервана), записи возвращаются в Redis до следующего раза
+	 (повторная запись ничего не портит).
+	"""
+	try:
+		activity = await users_activity.take()
+	except Exception as e:  # фоновая задача не должна падать
+		logger.error(f"Users activity taking error: {e}")
+		return
+	try:
+		users_ids = list(activity)
+		async with async_session_maker() as session:
+			for i in range(0, len(users_ids), config.USERS_ACTIVITY_FLUSH_BATCH_SIZE):
+				batch = users_ids[i:i + config.USERS_ACTIVITY_FLUSH_BATCH_SIZE]
+				await UserModel.bulk_update_last_action(session, {user_id: activity[user_id] for user_id in batch})
+	except (Exception, asyncio.CancelledError) as e:  # в т.ч. отмена задачи при отключении сервера
+		logger.error(f"Users activity flushing error ({len(activity)} users): {e!r}")
+		try:
+			await users_activity.restore(activity)
+		except Exception as restore_error:
+			logger.error(f"Users activity restoring error: {restore_error}")
+		if isinstance(e, asyncio.CancelledError):
+			raise
+
+
+async def flush_users_activity_periodically() -> None:
+	"""
+	Периодическая запись времени последних действий пользователей (запускается при старте сервера).
+	"""
+	while True:
+		await asyncio.sleep(config.USERS_ACTIVITY_FLUSH_INTERVAL)
+		await flush_users_activity()
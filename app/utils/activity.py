@@ -0,0 +1,63 @@
+import datetime
+
+import redis
+from loguru import logger
+
+import config
+from ..database import redis_client
+
+# все накопленные записи забираются (и удаляются) одной атомарной операцией
+TAKE_ACTIVITY_SCRIPT = """
+local data = redis.call('hgetall', KEYS[1])
+redis.call('del', KEYS[1])
+return data
+"""
+
+
+class UsersActivityTracker:
+	"""
+	Накопление времени последнего действия пользователей в Redis (хэш: ИД пользователя -> время).
+
+	Каждый запрос пользователя только перезаписывает его поле в хэше (несколько действий до записи в БД
+	 схлопываются в одно), а фоновая задача (app.tasks.flush_users_activity) раз в
+	 config.USERS_ACTIVITY_FLUSH_INTERVAL забирает накопленное и записывает в БД одним UPDATE
+	 (см. User.bulk_update_last_action). Хэш общий для воркеров, поэтому записи забирает кто-то один.
+	"""
+	_take_script = redis_client.register_script(TAKE_ACTIVITY_SCRIPT)
+
+	@staticmethod
+	def key() -> str:
+		return f"{config.REDIS_CACHE_PREFIX}:users-activity"
+
+	async def record(self, user_id: int) -> bool:
+		"""
+		Запись действия пользователя (False - Redis недоступен).
+		"""
+		try:
+			await redis_client.hset(self.key(), str(user_id), datetime.datetime.now(datetime.timezone.utc).timestamp())
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"Users activity wasn't recorded: {e}")
+			return False
+		return True
+
+	async def take(self) -> dict[int, datetime.datetime]:
+		"""
+		Накопленное время последних действий пользователей (удаляется из Redis).
+		"""
+		data = await self._take_script(keys=[self.key()])
+		return {
+			int(user_id): datetime.datetime.fromtimestamp(float(timestamp), tz=datetime.timezone.utc)
+			for user_id, timestamp in zip(data[::2], data[1::2])
+		}
+
+	async def restore(self, activity: dict[int, datetime.datetime]) -> None:
+		"""
+		Возврат забранных записей (если записать их в БД не удалось); более поздние действия не затираются.
+		"""
+		async with redis_client.pipeline(transaction=False) as pipe:
+			for user_id, timestamp in activity.items():
+				pipe.hsetnx(self.key(), str(user_id), timestamp.timestamp())
+			await pipe.execute()
+
+
+users_activity = UsersActivityTracker()
@@ -0,0 +1,469 @@
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Hashable, Callable, Awaitable
+
+import redis
+from fastapi.encoders import jsonable_encoder
+from fastapi_cache import FastAPICache
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+from ..database import redis_client
+from .events import station_events_channel, STATION_EVENT_LUA
+from ..schemas import schemas_users
+from ..static.enums import StationParamsEnum, CacheTagEnum
+
+
+class TTLCache:
+	"""
+	Простой in-process кэш с ограниченным временем жизни записей (TTL) и размером (LRU).
+
+	Кэш локальный для процесса (воркера gunicorn), поэтому его нужно явно инвалидировать
+	 во всех местах, где меняются закэшированные данные.
+	Между воркерами данные могут расходиться не дольше, чем на TTL.
+	"""
+	def __init__(self, maxsize: int, ttl: float):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+	def __contains__(self, key: Hashable) -> bool:
+		return self.get(key) is not None
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+	def get(self, key: Hashable) -> Any | None:
+		"""
+		Возвращает значение по ключу или None, если его нет или оно устарело.
+		"""
+		item = self._data.get(key)
+		if item is None:
+			return
+		expires_at, value = item
+		if expires_at < time.monotonic():
+			del self._data[key]
+			return
+		self._data.move_to_end(key)
+		return value
+
+	def set(self, key: Hashable, value: Any) -> None:
+		self._data[key] = (time.monotonic() + self.ttl, value)
+		self._data.move_to_end(key)
+		while len(self._data) > self.maxsize:
+			self._data.popitem(last=False)
+
+	def delete(self, key: Hashable) -> None:
+		self._data.pop(key, None)
+
+	def clear(self) -> None:
+		self._data.clear()
+
+
+class StationAuthCache:
+	"""
+	Кэш аутентификации станций (app.dependencies.stations.get_current_station):
+	 UUID станции -> (StationGeneralParamsForStation, статус станции).
+
+	Записи хранятся в процессе (ttl), но действительны, только пока не изменилось поколение станции в Redis
+	 (общее для воркеров): изменяющий станцию или ее контроль код после коммита задает новое (invalidate),
+	 и записи во всех воркерах перестают использоваться. Поколения случайные (не повторяются). Поколение берется до чтения станции из БД,
+	 поэтому прочитанные до параллельного изменения данные не будут использованы после него.
+	Если Redis недоступен, кэш не используется (станция читается из БД).
+	"""
+	def __init__(self, maxsize: int, ttl: float):
+		self.ttl = ttl
+		self._data = TTLCache(maxsize=maxsize, ttl=ttl)
+
+	@staticmethod
+	def generation_key(station_id: uuid.UUID) -> str:
+		return f"{config.REDIS_CACHE_PREFIX}:station-auth-generation:{station_id}"
+
+	async def generation(self, station_id: uuid.UUID) -> str | None:
+		"""
+		Текущее поколение станции (None - Redis недоступен).
+		"""
+		try:
+			generation = await redis_client.get(self.generation_key(station_id))
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"Station auth cache is unavailable: {e}")
+			return
+		return (generation or b"").decode()
+
+	async def get(self, station_id: uuid.UUID) -> tuple[Any | None, str | None]:
+		"""
+		Закэшированная станция (None - нет или устарела) и текущее поколение (None - кэш не используется).
+		"""
+		generation = await self.generation(station_id)
+		if generation is None:
+			return None, None
+		cached = self._data.get(station_id)
+		if cached is None or cached[0] != generation:
+			return None, generation
+		return cached[1], generation
+
+	def set(self, station_id: uuid.UUID, value: Any, generation: str | None) -> None:
+		"""
+		Запись прочитанной из БД станции (с поколением, взятым до чтения).
+		"""
+		if generation is not None:
+			self._data.set(station_id, (generation, value))
+
+	async def invalidate(self, station_id: uuid.UUID) -> None:
+		"""
+		Сброс станции во всех воркерах (после коммита ее изменения).
+		"""
+		self._data.delete(station_id)
+		try:
+			await redis_client.set(self.generation_key(station_id), uuid.uuid4().hex)
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"Station {station_id} auth cache wasn't invalidated: {e}")
+
+	def clear(self) -> None:
+		self._data.clear()
+
+
+# аутентифицированные станции - в процессе, с проверкой поколения в Redis
+station_auth_cache = StationAuthCache(maxsize=config.STATION_AUTH_CACHE_MAXSIZE, ttl=config.STATION_AUTH_CACHE_TTL)
+
+
+# запись наборов данных станции, если тег не изменился с момента, как его взяли (ARGV[1]);
+#  при записи из изменяющего кода (ARGV[2] == '1') тег и версии наборов увеличиваются,
+#  а при несовпадении наборы сбрасываются; эпоха (ARGV[4]) задается при создании записи;
+#  изменения публикуются в канал событий станции (KEYS[2]) - с версиями из этого же хэша
+STORE_STATION_DATA_SCRIPT = STATION_EVENT_LUA + """
+local matched = (redis.call('hget', KEYS[1], 'tag') or '') == ARGV[1]
+if ARGV[2] == '1' then
+	redis.call('hincrby', KEYS[1], 'tag', 1)
+end
+redis.call('hsetnx', KEYS[1], 'epoch', ARGV[4])
+for i = 5, #ARGV, 2 do
+	if ARGV[2] == '1' then
+		redis.call('hincrby', KEYS[1], ARGV[i] .. ':version', 1)
+	end
+	if matched then
+		redis.call('hset', KEYS[1], ARGV[i], ARGV[i + 1])
+	elseif ARGV[2] == '1' then
+		redis.call('hdel', KEYS[1], ARGV[i])
+	end
+end
+redis.call('pexpire', KEYS[1], ARGV[3])
+if ARGV[2] == '1' then
+	for i = 5, #ARGV, 2 do
+		redis.call('publish', KEYS[2], station_event(KEYS[1], ARGV[i], ARGV[i + 1]))
+	end
+end
+return matched and 1 or 0
+"""
+
+# сброс наборов данных станции (ARGV[3]...): тег и версии наборов увеличиваются, эпоха (ARGV[2]) задается
+#  при создании записи; сбросы публикуются в канал событий станции (KEYS[2]) - без данных
+INVALIDATE_STATION_DATA_SCRIPT = STATION_EVENT_LUA + """
+redis.call('hincrby', KEYS[1], 'tag', 1)
+redis.call('hsetnx', KEYS[1], 'epoch', ARGV[2])
+for i = 3, #ARGV do
+	redis.call('hincrby', KEYS[1], ARGV[i] .. ':version', 1)
+	redis.call('hdel', KEYS[1], ARGV[i])
+end
+redis.call('pexpire', KEYS[1], ARGV[1])
+for i = 3, #ARGV do
+	redis.call('publish', KEYS[2], station_event(KEYS[1], ARGV[i]))
+end
+"""
+
+
+class StationDataCache:
+	"""
+	Общий для всех воркеров write-through кэш наборов данных станций в Redis
+	 (настройки, контроль, программы, стиральные машины и средства).
+
+	Наборы одной станции хранятся в одном хэше (поле - набор, значение - JSON строк таблицы)
+	 вместе с тегом версии (поле tag), который увеличивается при каждом изменении данных станции:
+	 - при промахе набор читается из БД и записывается в кэш (fill), только если тег не изменился с момента промаха -
+	   иначе прочитанные до параллельного изменения данные затерли бы новые;
+	 - изменяющий код берет тег до записи в БД (tag), а после коммита записывает новый набор (set),
+	   если тег все еще тот же; иначе данные параллельно изменили - набор сбрасывается и будет прочитан из БД;
+	 - если нового набора нет под рукой (пишется несколько строк или в обход моделей) - набор сбрасывается
+	   (invalidate) после коммита.
+	Записи живут не дольше ttl (на случай изменений, не прошедших через кэш).
+	Версии данных для ETag (version) - эпоха записи (задается при ее создании, чтобы после истечения ttl
+	 версии не повторились) и тег или счетчик изменений набора.
+	Каждое изменение (set/invalidate) публикуется в канал событий станции (app.utils.events) тем же Lua-скриптом,
+	 что меняет версии, - версия в событии совпадает с версией набора в ETag.
+
+	Источник истины - Postgres: если Redis недоступен, данные читаются из БД (с предупреждением в логах).
+	Сессии пакетной обработки (get_async_session_in_transaction) кэш не используют: их изменения до коммита
+	 внешней транзакции не видны другим, поэтому данные станции сбрасываются после него.
+	"""
+	_store_script = redis_client.register_script(STORE_STATION_DATA_SCRIPT)
+	_invalidate_script = redis_client.register_script(INVALIDATE_STATION_DATA_SCRIPT)
+
+	def __init__(self, ttl: float):
+		self.ttl = ttl
+
+	@staticmethod
+	def key(station_id: uuid.UUID) -> str:
+		return f"{config.REDIS_CACHE_PREFIX}:station-data:{station_id}"
+
+	@staticmethod
+	def new_epoch() -> str:
+		return uuid.uuid4().hex[:12]
+
+	@staticmethod
+	def bypassed(db: AsyncSession) -> bool:
+		return "transaction" in db.info
+
+	async def get(self, db: AsyncSession, station_id: uuid.UUID,
+				  *datasets: StationParamsEnum) -> tuple[list[Any | None], str | None]:
+		"""
+		Закэшированные наборы данных станции (None - набора нет) и текущий тег (None - кэш не используется).
+		"""
+		if self.bypassed(db):
+			return [None] * len(datasets), None
+		try:
+			*values, tag = await redis_client.hmget(self.key(station_id), *(ds.value for ds in datasets), "tag")
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"Station {station_id} data cache is unavailable: {e}")
+			return [None] * len(datasets), None
+		return [json.loads(value) if value is not None else None for value in values], (tag or b"").decode()
+
+	async def tag(self, db: AsyncSession, station_id: uuid.UUID) -> str | None:
+		"""
+		Текущий тег (берется до изменения данных в БД, см. set).
+		"""
+		return (await self.get(db, station_id))[1]
+
+	async def version(self, db: AsyncSession, station_id: uuid.UUID,
+					  dataset: StationParamsEnum | None = None) -> str | None:
+		"""
+		Версия данных станции (всех наборов или одного) - меняется при каждом их изменении.
+		None - версии нет (записи в кэше еще нет или Redis недоступен).
+		"""
+		if self.bypassed(db):
+			return
+		field = "tag" if dataset is None else f"{dataset.value}:version"
+		try:
+			epoch, version = await redis_client.hmget(self.key(station_id), "epoch", field)
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"Station {station_id} data cache is unavailable: {e}")
+			return
+		if epoch is None:
+			return
+		return f"{epoch.decode()}.{(version or b'0').decode()}"
+
+	async def fill(self, db: AsyncSession, station_id: uuid.UUID, tag: str | None,
+				   data: dict[StationParamsEnum, Any]) -> None:
+		"""
+		Запись прочитанных из БД наборов (если тег не изменился).
+		"""
+		await self._store(db, station_id, tag, data, changed=False)
+
+	async def set(self, db: AsyncSession, station_id: uuid.UUID, tag: str | None,
+				  data: dict[StationParamsEnum, Any]) -> None:
+		"""
+		Запись измененных наборов после коммита (если тег не изменился, иначе - сброс наборов).
+		"""
+		if tag is None:
+			await self.invalidate(station_id, *data)
+			return
+		await self._store(db, station_id, tag, data, changed=True)
+
+	async def invalidate(self, station_id: uuid.UUID, *datasets: StationParamsEnum) -> None:
+		"""
+		Сброс наборов данных станции (если не указаны - всех).
+		"""
+		datasets = datasets or tuple(ds for ds in StationParamsEnum if ds != StationParamsEnum.GENERAL)
+		args = [int(self.ttl * 1000), self.new_epoch(), *(ds.value for ds in datasets)]
+		try:
+			await self._invalidate_script(keys=[self.key(station_id), station_events_channel(station_id)], args=args)
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"Station {station_id} data cache wasn't invalidated (expires in {self.ttl}s): {e}")
+
+	async def clear(self) -> None:
+		async for key in redis_client.scan_iter(match=self.key("*")):
+			await redis_client.delete(key)
+
+	async def _store(self, db: AsyncSession, station_id: uuid.UUID, tag: str | None,
+					 data: dict[StationParamsEnum, Any], changed: bool) -> None:
+		if tag is None or self.bypassed(db):
+			return
+		args = [tag, int(changed), int(self.ttl * 1000), self.new_epoch()]
+		for dataset, value in data.items():
+			args.extend((dataset.value, json.dumps(jsonable_encoder(value))))
+		try:
+			await self._store_script(keys=[self.key(station_id), station_events_channel(station_id)], args=args)
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"Station {station_id} data cache wasn't updated: {e}")
+
+
+# наборы данных станций (app.models.stations, app.models.washing) - общий для воркеров кэш в Redis
+station_data_cache = StationDataCache(ttl=config.STATION_DATA_CACHE_TTL)
+
+
+# запись пользователя, если поколение (KEYS[2]) не изменилось с момента, как его взяли (ARGV[1])
+STORE_USER_SCRIPT = """
+if (redis.call('get', KEYS[2]) or '') ~= ARGV[1] then
+	return 0
+end
+redis.call('set', KEYS[1], ARGV[2], 'PX', ARGV[3])
+return 1
+"""
+
+
+class UserAuthCache:
+	"""
+	Кэш аутентификации пользователей по access-токенам (app.dependencies.users.get_current_user).
+
+	- Проверенные токены (подпись и срок действия) запоминаются в процессе: токен -> (email, истечение);
+	  повторно подпись не проверяется, а срок действия - проверяется.
+	- Пользователи (UserInDB) по email хранятся в Redis (общий для воркеров кэш, ttl) и в процессе (local_ttl):
+	  пользователь читается из БД и записывается в Redis, только если его поколение не изменилось
+	  с момента промаха - иначе прочитанные до параллельного изменения данные затерли бы новые.
+
+	Изменяющий пользователя код сбрасывает запись после коммита (invalidate): поколение увеличивается,
+	 запись в Redis удаляется. Записи в процессах других воркеров живут не дольше local_ttl.
+	Если Redis недоступен, пользователи читаются из БД (с предупреждением в логах).
+	"""
+	_store_script = redis_client.register_script(STORE_USER_SCRIPT)
+
+	def __init__(self, maxsize: int, ttl: float, local_ttl: float):
+		self.ttl = ttl
+		self._tokens = TTLCache(maxsize=maxsize, ttl=ttl)
+		self._users = TTLCache(maxsize=maxsize, ttl=local_ttl)
+
+	@staticmethod
+	def key(email: str) -> str:
+		return f"{config.REDIS_CACHE_PREFIX}:user-auth:{email}"
+
+	@staticmethod
+	def generation_key(email: str) -> str:
+		return f"{config.REDIS_CACHE_PREFIX}:user-auth-generation:{email}"
+
+	def token_subject(self, token: str) -> str | None:
+		"""
+		Email из уже проверенного и не истекшего токена (None - токен еще не проверялся).
+		"""
+		cached = self._tokens.get(token)
+		if cached is None:
+			return
+		email, expires_at = cached
+		if expires_at <= time.time():
+			self._tokens.delete(token)
+			return
+		return email
+
+	def remember_token(self, token: str, email: str, expires_at: float) -> None:
+		self._tokens.set(token, (email, expires_at))
+
+	async def get(self, email: str) -> tuple[schemas_users.UserInDB | None, str | None]:
+		"""
+		Закэшированный пользователь (None - нет) и текущее поколение (None - кэш недоступен).
+		"""
+		user = self._users.get(email)
+		if user is not None:
+			return user.copy(), None
+		try:
+			value, generation = await redis_client.mget(self.key(email), self.generation_key(email))
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"User auth cache is unavailable: {e}")
+			return None, None
+		if value is None:
+			return None, (generation or b"").decode()
+		user = schemas_users.UserInDB.parse_raw(value)
+		self._users.set(email, user)
+		return user.copy(), None
+
+	async def fill(self, user: schemas_users.UserInDB, generation: str | None) -> None:
+		"""
+		Запись прочитанного из БД пользователя (если поколение не изменилось).
+		"""
+		if generation is None:
+			return
+		try:
+			stored = await self._store_script(
+				keys=[self.key(user.email), self.generation_key(user.email)],
+				args=[generation, user.json(), int(self.ttl * 1000)]
+			)
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"User auth cache wasn't updated: {e}")
+			return
+		if stored:
+			self._users.set(user.email, user.copy())
+
+	async def invalidate(self, *emails: str) -> None:
+		"""
+		Сброс пользователей (после коммита их изменения или удаления).
+		"""
+		for email in emails:
+			self._users.delete(email)
+		try:
+			async with redis_client.pipeline(transaction=True) as pipe:
+				for email in emails:
+					pipe.incr(self.generation_key(email))
+					pipe.pexpire(self.generation_key(email), int(self.ttl * 10 * 1000))
+					pipe.delete(self.key(email))
+				await pipe.execute()
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"User auth cache wasn't invalidated (expires in {self.ttl}s): {e}")
+
+	async def clear(self) -> None:
+		self._tokens.clear()
+		self._users.clear()
+		async for key in redis_client.scan_iter(match=self.key("*")):
+			await redis_client.delete(key)
+
+
+# пользователи по access-токенам (app.dependencies.users) - в процессе и общий для воркеров кэш в Redis
+user_auth_cache = UserAuthCache(
+	maxsize=config.USER_AUTH_CACHE_MAXSIZE, ttl=config.USER_AUTH_CACHE_TTL, local_ttl=config.USER_AUTH_LOCAL_CACHE_TTL
+)
+
+
+def cache_tag_key(tag: CacheTagEnum) -> str:
+	return f"{config.REDIS_CACHE_PREFIX}:cache-tag:{tag.value}"
+
+
+def cache_key_builder(*tags: CacheTagEnum, **fields: tuple[str, ...]) -> Callable[..., Awaitable[str]]:
+	"""
+	Ключ кэша ответа эндпоинта (key_builder для fastapi_cache.decorator.cache).
+
+	В ключ входят только параметры, от которых зависит ответ: сессии БД пропускаются, а у объектов из fields
+	 (название параметра эндпоинта -> поля) берутся только указанные поля (например, роль и регион пользователя),
+	 остальные параметры - целиком.
+	Еще в ключ входят версии тегов (tags): при изменении данных тег сбрасывается (invalidate_cache),
+	 и все ответы с ним перестают находиться - до истечения их срока хранения.
+	"""
+	async def key_builder(func: Callable, namespace: str = "", request: Any = None, response: Any = None,
+						  args: tuple = (), kwargs: dict[str, Any] | None = None) -> str:
+		params = {}
+		for name, value in sorted((kwargs or {}).items()):
+			if isinstance(value, AsyncSession):
+				continue
+			if name in fields:
+				value = {field: getattr(value, field) for field in fields[name]}
+			params[name] = jsonable_encoder(value)
+		try:
+			versions = await redis_client.mget(*(cache_tag_key(tag) for tag in tags)) if tags else []
+		except (OSError, redis.exceptions.ConnectionError):
+			versions = []  # ответы все равно не закэшируются
+		params["tags"] = {tag.value: int(version or 0) for tag, version in zip(tags, versions)}
+		params_hash = hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()
+		return f"{FastAPICache.get_prefix()}:{namespace}:{func.__module__}:{func.__name__}:{params_hash}"
+	return key_builder
+
+
+async def invalidate_cache(*tags: CacheTagEnum) -> None:
+	"""
+	Сброс закэшированных ответов эндпоинтов с тегами tags (после коммита изменений).
+	"""
+	try:
+		async with redis_client.pipeline(transaction=False) as pipe:
+			for tag in tags:
+				pipe.incr(cache_tag_key(tag))
+			await pipe.execute()
+	except (OSError, redis.exceptions.ConnectionError) as e:
+		logger.warning(f"Endpoints cache wasn't invalidated (tags: {[tag.value for tag in tags]}): {e}")
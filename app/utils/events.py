@@ -0,0 +1,112 @@
+import asyncio
+import json
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager, suppress
+from typing import Any, AsyncIterator
+
+import redis
+from loguru import logger
+
+import config
+from ..database import redis_client
+
+STATION_EVENTS_CHANNELS_PREFIX = f"{config.REDIS_CACHE_PREFIX}:station-events:"
+
+
+def station_events_channel(station_id: uuid.UUID) -> str:
+	return f"{STATION_EVENTS_CHANNELS_PREFIX}{station_id}"
+
+
+# событие изменения набора данных станции (JSON): набор, его новая версия (как в ETag набора -
+#  "эпоха.счетчик", см. app.utils.cache.StationDataCache.version) и новые данные (null - набор нужно перечитать);
+#  публикуется из Lua-скриптов кэша - в том же вызове, что и изменение версии
+STATION_EVENT_LUA = """
+local function station_event(hash, dataset, data)
+	local version = redis.call('hget', hash, 'epoch') .. '.' .. redis.call('hget', hash, dataset .. ':version')
+	return '{"dataset": "' .. dataset .. '", "version": "' .. version .. '", "data": ' .. (data or 'null') .. '}'
+end
+"""
+
+
+class StationEventsHub:
+	"""
+	Раздача событий изменения данных станций (Redis pub/sub) подключенным к воркеру станциям.
+
+	События публикуются в канал станции при изменении ее наборов данных (см. app.utils.cache.StationDataCache),
+	 поэтому доходят до станции, к какому бы воркеру она ни была подключена.
+	Воркер слушает все каналы станций одним соединением (PSUBSCRIBE) и раскладывает события по очередям
+	 подключенных к нему станций; если очередь переполнена (станция не успевает читать) - старые события отбрасываются.
+	До подписки события не копятся: после подключения станция должна перечитать свои данные.
+	"""
+	def __init__(self, queue_size: int, reconnect_interval: float):
+		self.queue_size = queue_size
+		self.reconnect_interval = reconnect_interval
+		self._queues: dict[str, set[asyncio.Queue[dict[str, Any]]]] = defaultdict(set)
+		self._task: asyncio.Task | None = None
+		self._ready: asyncio.Event | None = None
+
+	async def start(self, timeout: float) -> None:
+		"""
+		Запуск прослушивания (при первом подключении станции).
+		Если подписаться на каналы за timeout не удалось (Redis недоступен) - ConnectionError.
+		"""
+		if self._task is None or self._task.done():
+			self._ready = asyncio.Event()
+			self._task = asyncio.create_task(self._run())
+		try:
+			await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+		except asyncio.TimeoutError:
+			raise ConnectionError("Station events are unavailable now")
+
+	async def stop(self) -> None:
+		"""
+		Остановка прослушивания (при отключении сервера).
+		"""
+		if self._task is None:
+			return
+		self._task.cancel()
+		with suppress(asyncio.CancelledError):
+			await self._task
+		self._task = None
+
+	@asynccontextmanager
+	async def subscribe(self, station_id: uuid.UUID) -> AsyncIterator[asyncio.Queue[dict[str, Any]]]:
+		"""
+		Очередь событий станции (пока станция подключена).
+		"""
+		channel = station_events_channel(station_id)
+		queue = asyncio.Queue(maxsize=self.queue_size)
+		self._queues[channel].add(queue)
+		try:
+			yield queue
+		finally:
+			self._queues[channel].discard(queue)
+			if not self._queues[channel]:
+				del self._queues[channel]
+
+	def _dispatch(self, channel: str, event: dict[str, Any]) -> None:
+		for queue in self._queues.get(channel, ()):
+			if queue.full():
+				queue.get_nowait()
+			queue.put_nowait(event)
+
+	async def _run(self) -> None:
+		while True:
+			try:
+				async with redis_client.pubsub() as pubsub:
+					await pubsub.psubscribe(f"{STATION_EVENTS_CHANNELS_PREFIX}*")
+					self._ready.set()
+					async for message in pubsub.listen():
+						if message["type"] == "pmessage":
+							self._dispatch(message["channel"].decode(), json.loads(message["data"]))
+			except (OSError, redis.exceptions.ConnectionError) as e:
+				logger.warning(f"Station events listening error (reconnecting in {self.reconnect_interval}s): {e}")
+			self._ready.clear()
+			await asyncio.sleep(self.reconnect_interval)
+
+
+station_events = StationEventsHub(
+	queue_size=config.STATION_EVENTS_QUEUE_SIZE,
+	reconnect_interval=config.STATION_EVENTS_RECONNECT_INTERVAL
+)
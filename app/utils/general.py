@@ -1,3 +1,5 @@
+import base64
+import binascii
 import json
 import random
 from datetime import timedelta, datetime, timezone
@@ -20,6 +22,7 @@ from ..schemas.schemas_token import Token, RefreshToken
 def verify_data_hash(data, hashed_data) -> bool:
 	"""
 	Сравнение хешей данных (паролей, email-кодов, ...).
+	Блокирующее: в обработчиках запросов - app.utils.hashing.data_hashing.
 	"""
 	return config.pwd_context.verify(data, hashed_data)
 
@@ -27,6 +30,7 @@ def verify_data_hash(data, hashed_data) -> bool:
 def get_data_hash(data: str) -> str:
 	"""
 	Хеширование данных (пароль, email-код, ...).
+	Блокирующее: в обработчиках запросов - app.utils.hashing.data_hashing.
 	"""
 	return config.pwd_context.hash(data)
 
@@ -157,3 +161,52 @@ def get_sa_tree(rows):
 			result.append(instance)
 			prev_row = row
 	return result
+
+
+def encode_logs_cursor(timestamp: datetime, id_: int) -> str:
+	"""
+	Непрозрачный курсор для постраничного получения логов: (время, ИД) последнего лога страницы.
+	"""
+	data = json.dumps([timestamp.isoformat(), id_])
+	return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_logs_cursor(cursor: str) -> tuple[datetime, int]:
+	"""
+	Расшифровка курсора логов (ValueError, если курсор невалиден).
+	"""
+	try:
+		timestamp, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+		return datetime.fromisoformat(timestamp), int(id_)
+	except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+		raise ValueError("Invalid cursor") from e
+
+
+def encode_etag(version: int | str) -> str:
+	"""
+	ETag записи по ее версии.
+	"""
+	return f'"{version}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+	"""
+	Совпадает ли ETag с одним из перечисленных в заголовке If-None-Match (сравнение без учета W/).
+	"""
+	if not if_none_match:
+		return False
+	tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+	return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def decode_etag(etag: str) -> int:
+	"""
+	Версия записи из ETag (заголовок If-Match). ValueError, если ETag невалиден.
+	"""
+	value = etag.strip()
+	if value.startswith("W/"):
+		value = value[2:]
+	try:
+		return int(value.strip('"'))
+	except ValueError as e:
+		raise ValueError("Invalid ETag") from e
@@ -0,0 +1,64 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from loguru import logger
+
+import config
+
+
+class DataHashingPool:
+	"""
+	Хеширование и проверка хешей (bcrypt) в ограниченном пуле потоков - вне event loop.
+
+	Один хеш bcrypt считается сотни миллисекунд; в event loop это останавливало бы все запросы воркера
+	 (в т.ч. станций) на время каждого входа пользователя. bcrypt отпускает GIL, поэтому хватает потоков.
+	Одновременно считается не больше max_workers хешей, остальные ждут в очереди пула;
+	 глубина очереди - queue_depth (при превышении queue_warning_threshold - предупреждение в логах).
+	"""
+	def __init__(self, max_workers: int, queue_warning_threshold: int):
+		self.max_workers = max_workers
+		self.queue_warning_threshold = queue_warning_threshold
+		self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="data-hashing")
+		self._pending = 0
+
+	@property
+	def queue_depth(self) -> int:
+		"""
+		Количество ожидающих в очереди (еще не начатых) хеширований.
+		"""
+		return max(self._pending - self.max_workers, 0)
+
+	async def hash(self, data: str) -> str:
+		"""
+		Хеширование данных (пароль, email-код, ...).
+		"""
+		return await self._run(config.pwd_context.hash, data)
+
+	async def verify(self, data: str, hashed_data: str) -> bool:
+		"""
+		Сравнение хешей данных.
+		"""
+		return await self._run(config.pwd_context.verify, data, hashed_data)
+
+	async def verify_and_update(self, data: str, hashed_data: str) -> tuple[bool, str | None]:
+		"""
+		Сравнение хешей данных и, если хеш посчитан с устаревшими параметрами (config.PASSWORD_HASHING_ROUNDS),
+		 новый хеш (иначе None).
+		"""
+		return await self._run(config.pwd_context.verify_and_update, data, hashed_data)
+
+	async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+		self._pending += 1
+		try:
+			if self.queue_depth > self.queue_warning_threshold:
+				logger.warning(f"Data hashing queue depth: {self.queue_depth}")
+			return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+		finally:
+			self._pending -= 1
+
+
+data_hashing = DataHashingPool(
+	max_workers=config.PASSWORD_HASHING_WORKERS,
+	queue_warning_threshold=config.PASSWORD_HASHING_QUEUE_WARNING_THRESHOLD
+)
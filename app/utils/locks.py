@@ -0,0 +1,90 @@
+import asyncio
+import uuid
+
+import redis
+from loguru import logger
+
+import config
+from ..database import redis_client
+from ..exceptions import UpdatingError
+
+# удаление ключа блокировки, только если она все еще наша (не истекла и не перехвачена)
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+	return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class StationLock:
+	"""
+	Блокировка действий по логам одной станции между воркерами (Redis, ключ - ИД станции).
+	Действия разных станций выполняются параллельно, одной станции - строго по очереди.
+
+	Блокировка берется на lease секунд (SET NX PX): если воркер упал, не сняв ее, она истечет сама.
+	Каждому захвату выдается fencing token - монотонно растущий номер (INCR) - он и хранится в ключе.
+	Перед коммитом изменений нужно проверить (check), что блокировка все еще наша: если lease истек
+	 и блокировку взял другой воркер - UpdatingError. От записи поверх более новых данных в оставшемся
+	 промежутке защищают версии состояния станции (VersionConflictError).
+
+	Если Redis недоступен - действия выполняются без блокировки (с предупреждением в логах).
+	"""
+	_release_script = redis_client.register_script(RELEASE_LOCK_SCRIPT)
+
+	def __init__(self, station_id: uuid.UUID, lease: float = config.STATION_LOCK_LEASE,
+				 wait_timeout: float = config.STATION_LOCK_WAIT_TIMEOUT,
+				 retry_interval: float = config.STATION_LOCK_RETRY_INTERVAL):
+		self.station_id = station_id
+		self.lease = lease
+		self.wait_timeout = wait_timeout
+		self.retry_interval = retry_interval
+		self.key = f"{config.REDIS_CACHE_PREFIX}:station-lock:{station_id}"
+		self.token: int | None = None
+
+	async def __aenter__(self):
+		try:
+			await self.acquire()
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"Station {self.station_id} lock wasn't acquired (Redis is unavailable): {e}")
+			self.token = None
+		return self
+
+	async def __aexit__(self, exc_type, exc_val, exc_tb):
+		if self.token is not None:
+			try:
+				await self.release()
+			except (OSError, redis.exceptions.ConnectionError) as e:
+				logger.warning(f"Station {self.station_id} lock wasn't released (expires in {self.lease}s): {e}")
+
+	async def acquire(self) -> int:
+		"""
+		Ожидание блокировки (не дольше wait_timeout, иначе - UpdatingError).
+		:return: fencing token
+		"""
+		token = await redis_client.incr(f"{self.key}:fence")
+		loop = asyncio.get_running_loop()
+		deadline = loop.time() + self.wait_timeout
+		while not await redis_client.set(self.key, token, nx=True, px=int(self.lease * 1000)):
+			if loop.time() >= deadline:
+				raise UpdatingError(f"Station {self.station_id} is busy: previous actions are still in progress")
+			await asyncio.sleep(self.retry_interval)
+		self.token = token
+		return token
+
+	async def check(self) -> None:
+		"""
+		Блокировка все еще наша (lease не истек), иначе - UpdatingError.
+		"""
+		if self.token is None:
+			return
+		try:
+			current_token = await redis_client.get(self.key)
+		except (OSError, redis.exceptions.ConnectionError):
+			return
+		if current_token is None or int(current_token) != self.token:
+			raise UpdatingError(f"Station {self.station_id} lock lease ({self.lease}s) has expired")
+
+	async def release(self) -> None:
+		await self._release_script(keys=[self.key], args=[self.token])
+		self.token = None
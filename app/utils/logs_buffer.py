@@ -0,0 +1,196 @@
+import asyncio
+import datetime
+from collections import deque
+from contextlib import suppress
+from typing import Any
+
+from loguru import logger
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError, DataError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import config
+from ..database import async_session_maker
+from ..models.logs import Log
+
+
+class LogsWriteBehindBuffer:
+	"""
+	Отложенная запись (write-behind) логов станций, после которых не нужно никаких действий.
+
+	Лог получает ИД (из последовательности таблицы logs, заранее блоком) и время создания сразу,
+	 ставится в ограниченную очередь и записывается в БД фоновой задачей раз в flush_interval
+	 (один multi-row INSERT на пачку).
+	Если очередь заполнена дольше put_timeout - лог не ставится в очередь, а записывается сразу (backpressure).
+	При отключении сервера очередь записывается полностью (stop).
+
+	Если пачку не удалось записать из-за БД (потеря соединения, переключение на реплику и т.п.), она возвращается
+	 в начало очереди, а запись повторяется с растущей паузой (до max_retry_delay). Запись идемпотентна
+	 (ИД логов заданы заранее, повторы пропускаются), поэтому повтор уже записанной пачки ничего не дублирует.
+	Отбрасываются только логи, которые не записываются сами по себе (например, станция уже удалена).
+
+	Очередь локальная для процесса: до записи лог не виден при получении логов станции,
+	 а при аварийном завершении процесса - теряется. Поэтому режим включается явно (config.LOGS_WRITE_BEHIND).
+	"""
+	def __init__(self, session_maker: sessionmaker, maxsize: int, flush_interval: float, flush_batch_size: int,
+				 put_timeout: float, ids_block_size: int,
+				 max_retry_delay: float = config.LOGS_WRITE_BEHIND_MAX_RETRY_DELAY,
+				 stop_retries: int = config.LOGS_WRITE_BEHIND_STOP_RETRIES):
+		self.session_maker = session_maker
+		self.maxsize = maxsize
+		self.flush_interval = flush_interval
+		self.flush_batch_size = flush_batch_size
+		self.put_timeout = put_timeout
+		self.ids_block_size = ids_block_size
+		self.max_retry_delay = max_retry_delay
+		self.stop_retries = stop_retries
+		self._queue: asyncio.Queue[dict[str, Any]] | None = None
+		self._retry: deque[dict[str, Any]] = deque()
+		self._task: asyncio.Task | None = None
+		self._ids: list[int] = []
+		self._ids_lock: asyncio.Lock | None = None
+
+	@property
+	def active(self) -> bool:
+		return self._task is not None and not self._task.done()
+
+	@property
+	def pending(self) -> int:
+		"""
+		Количество еще не записанных логов.
+		"""
+		return len(self._retry) + (self._queue.qsize() if self._queue is not None else 0)
+
+	async def start(self) -> None:
+		"""
+		Запуск периодической записи (при старте сервера).
+		"""
+		if self.active:
+			return
+		self._queue = asyncio.Queue(maxsize=self.maxsize)
+		self._ids_lock = asyncio.Lock()
+		self._task = asyncio.create_task(self._run())
+
+	async def stop(self) -> None:
+		"""
+		Остановка периодической записи и запись всех оставшихся в очереди логов (при отключении сервера).
+		Если БД недоступна - еще stop_retries попыток с растущей паузой, затем оставшиеся логи теряются
+		 (в логах - сколько).
+		"""
+		if self._task is None:
+			return
+		self._task.cancel()
+		with suppress(asyncio.CancelledError):
+			await self._task
+		self._task = None
+		delay = self.flush_interval
+		for attempt in range(self.stop_retries + 1):
+			try:
+				while await self.flush():
+					pass
+				return
+			except Exception as e:
+				logger.error(f"Buffered logs flushing error: {e}")
+			if attempt < self.stop_retries:
+				await asyncio.sleep(delay)
+				delay = min(delay * 2, self.max_retry_delay)
+		logger.error(f"{self.pending} buffered logs weren't written")
+
+	async def prepare(self, data: dict[str, Any]) -> dict[str, Any]:
+		"""
+		Заполнение ИД и времени создания лога (как если бы он уже был записан в БД).
+		"""
+		async with self._ids_lock:
+			if not self._ids:
+				await self._reserve_ids()
+			log_id = self._ids.pop(0)
+		return dict(data, id=log_id, timestamp=datetime.datetime.now(datetime.timezone.utc))
+
+	async def put(self, data: dict[str, Any]) -> bool:
+		"""
+		Постановка подготовленного лога в очередь.
+		Если очередь так и не освободилась за put_timeout - False (лог нужно записать сразу).
+		"""
+		try:
+			await asyncio.wait_for(self._queue.put(data), timeout=self.put_timeout)
+		except asyncio.TimeoutError:
+			logger.warning(f"Logs write-behind queue is full ({self.maxsize}), log {data['id']} will be written directly")
+			return False
+		return True
+
+	async def flush(self) -> int:
+		"""
+		Запись пачки логов из очереди (не больше flush_batch_size; сначала - возвращенные после неудачной
+		 записи).
+		Если в пачке есть логи, которые не записываются сами по себе (например, станция уже удалена),
+		 логи записываются по одному - такие логируются и отбрасываются.
+		При любой другой ошибке незаписанные логи возвращаются в начало очереди, а ошибка пробрасывается.
+		:return: количество взятых из очереди логов
+		"""
+		items = []
+		while len(items) < self.flush_batch_size and self._retry:
+			items.append(self._retry.popleft())
+		while len(items) < self.flush_batch_size and not self._queue.empty():
+			items.append(self._queue.get_nowait())
+		if not items:
+			return 0
+		unwritten = list(items)
+		try:
+			async with self.session_maker() as session:
+				try:
+					await self._insert(session, items)
+					unwritten.clear()
+				except (IntegrityError, DataError):
+					await session.rollback()
+					dropped = 0
+					while unwritten:
+						try:
+							await self._insert(session, unwritten[:1])
+						except (IntegrityError, DataError) as e:
+							await session.rollback()
+							dropped += 1
+							logger.error(f"Buffered log wasn't written: {unwritten[0]}. Error: {e}")
+						unwritten.pop(0)
+					if dropped:
+						logger.error(f"{dropped} buffered logs were dropped")
+		except BaseException:  # в т.ч. отмена задачи (stop) посреди записи
+			self._retry.extendleft(reversed(unwritten))
+			raise
+		return len(items)
+
+	@staticmethod
+	async def _insert(session: AsyncSession, items: list[dict[str, Any]]) -> None:
+		await session.execute(insert(Log).on_conflict_do_nothing(), items)
+		await session.commit()
+
+	async def _reserve_ids(self) -> None:
+		sequence = func.pg_get_serial_sequence(Log.__tablename__, Log.id.name)
+		async with self.session_maker() as session:
+			self._ids = list((await session.scalars(
+				select(func.nextval(sequence)).select_from(func.generate_series(1, self.ids_block_size))
+			)).all())
+
+	async def _run(self) -> None:
+		delay = self.flush_interval
+		while True:
+			await asyncio.sleep(delay)
+			try:
+				while await self.flush() == self.flush_batch_size:
+					pass
+			except Exception as e:  # фоновая задача не должна падать; повтор - с растущей паузой
+				delay = min(delay * 2, self.max_retry_delay)
+				logger.error(f"Buffered logs flushing error ({self.pending} logs pending, retry in {delay}s): {e}")
+			else:
+				delay = self.flush_interval
+
+
+logs_buffer = LogsWriteBehindBuffer(
+	session_maker=async_session_maker,
+	maxsize=config.LOGS_WRITE_BEHIND_QUEUE_SIZE,
+	flush_interval=config.LOGS_WRITE_BEHIND_FLUSH_INTERVAL,
+	flush_batch_size=config.LOGS_WRITE_BEHIND_FLUSH_BATCH_SIZE,
+	put_timeout=config.LOGS_WRITE_BEHIND_PUT_TIMEOUT,
+	ids_block_size=config.LOGS_WRITE_BEHIND_IDS_BLOCK_SIZE
+)
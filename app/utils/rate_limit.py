@@ -0,0 +1,66 @@
+import math
+
+import redis
+from loguru import logger
+
+import config
+from ..database import redis_client
+
+# token bucket: емкость - ARGV[1] запросов, полностью восполняется за ARGV[2] мс;
+#  возвращает {1, 0}, если запрос разрешен, иначе {0, через сколько мс появится свободный запрос}
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local rate = capacity / period
+local time = redis.call('time')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local bucket = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - ts, 0) * rate)
+local allowed, retry_after = 0, 0
+if tokens >= 1 then
+	tokens = tokens - 1
+	allowed = 1
+else
+	retry_after = math.ceil((1 - tokens) / rate)
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('pexpire', KEYS[1], period)
+return {allowed, retry_after}
+"""
+
+
+class RateLimiter:
+	"""
+	Ограничение частоты запросов (token bucket в Redis, общий для всех воркеров).
+
+	На каждый ключ (например, IP + email или ИД станции) - "ведро" на limit запросов, которое равномерно
+	 восполняется за period секунд: допускаются всплески до limit запросов, а в среднем - не больше limit за period.
+	Проверка и списание - одна атомарная операция (Lua), время берется из Redis (одно для всех воркеров).
+	Если Redis недоступен, запросы не ограничиваются (с предупреждением в логах).
+	"""
+	_script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+	def __init__(self, name: str):
+		self.name = name
+
+	def key(self, key: str) -> str:
+		return f"{config.REDIS_CACHE_PREFIX}:rate-limit:{self.name}:{key}"
+
+	async def hit(self, key: str, limit: int, period: float) -> float | None:
+		"""
+		Учет запроса. None - запрос разрешен, иначе - через сколько секунд можно повторить.
+		"""
+		try:
+			allowed, retry_after = await self._script(keys=[self.key(key)], args=[limit, int(period * 1000)])
+		except (OSError, redis.exceptions.ConnectionError) as e:
+			logger.warning(f"Rate limiter \"{self.name}\" is unavailable: {e}")
+			return
+		if not allowed:
+			return math.ceil(retry_after / 1000)
+
+
+# вход пользователей (по IP и email) и логи станций (по ИД станции); лимиты - в config
+login_rate_limiter = RateLimiter("login")
+station_logs_rate_limiter = RateLimiter("station-logs")
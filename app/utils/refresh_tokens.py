@@ -0,0 +1,72 @@
+import hashlib
+
+import config
+from ..database import redis_client
+
+# замена рефреш-токенов пользователя (KEYS[1] - множество хешей его токенов) новым (KEYS[2], ARGV[1]);
+#  без нового токена (ARGV[1] == '') - отзыв всех токенов пользователя
+REPLACE_USER_TOKENS_SCRIPT = """
+for _, digest in ipairs(redis.call('smembers', KEYS[1])) do
+	redis.call('del', ARGV[4] .. digest)
+end
+redis.call('del', KEYS[1])
+if ARGV[1] ~= '' then
+	redis.call('set', KEYS[2], ARGV[2], 'PX', ARGV[3])
+	redis.call('sadd', KEYS[1], ARGV[1])
+	redis.call('pexpire', KEYS[1], ARGV[3])
+end
+"""
+
+
+class RefreshTokensStore:
+	"""
+	Хранение рефреш-токенов в Redis (config.REFRESH_TOKENS_BACKEND = "redis", см. app.models.auth.RefreshToken).
+
+	Ключ - SHA-256 хеш токена (сами токены не хранятся), значение - ИД пользователя;
+	 токены истекают средствами Redis (срок жизни ключа), поэтому устаревшие записи не копятся.
+	Хеши токенов пользователя хранятся в его множестве - по нему токены отзываются (при выходе и новом входе:
+	 как и в таблице, у пользователя один действующий рефреш-токен).
+	"""
+	_replace_script = redis_client.register_script(REPLACE_USER_TOKENS_SCRIPT)
+
+	@staticmethod
+	def digest(token: str) -> str:
+		return hashlib.sha256(token.encode()).hexdigest()
+
+	@staticmethod
+	def token_key(digest: str) -> str:
+		return f"{config.REDIS_CACHE_PREFIX}:refresh-token:{digest}"
+
+	@staticmethod
+	def user_key(user_id: int) -> str:
+		return f"{config.REDIS_CACHE_PREFIX}:user-refresh-tokens:{user_id}"
+
+	async def save(self, user_id: int, token: str, ttl: float) -> None:
+		"""
+		Сохранение нового токена пользователя (прежние отзываются).
+		"""
+		digest = self.digest(token)
+		await self._replace(user_id, digest, ttl)
+
+	async def get_user_id(self, token: str) -> int | None:
+		"""
+		ИД пользователя по действующему токену (None - токен неизвестен или истек).
+		"""
+		user_id = await redis_client.get(self.token_key(self.digest(token)))
+		if user_id is not None:
+			return int(user_id)
+
+	async def revoke(self, user_id: int) -> None:
+		"""
+		Отзыв всех токенов пользователя.
+		"""
+		await self._replace(user_id, "", 0)
+
+	async def _replace(self, user_id: int, digest: str, ttl: float) -> None:
+		await self._replace_script(
+			keys=[self.user_key(user_id), self.token_key(digest)],
+			args=[digest, user_id, int(ttl * 1000), self.token_key("")]
+		)
+
+
+refresh_tokens_store = RefreshTokensStore()
@@ -0,0 +1,91 @@
+import datetime
+import gzip
+import os
+from collections import defaultdict
+from typing import Any, Type
+
+from loguru import logger
+from pydantic import BaseModel
+from sqlalchemy import select, delete, tuple_, case, func, null, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+import services
+from ..models.logs import Log, Error
+from ..schemas import schemas_logs
+
+# модель, схема для архива, сроки хранения по кодам, срок хранения по умолчанию
+RETENTION_PARAMS = (
+	(Log, schemas_logs.Log, services.LOGS_RETENTION_POLICIES, services.LOGS_RETENTION_DEFAULT_PERIOD),
+	(Error, schemas_logs.Error, services.ERRORS_RETENTION_POLICIES, services.ERRORS_RETENTION_DEFAULT_PERIOD)
+)
+
+
+def expiration_time(model: Type[Log | Error], policies: dict[int | float, datetime.timedelta | None],
+					default_period: datetime.timedelta | None, now: datetime.datetime) -> Any:
+	"""
+	SQL-выражение: время, раньше которого лог считается устаревшим (NULL - хранится всегда).
+	Целый ключ в policies - раздел кодов (например, 6 - все 6.x), дробный - точный код.
+	"""
+	def limit(period: datetime.timedelta | None):
+		return literal(now - period) if period is not None else null()
+
+	codes = [(model.code == code, limit(period)) for code, period in policies.items() if not isinstance(code, int)]
+	sections = [(func.floor(model.code) == section, limit(period)) for section, period in policies.items()
+				if isinstance(section, int)]
+	if not codes and not sections:
+		return limit(default_period)
+	return case(*codes, *sections, else_=limit(default_period))
+
+
+async def apply_retention(db: AsyncSession, archive_dir: str = config.LOGS_ARCHIVE_DIR,
+						  batch_size: int = config.LOGS_RETENTION_BATCH_SIZE,
+						  now: datetime.datetime | None = None) -> dict[str, int]:
+	"""
+	Удаление устаревших логов и ошибок (сроки хранения - в services) с сохранением в архив.
+
+	Удаляется пачками по batch_size строк (каждая - в своей транзакции, заблокированные строки пропускаются),
+	 чтобы не держать долгих блокировок. Удаленные строки дописываются в gzip-JSONL файлы по дням
+	 ({archive_dir}/{table}/{YYYY-MM}/{YYYY-MM-DD}.jsonl.gz) до коммита: при ошибке строки останутся в БД,
+	 а в архиве могут повториться.
+	:return: количество удаленных строк по таблицам
+	"""
+	now = now or datetime.datetime.now(datetime.timezone.utc)
+	result = {}
+	for model, schema, policies, default_period in RETENTION_PARAMS:
+		table = model.__tablename__
+		result[table] = 0
+		periods = [period for period in (*policies.values(), default_period) if period is not None]
+		if not periods:
+			continue
+		expired = select(model.id, model.timestamp).where(
+			(model.timestamp < now - min(periods))  # для отсечения партиций
+			& (model.timestamp < expiration_time(model, policies, default_period, now))
+		).order_by(model.timestamp).limit(batch_size).with_for_update(skip_locked=True)
+		query = delete(model).where(tuple_(model.id, model.timestamp).in_(expired)).returning(model) \
+			.execution_options(synchronize_session=False)
+
+		while True:
+			rows = (await db.scalars(query)).all()
+			if rows:
+				archive(rows, schema, os.path.join(archive_dir, table))
+			await db.commit()
+			result[table] += len(rows)
+			if len(rows) < batch_size:
+				break
+		logger.info(f"Retention: {result[table]} rows was deleted from \"{table}\"")
+	return result
+
+
+def archive(rows: list[Log | Error], schema: Type[BaseModel], directory: str) -> None:
+	"""
+	Дописывание строк в архивные файлы по дням.
+	"""
+	lines = defaultdict(list)
+	for row in rows:
+		lines[row.timestamp.astimezone(datetime.timezone.utc).date()].append(schema.from_orm(row).json())
+	for date, date_lines in lines.items():
+		path = os.path.join(directory, date.strftime("%Y-%m"), f"{date.isoformat()}.jsonl.gz")
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with gzip.open(path, "at", encoding="utf-8") as archive_file:
+			archive_file.write("\n".join(date_lines) + "\n")
@@ -48,6 +48,28 @@ CUSTOM_EXCEPTIONS_OUTPUT_PARAMS["level"] = "ERROR"
 # http logging params
 STD_LOGS_GETTING_AMOUNT = 50
 MAX_LOGS_GETTING_AMOUNT = 500
+MAX_STATIONS_GETTING_AMOUNT = 500
+MAX_LOGS_BATCH_SIZE = 200
+LOGS_EXPORT_CHUNK_SIZE = 1000  # строк за одно чтение серверного курсора при выгрузке логов
+LOGS_STATS_REFRESH_INTERVAL = 300  # seconds, пересчет почасовой статистики логов (app.tasks.refresh_logs_stats)
+MAX_LOGS_STATS_ROWS = 10_000
+
+# отложенная запись логов станций без действий (app.utils.logs_buffer.logs_buffer)
+LOGS_WRITE_BEHIND = False
+LOGS_WRITE_BEHIND_QUEUE_SIZE = 10_000
+LOGS_WRITE_BEHIND_FLUSH_INTERVAL = 1  # seconds
+LOGS_WRITE_BEHIND_FLUSH_BATCH_SIZE = 1000
+LOGS_WRITE_BEHIND_PUT_TIMEOUT = 0.5  # seconds
+LOGS_WRITE_BEHIND_IDS_BLOCK_SIZE = 100
+LOGS_WRITE_BEHIND_MAX_RETRY_DELAY = 30  # seconds (пауза между повторами записи, если БД недоступна)
+LOGS_WRITE_BEHIND_STOP_RETRIES = 5  # повторы записи оставшихся логов при отключении сервера
+
+# месячные партиции логов и ошибок: на сколько месяцев вперед создавать (python manage.py create_partitions)
+LOGS_PARTITIONS_MONTHS_AHEAD = 3
+
+# удаление устаревших логов и ошибок (python manage.py retention, сроки - в services)
+LOGS_ARCHIVE_DIR = "archive"  # удаляемые логи сохраняются сюда: {table}/{YYYY-MM}/{YYYY-MM-DD}.jsonl.gz
+LOGS_RETENTION_BATCH_SIZE = 1000  # сколько строк удаляется за одну транзакцию
 
 # alembic: commands for initializing migrations
 ALEMBIC_MIGRATION_CMD = "alembic upgrade head"
@@ -62,18 +84,62 @@ STARTING_APP_CMD_DEBUG_MODE = "uvicorn app.main:app"
 STARTING_APP_CMD = "gunicorn app.main:app --workers 1 --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000"
 
 # users passwords hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+PASSWORD_HASHING_ROUNDS = 12  # при изменении хеши паролей пересчитываются при входе пользователей
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=PASSWORD_HASHING_ROUNDS)
+# пул потоков для хеширования (app.utils.hashing.data_hashing)
+PASSWORD_HASHING_WORKERS = 2
+PASSWORD_HASHING_QUEUE_WARNING_THRESHOLD = 20
 
 # jwt token params
 JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY")
 JWT_SIGN_ALGORITHM = "HS256"
 
+# хранилище рефреш-токенов: "db" - таблица refresh_token, "redis" - хеши токенов в Redis (app.utils.refresh_tokens);
+#  при переходе на "redis" действующие токены переносятся командой python manage.py migrate_refresh_tokens
+REFRESH_TOKENS_BACKEND = "db"
+
 # redis params
 REDIS_HOST = f"redis://{os.environ.get('REDIS_HOST')}"
 REDIS_PORT = os.environ.get("REDIS_PORT")
 REDIS_URL = f"{REDIS_HOST}:{REDIS_PORT}"
 REDIS_CACHE_PREFIX = "lfs-cache"
 
+# in-process кэш аутентификации станций (app.utils.cache.station_auth_cache);
+#  записи сбрасываются во всех воркерах через поколение станции в Redis, TTL ограничивает только время хранения
+STATION_AUTH_CACHE_TTL = 30  # seconds
+STATION_AUTH_CACHE_MAXSIZE = 10_000
+
+# кэш аутентификации пользователей по access-токенам (app.utils.cache.user_auth_cache)
+USER_AUTH_CACHE_TTL = 60  # seconds (в Redis и для проверенных токенов)
+USER_AUTH_LOCAL_CACHE_TTL = 5  # seconds (в процессе: столько могут расходиться воркеры после изменения пользователя)
+USER_AUTH_CACHE_MAXSIZE = 10_000
+
+# ограничение частоты запросов (app.utils.rate_limit): (запросов, за сколько секунд)
+LOGIN_RATE_LIMIT = (10, 60)  # попытки входа по IP и email
+STATION_LOGS_RATE_LIMIT = (600, 60)  # логи/ошибки/пакеты логов по ИД станции
+
+# накопление времени последних действий пользователей в Redis (app.utils.activity.users_activity)
+USERS_ACTIVITY_FLUSH_INTERVAL = 30  # seconds, запись в БД (app.tasks.flush_users_activity)
+USERS_ACTIVITY_FLUSH_BATCH_SIZE = 1000
+
+# общий кэш наборов данных станций в Redis (app.utils.cache.station_data_cache)
+STATION_DATA_CACHE_TTL = 10 * 60  # seconds
+
+# поток изменений данных станции (app.utils.events, GET /v1/stations/me/events)
+STATION_EVENTS_HEARTBEAT_INTERVAL = 15  # seconds
+STATION_EVENTS_STREAM_DURATION = 60 * 60  # seconds (после - станция переподключается)
+STATION_EVENTS_SUBSCRIBE_TIMEOUT = 5  # seconds
+STATION_EVENTS_RECONNECT_INTERVAL = 1  # seconds
+STATION_EVENTS_QUEUE_SIZE = 100
+
+# сколько раз повторять изменение состояния станции по логу, если его параллельно изменили (не совпала версия)
+STATION_UPDATE_ATTEMPTS = 3
+
+# блокировка действий по логам станции между воркерами (app.utils.locks.StationLock)
+STATION_LOCK_LEASE = 10  # seconds
+STATION_LOCK_WAIT_TIMEOUT = 5  # seconds
+STATION_LOCK_RETRY_INTERVAL = 0.02  # seconds
+
 # STATIC FILES DIR
 STATIC_FILES_DIR = "app/static"
 HTML_TEMPLATES_DIR = STATIC_FILES_DIR + "/templates"
@@ -29,6 +29,7 @@ from config import DATABASE_URL_TEST, DATABASE_URL_SYNC_TEST
 from app.dependencies import get_async_session, get_sync_session
 from app.main import app
 from app import fastapi_cache_init
+from app.utils.cache import user_auth_cache
 from tests.additional.users import create_authorized_user, generate_user_data, create_user, create_multiple_users
 from tests.additional.stations import generate_station
 
@@ -95,6 +96,7 @@ async def prepare_app():
         await conn.run_sync(Base.metadata.create_all)
 
     await fastapi_cache_init()  # для работы кеширования при тестах
+    await user_auth_cache.clear()  # пользователи из прошлых запусков (ИД начинаются заново)
 
     yield
 
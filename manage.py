@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import datetime
+import uuid
+
+import config
+
+
+async def backfill_activity(station_id: uuid.UUID | None = None) -> None:
+	"""
+	Пересборка сводки активности станций (station_activity) по истории логов и ошибок.
+	"""
+	from app.database import async_session_maker
+	from app.models.logs import StationActivity
+
+	async with async_session_maker() as session:
+		await StationActivity.rebuild(session, station_id)
+
+
+async def create_partitions(months: int, since: datetime.date | None = None) -> None:
+	"""
+	Создание месячных партиций логов и ошибок заранее (запускать регулярно, например, раз в месяц по cron).
+	"""
+	from loguru import logger
+	from app.database import async_session_maker
+	from app.models.logs import create_monthly_partitions
+
+	async with async_session_maker() as session:
+		created = await create_monthly_partitions(session, months, since)
+	logger.info(f"Created partitions: {', '.join(created) or 'none'}")
+
+
+async def retention() -> None:
+	"""
+	Удаление устаревших логов и ошибок с сохранением в архив (сроки хранения - в services).
+	"""
+	from app.database import async_session_maker
+	from app.utils.retention import apply_retention
+
+	async with async_session_maker() as session:
+		await apply_retention(session)
+
+
+async def migrate_refresh_tokens() -> None:
+	"""
+	Перенос действующих рефреш-токенов из таблицы в Redis (при переходе на REFRESH_TOKENS_BACKEND = "redis").
+	"""
+	from loguru import logger
+	from app.database import async_session_maker
+	from app.models.auth import RefreshToken
+
+	async with async_session_maker() as session:
+		migrated = await RefreshToken.migrate_to_redis(session)
+	logger.info(f"Refresh tokens migrated to Redis: {migrated}")
+
+
+def main():
+	"""
+	Служебные команды (запускаются отдельно от сервера, например: python manage.py backfill_activity).
+	"""
+	parser = argparse.ArgumentParser(description="LFS service commands")
+	commands = parser.add_subparsers(dest="command", required=True)
+
+	backfill_activity_parser = commands.add_parser("backfill_activity", help=backfill_activity.__doc__.strip())
+	backfill_activity_parser.add_argument("--station", type=uuid.UUID, default=None, help="ИД станции (по умолчанию - все)")
+
+	create_partitions_parser = commands.add_parser("create_partitions", help=create_partitions.__doc__.strip())
+	create_partitions_parser.add_argument("--months", type=int, default=config.LOGS_PARTITIONS_MONTHS_AHEAD,
+										  help="Количество месяцев (включая начальный)")
+	create_partitions_parser.add_argument("--since", type=datetime.date.fromisoformat, default=None,
+										  help="Начальный месяц, YYYY-MM-DD (по умолчанию - текущий)")
+
+	commands.add_parser("retention", help=retention.__doc__.strip())
+
+	commands.add_parser("migrate_refresh_tokens", help=migrate_refresh_tokens.__doc__.strip())
+
+	args = parser.parse_args()
+	match args.command:
+		case "backfill_activity":
+			asyncio.run(backfill_activity(args.station))
+		case "create_partitions":
+			asyncio.run(create_partitions(args.months, args.since))
+		case "retention":
+			asyncio.run(retention())
+		case "migrate_refresh_tokens":
+			asyncio.run(migrate_refresh_tokens())
+
+
+if __name__ == '__main__':
+	main()
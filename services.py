@@ -1,3 +1,5 @@
+import datetime
+
 from app.static.enums import RoleEnum, ErrorTypeEnum, LogActionEnum
 
 # SMTP ACCOUNT
@@ -92,3 +94,14 @@ ERROR_EXPECTING_DATA = {
 	ErrorTypeEnum.PUBLIC: {},
 	ErrorTypeEnum.SERVICE: {}
 }
+# период, за который считается количество ошибок станции в сводке активности (station_activity)
+STATION_ACTIVITY_ERRORS_PERIOD = datetime.timedelta(hours=24)
+# хранение логов и ошибок (python manage.py retention): {код или раздел кодов (целое число): срок хранения}
+# точный код важнее раздела; None - хранить всегда; для остальных кодов - срок по умолчанию (None - всегда)
+LOGS_RETENTION_POLICIES = {
+	3.1: datetime.timedelta(days=90),  # процесс работы станции
+	6: None  # логи от сервера
+}
+LOGS_RETENTION_DEFAULT_PERIOD = datetime.timedelta(days=365)
+ERRORS_RETENTION_POLICIES = {}
+ERRORS_RETENTION_DEFAULT_PERIOD = datetime.timedelta(days=365)
@@ -17,7 +17,8 @@ from app.database import Base
 from app.models.stations import StationControl, Station, StationSettings, StationProgram
 from app.models.washing import WashingAgent, WashingMachine
 from app.schemas import schemas_stations, schemas_washing
-from app.static.enums import RoleEnum, RegionEnum, StationStatusEnum, LogActionEnum, LogTypeEnum
+from app.static.enums import RoleEnum, RegionEnum, StationStatusEnum, LogActionEnum, LogTypeEnum, CacheTagEnum
+from app.utils.cache import station_auth_cache, station_data_cache, invalidate_cache
 from app.utils.general import sa_object_to_dict, sa_objects_dicts_list
 from .logs import Log
 from .strings import generate_string
@@ -263,6 +264,9 @@ async def change_station_params(station: StationData | schemas_stations.Station,
 				raise AttributeError
 		await session.execute(query)
 	await session.commit()
+	await station_auth_cache.invalidate(station.id)
+	await station_data_cache.invalidate(station.id)
+	await invalidate_cache(CacheTagEnum.STATIONS)
 
 
 def generate_station_programs(amount: int = 4,
@@ -315,8 +319,9 @@ async def get_station_by_id(station_id: uuid.UUID, session: AsyncSession) -> Opt
 	"""
 	station_general = await get_station_relation(station_id, Station, session)
 	if station_general:
-		station_washing_machines = await get_station_relation(station_id, WashingMachine, session, many=True)
-		station_washing_agents = await get_station_relation(station_id, WashingAgent, session, many=True)
+		# монтажник может удалить все машины/средства станции
+		station_washing_machines = await get_station_relation(station_id, WashingMachine, session, many=True) or []
+		station_washing_agents = await get_station_relation(station_id, WashingAgent, session, many=True) or []
 		station_settings = await get_station_relation(station_id, StationSettings, session)
 		station_control = await get_station_relation(station_id, StationControl, session)
 		station_programs = await get_station_relation(station_id, StationProgram, session, many=True)
@@ -351,6 +356,9 @@ async def generate_station_control(station: StationData, session: AsyncSession)
 	random.shuffle(ctrl.washing_machines_queue)
 	await session.merge(ctrl)
 	await session.commit()
+	await station_auth_cache.invalidate(station.id)
+	await station_data_cache.invalidate(station.id)
+	await invalidate_cache(CacheTagEnum.STATIONS)
 
 
 async def change_washing_machine_params(machine_number: int, station: StationData, session: AsyncSession,
@@ -365,6 +373,7 @@ async def change_washing_machine_params(machine_number: int, station: StationDat
 		).values(**kwargs)
 	)
 	await session.commit()
+	await station_data_cache.invalidate(station.id)
 
 
 async def delete_washing_services(object_number: int, station: StationData, session: AsyncSession,
@@ -386,6 +395,7 @@ async def delete_washing_services(object_number: int, station: StationData, sess
 		)
 	)
 	await session.commit()
+	await station_data_cache.invalidate(station.id)
 
 
 async def get_all_stations(session: AsyncSession) -> list[schemas_stations.StationGeneralParams]:
@@ -399,3 +409,6 @@ async def delete_all_stations(session: AsyncSession) -> None:
 	query = delete(Station)
 	await session.execute(query)
 	await session.commit()
+	station_auth_cache.clear()
+	await station_data_cache.clear()
+	await invalidate_cache(CacheTagEnum.STATIONS)
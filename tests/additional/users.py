@@ -12,7 +12,8 @@ import services
 from app.models.users import User
 from app.schemas import schemas_users
 from app.schemas.schemas_token import RefreshToken, Token
-from app.static.enums import RoleEnum, RegionEnum
+from app.static.enums import RoleEnum, RegionEnum, CacheTagEnum
+from app.utils.cache import invalidate_cache, user_auth_cache
 from app.utils.general import get_data_hash, sa_object_to_dict, sa_objects_dicts_list
 
 
@@ -110,6 +111,7 @@ async def create_authorized_user(ac: AsyncClient, sync_session: Session, role: R
 	"""
 	params = dict(sync_session=sync_session, role=role)
 	user = create_user(**params)
+	await invalidate_cache(CacheTagEnum.USERS)
 	access, refresh = await get_user_token(user.get("email"), user.get("password"), ac)
 
 	user.setdefault("token", access.access_token)
@@ -143,10 +145,13 @@ async def change_user_data(user: Any | int, session: AsyncSession, **kwargs) ->
 
 	user_id = user.id if not isinstance(user, int) else user
 
+	email = await session.scalar(select(User.email).where(User.id == user_id))
 	await session.execute(
 		update(User).where(User.id == user_id).values(**kwargs)
 	)
 	await session.commit()
+	await invalidate_cache(CacheTagEnum.USERS, CacheTagEnum.STATIONS)
+	await user_auth_cache.invalidate(*{email, kwargs.get("email", email)})
 
 
 async def get_user_by_id(id: int, session: AsyncSession,
@@ -1,9 +1,21 @@
+import asyncio
+
 import pytest
 from httpx import AsyncClient
+from passlib.context import CryptContext
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import config
+import services
+from app.database import redis_client
+from app.models.auth import RefreshToken as RefreshTokenModel
+from app.models.users import User
+
 from app.schemas.schemas_token import RefreshToken, Token
 from app.utils.general import decode_jwt
+from app.utils.hashing import data_hashing
+from app.utils.refresh_tokens import refresh_tokens_store
 from tests.additional import auth
 from tests.additional.users import change_user_data, get_user_token
 
@@ -79,6 +91,48 @@ class TestAuth:
 		)
 		assert disabled_user_response.status_code == 403
 
+	async def test_login_password_rehash(self, ac: AsyncClient, session: AsyncSession, monkeypatch):
+		"""
+		При изменении параметров хеширования хеш пароля пересчитывается при входе;
+		 хеширование не блокирует event loop.
+		"""
+		monkeypatch.setattr(config, "pwd_context", CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=4))
+		data = {"email": self.email, "password": self.password}
+
+		ticks = 0
+
+		async def ticker():
+			nonlocal ticks
+			while True:
+				await asyncio.sleep(0.005)
+				ticks += 1
+
+		ticker_task = asyncio.create_task(ticker())
+		response = await ac.post("/v1/auth/login", json=data)
+		ticker_task.cancel()
+		assert response.status_code == 200
+		assert ticks > 1  # пока проверялся старый хеш (12 раундов), event loop работал
+
+		hashed_password = await session.scalar(select(User.hashed_password).where(User.id == self.id))
+		assert hashed_password.startswith("$2b$04$")
+		assert (await ac.post("/v1/auth/login", json=data)).status_code == 200
+		assert data_hashing.queue_depth == 0
+
+	async def test_login_rate_limit(self, ac: AsyncClient, session: AsyncSession, monkeypatch):
+		"""
+		Ограничение попыток входа по IP и email: сверх лимита - 429 с Retry-After (даже с верным паролем).
+		"""
+		monkeypatch.setattr(config, "LOGIN_RATE_LIMIT", (2, 60))
+		for _ in range(2):
+			r = await ac.post("/v1/auth/login", json={"email": self.email, "password": self.password + "qwerty"})
+			assert r.status_code == 401
+		r = await ac.post("/v1/auth/login", json={"email": self.email, "password": self.password})
+		assert r.status_code == 429
+		assert 0 < int(r.headers["retry-after"]) <= 60
+
+		other_email_r = await ac.post("/v1/auth/login", json={"email": "other_" + self.email, "password": self.password})
+		assert other_email_r.status_code == 401
+
 	async def test_refresh_access_token(self, ac: AsyncClient, session: AsyncSession):
 		"""
 		Обновление пары токенов пользователя.
@@ -134,6 +188,35 @@ class TestAuth:
 
 		assert non_existing_token_in_db_r.status_code == 401
 
+	async def test_refresh_tokens_redis_backend(self, ac: AsyncClient, session: AsyncSession, monkeypatch):
+		"""
+		Рефреш-токены в Redis: перенос из таблицы, обновление пары токенов, выход.
+		"""
+		access, refresh = await get_user_token(self.email, self.password, ac)
+		assert await RefreshTokenModel.migrate_to_redis(session) >= 1
+		assert await auth.user_refresh_token_in_db(self.id, session) is None
+		digest = refresh_tokens_store.digest(refresh.refresh_token)
+		assert digest != refresh.refresh_token
+		assert await redis_client.get(refresh_tokens_store.token_key(digest)) == str(self.id).encode()
+		assert 0 < await redis_client.ttl(refresh_tokens_store.token_key(digest)) \
+			   <= services.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
+
+		monkeypatch.setattr(config, "REFRESH_TOKENS_BACKEND", "redis")
+		response = await ac.get("/v1/auth/refresh", headers={"Authorization": f"Bearer {refresh.refresh_token}"})
+		assert response.status_code == 200
+		updated_refresh = response.json().get("refresh_token")
+		assert await auth.user_refresh_token_in_db(self.id, session) is None
+
+		old_refresh_r = await ac.get("/v1/auth/refresh", headers={"Authorization": f"Bearer {refresh.refresh_token}"})
+		assert old_refresh_r.status_code == 401
+
+		access_token = response.headers.get("Authorization")
+		logout_r = await ac.get("/v1/auth/logout", headers={"Authorization": access_token})
+		assert logout_r.status_code == 200
+		revoked_refresh_r = await ac.get("/v1/auth/refresh", headers={"Authorization": f"Bearer {updated_refresh}"})
+		assert revoked_refresh_r.status_code == 401
+		assert not await redis_client.exists(refresh_tokens_store.user_key(self.id))
+
 	async def test_logout(self, ac: AsyncClient, session: AsyncSession):
 		"""
 		Выход пользователя
@@ -1,12 +1,35 @@
+import asyncio
+import csv
+import datetime
+import gzip
+import io
+import pathlib
 import random
+import uuid
 from math import floor
+from typing import Any
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import select, delete, update, text, func, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
-
+from sqlalchemy.orm import sessionmaker
+
+import config
+import services
+from app.crud import crud_logs
+from app.crud.crud_logs import CRUDLog
+from app.crud.managers.station import StationManager
+from app.exceptions import UpdatingError, VersionConflictError
+from app.models.logs import StationActivity, Error, Log as LogModel, LogsHourlyStats, create_monthly_partitions
+from app.models.stations import StationControl
 from app.schemas import schemas_logs as schema
-from app.static.enums import LogTypeEnum, ErrorTypeEnum, RoleEnum
+from app.static.enums import LogTypeEnum, ErrorTypeEnum, RoleEnum, StationStatusEnum, LogFromEnum
+from app.utils.cache import station_auth_cache
+from app.utils.locks import StationLock
+from app.utils.logs_buffer import LogsWriteBehindBuffer
+from app.utils.retention import apply_retention
 from tests.additional import stations as stations_funcs, auth as auth_funcs, users as users_funcs
 from tests.additional.logs import Log
 
@@ -103,6 +126,33 @@ class TestLogsCreate:
 		await self.station.refresh(session)
 		log.check_action(self.station)
 
+	async def test_create_log_station_without_agents(self, session: AsyncSession, ac: AsyncClient):
+		"""
+		Станция без стиральных средств (монтажник удалил все) принимает логи, действия которых их не требуют.
+		Действие, которому нужны средства, - 404 (а не необработанная ошибка).
+		"""
+		manual_working_log = Log(9.12, "test", LogTypeEnum.LOG, station=self.station)
+		for agent in self.station.station_washing_agents:
+			await stations_funcs.delete_washing_services(agent.agent_number, self.station, session, "agent")
+
+		log = Log(9.1, "test", LogTypeEnum.LOG, station=self.station)
+		await self.station.prepare_for_log(log, session)
+		r = await ac.post("/v1/logs/log", headers=self.station.headers, json=log.json())
+		assert r.status_code == 201
+		await self.station.refresh(session)
+		log.check_action(self.station)
+
+		error = Log(3.3, "test", LogTypeEnum.ERROR, scope=ErrorTypeEnum.PUBLIC)  # данных не требует
+		r = await ac.post("/v1/logs/error", headers=self.station.headers, json=error.json())
+		assert r.status_code == 201
+		await self.station.refresh(session)
+		error.check_action(self.station)
+
+		await self.station.reset(session)
+		await self.station.turn_on(session)
+		r = await ac.post("/v1/logs/log", headers=self.station.headers, json=manual_working_log.json())
+		assert r.status_code == 404
+
 	async def test_create_error(self, session: AsyncSession, ac: AsyncClient):
 		for code in log_codes:
 			error = Log(code, "test", LogTypeEnum.ERROR, scope=ErrorTypeEnum.PUBLIC, station=self.station)
@@ -147,6 +197,196 @@ class TestLogsCreate:
 		await self.station.refresh(session)
 		await check_all_logs_actions()
 
+	async def test_log_action_unit_of_work(self, session: AsyncSession, ac: AsyncClient):
+		"""
+		Лог о работе станции: данные станции загружаются одним запросом, изменения пишутся одним UPDATE,
+		 лог и изменения станции фиксируются одним коммитом.
+		"""
+		log = Log(3.1, "test", LogTypeEnum.LOG, station=self.station)
+		await self.station.prepare_for_log(log, session)
+		statements, commits = [], []
+		engine = session.bind.sync_engine
+
+		def on_execute(conn, cursor, statement, *args):
+			statements.append(statement)
+
+		def on_commit(conn):
+			commits.append(conn)
+
+		event.listen(engine, "before_cursor_execute", on_execute)
+		event.listen(engine, "commit", on_commit)
+		try:
+			r = await ac.post(
+				"/v1/logs/log",
+				headers=self.station.headers,
+				json=log.json()
+			)
+		finally:
+			event.remove(engine, "before_cursor_execute", on_execute)
+			event.remove(engine, "commit", on_commit)
+		assert r.status_code == 201
+		assert len(commits) == 1
+		assert len([s for s in statements if s.startswith("SELECT") and "FROM station_settings" in s]) == 1
+		updates = [s for s in statements if s.startswith("UPDATE")]
+		assert len(updates) == 1 and updates[0].startswith("UPDATE station_control")
+		await self.station.refresh(session)
+		log.check_action(self.station)
+
+	async def test_log_action_guarded_transition(self, session: AsyncSession, ac: AsyncClient):
+		"""
+		Условия перехода состояния проверяются в самом UPDATE: если статус или питание станции изменились
+		 после загрузки данных менеджером - UpdatingError, контроль не перезаписывается.
+		"""
+		await stations_funcs.change_station_params(self.station, session, status=StationStatusEnum.ERROR)
+		with pytest.raises(UpdatingError):
+			async with StationManager(self.station.general_schema, session) as sm:
+				await sm.pass_error()
+				await stations_funcs.change_station_params(self.station, session, status=StationStatusEnum.AWAITING)
+		await session.rollback()
+
+		await stations_funcs.change_station_params(self.station, session, status=StationStatusEnum.AWAITING)
+		with pytest.raises(UpdatingError):
+			async with StationManager(self.station.general_schema, session) as sm:
+				await sm.raise_error()
+				await stations_funcs.change_station_params(self.station, session, station_power=False)
+		await session.rollback()
+		await self.station.refresh(session)
+		assert self.station.station_control.status == StationStatusEnum.AWAITING
+		await self.station.reset(session)
+
+	async def test_log_action_version_conflict(self, session: AsyncSession, ac: AsyncClient,
+											   monkeypatch: pytest.MonkeyPatch):
+		"""
+		Если состояние станции изменили параллельно (не совпала версия) - VersionConflictError,
+		 а действие по логу повторяется с новыми данными.
+		"""
+		with pytest.raises(VersionConflictError):
+			async with StationManager(self.station.general_schema, session) as sm:
+				await sm.start_maintenance()
+				await session.execute(
+					update(StationControl).where(StationControl.station_id == self.station.id).values(
+						version=StationControl.version + 1
+					)
+				)
+		await session.rollback()
+
+		transition = StationControl.transition
+		conflicts = []
+
+		async def conflicting_transition(*args, **kwargs):
+			if not conflicts:
+				conflicts.append(kwargs["expected_version"])
+				raise VersionConflictError
+			return await transition(*args, **kwargs)
+
+		monkeypatch.setattr(StationControl, "transition", conflicting_transition)
+		log = Log(9.16, "test", LogTypeEnum.LOG, station=self.station)
+		await self.station.prepare_for_log(log, session)
+		r = await ac.post(
+			"/v1/logs/log",
+			headers=self.station.headers,
+			json=log.json()
+		)
+		assert r.status_code == 201
+		assert len(conflicts) == 1
+		await self.station.refresh(session)
+		log.check_action(self.station)
+		await self.station.reset(session)
+
+	async def test_station_lock(self, session: AsyncSession, ac: AsyncClient):
+		"""
+		Блокировка действий станции:
+		- Пока блокировка занята, действие по логу ждет ее (а не дождавшись - UpdatingError);
+		- Блокировки разных станций не мешают друг другу;
+		- По истечении lease блокировку может взять другой, у него fencing token больше, а check у прежнего - ошибка.
+		"""
+		log = Log(9.16, "test", LogTypeEnum.LOG, station=self.station)
+		await self.station.prepare_for_log(log, session)
+		async with StationLock(self.station.id) as lock:
+			with pytest.raises(UpdatingError):
+				await StationLock(self.station.id, wait_timeout=0.1).acquire()
+			async with StationLock(uuid.uuid4(), wait_timeout=0.1) as other_station_lock:
+				assert other_station_lock.token is not None
+
+			task = asyncio.create_task(ac.post("/v1/logs/log", headers=self.station.headers, json=log.json()))
+			await asyncio.sleep(0.3)
+			assert not task.done()
+			await lock.check()
+		r = await task
+		assert r.status_code == 201
+		await self.station.refresh(session)
+		log.check_action(self.station)
+		await self.station.reset(session)
+
+		expired_lock = StationLock(self.station.id, lease=0.1)
+		await expired_lock.acquire()
+		await asyncio.sleep(0.2)
+		async with StationLock(self.station.id, wait_timeout=0.1) as lock:
+			assert lock.token > expired_lock.token
+			with pytest.raises(UpdatingError):
+				await expired_lock.check()
+			await expired_lock.release()
+			await lock.check()
+
+	async def test_station_logs_rate_limit(self, session: AsyncSession, ac: AsyncClient, monkeypatch):
+		"""
+		Ограничение частоты логов станции: сверх лимита - 429 с Retry-After, другие станции не ограничены.
+		"""
+		monkeypatch.setattr(config, "STATION_LOGS_RATE_LIMIT", (2, 60))
+		log = Log(1.1, "test", LogTypeEnum.LOG, station=self.station)
+		for _ in range(2):
+			r = await ac.post("/v1/logs/log", headers=self.station.headers, json=log.json())
+			assert r.status_code == 201
+		for url in ("/v1/logs/log", "/v1/logs/error", "/v1/logs/batch"):
+			r = await ac.post(url, headers=self.station.headers, json=log.json())
+			assert r.status_code == 429
+			assert 0 < int(r.headers["retry-after"]) <= 60
+
+		other_station_r = await ac.post("/v1/logs/log", headers={"X-Station-Uuid": str(uuid.uuid4())}, json=log.json())
+		assert other_station_r.status_code == 401
+
+	async def test_station_activity(self, session: AsyncSession, ac: AsyncClient):
+		"""
+		Сводка активности станции обновляется при добавлении логов и ошибок;
+		 пересборка по истории дает тот же результат.
+		Количество ошибок в списке станций - за последние services.STATION_ACTIVITY_ERRORS_PERIOD.
+		"""
+		async def get_errors_count() -> int:
+			return await session.scalar(select(StationActivity.recent_errors_count(self.station.id)))
+
+		async def get_activity() -> StationActivity:
+			session.expire_all()
+			return (await session.execute(
+				select(StationActivity).where(StationActivity.station_id == self.station.id)
+			)).scalar()
+
+		work_log = (await Log.generate(self.station, LogTypeEnum.LOG, [3.1], session, ac, amount=1))[0]
+		errors = await Log.generate(self.station, LogTypeEnum.ERROR, [1.1, 2.2], session, ac, amount=3,
+									scope=ErrorTypeEnum.SERVICE)
+
+		activity = await get_activity()
+		assert activity.last_work_at == work_log.timestamp
+		assert activity.last_maintenance_at is None
+		assert activity.last_error_at == errors[-1].timestamp
+		assert await get_errors_count() == len(errors)
+
+		await session.execute(delete(StationActivity).where(StationActivity.station_id == self.station.id))
+		await session.commit()
+		await StationActivity.rebuild(session, self.station.id)
+
+		rebuilt_activity = await get_activity()
+		for field in ("last_work_at", "last_maintenance_at", "last_error_at"):
+			assert getattr(rebuilt_activity, field) == getattr(activity, field)
+		assert await get_errors_count() == len(errors)
+
+		session.add(Error(
+			station_id=self.station.id, code=1.1, event="test", content="test", sended_from=LogFromEnum.STATION,
+			scope=ErrorTypeEnum.SERVICE,
+			timestamp=errors[0].timestamp - services.STATION_ACTIVITY_ERRORS_PERIOD - datetime.timedelta(minutes=1)
+		))
+		await session.commit()
+		assert await get_errors_count() == len(errors)  # ошибка старше периода не считается
+
 	async def test_station_create_log_auth(self, session: AsyncSession, ac: AsyncClient):
 		url = "/v1/logs/log"
 		log = next(l for l in [Log(log, "test", LogTypeEnum.LOG) for log in log_codes]
@@ -202,7 +442,220 @@ class TestLogsCreate:
 			json=log.json()
 		)
 		assert r.status_code == 422
-		
+
+	async def test_create_logs_batch(self, session: AsyncSession, ac: AsyncClient):
+		"""
+		Пакетное создание логов и ошибок.
+		- Действия выполняются по порядку;
+		- Если действие не выполнено, лог не добавляется, а в результате - код ошибки (как при одиночном создании);
+		- Если хоть один лог невалиден, ничего не добавляется.
+		"""
+		def batch_item(log: Log) -> dict[str, Any]:
+			item = log.json()
+			return {"type": log.type.value, "log": item[log.type.value], "data": item.get("data", {})}
+
+		await self.station.turn_on(session)
+		logs = [
+			Log(1, "test", LogTypeEnum.LOG),
+			Log(2.2, "test", LogTypeEnum.ERROR, scope=ErrorTypeEnum.SERVICE),
+			Log(9.10, "test", LogTypeEnum.LOG, station=self.station),
+			Log(9.18, "test", LogTypeEnum.LOG),  # статус станции - не "ошибка"
+			Log(9.4, "test", LogTypeEnum.LOG, station=self.station)
+		]
+		logs[2].data["teh_power"] = True
+
+		r = await ac.post(
+			"/v1/logs/batch",
+			headers=self.station.headers,
+			json={"items": [batch_item(log) for log in logs]}
+		)
+		assert r.status_code == 200
+		results = [schema.LogBatchItemResult(**item) for item in r.json()]
+		assert [result.status_code for result in results] == [201, 201, 201, 409, 201]
+		assert isinstance(results[1].log, schema.Error)
+		for log, result in zip(logs, results):
+			if result.status_code == 201:
+				assert result.log.code == log.code
+				assert await Log.find_in_db(result.log, session)
+			else:
+				assert result.log is None and result.detail
+
+		await self.station.refresh(session)
+		logs[2].check_action(self.station)
+		logs[4].check_action(self.station)
+
+		# _____________________________________________________________________________
+
+		logs_amount = len(await CRUDLog.get_station_logs(self.station, session, 100))
+		invalid_log = Log(9.10, "test", LogTypeEnum.LOG)  # без дополнительных данных
+		r = await ac.post(
+			"/v1/logs/batch",
+			headers=self.station.headers,
+			json={"items": [batch_item(logs[0]), batch_item(invalid_log)]}
+		)
+		assert r.status_code == 422
+		assert len(await CRUDLog.get_station_logs(self.station, session, 100)) == logs_amount
+
+	async def test_create_logs_batch_commit(self, session: AsyncSession, ac: AsyncClient,
+											monkeypatch: pytest.MonkeyPatch):
+		"""
+		Пакет коммитится, только если блокировка станции все еще наша (иначе 409, ничего не добавляется);
+		 кэш аутентификации станции сбрасывается после коммита.
+		"""
+		item = Log(1, "test", LogTypeEnum.LOG).json()
+		json_ = {"items": [{"type": LogTypeEnum.LOG.value, "log": item[LogTypeEnum.LOG.value], "data": {}}]}
+		logs_amount = len(await CRUDLog.get_station_logs(self.station, session, 100))
+
+		async def lease_expired(lock: StationLock) -> None:
+			raise UpdatingError(f"Station {lock.station_id} lock lease ({lock.lease}s) has expired")
+
+		with monkeypatch.context() as m:
+			m.setattr(StationLock, "check", lease_expired)
+			r = await ac.post("/v1/logs/batch", headers=self.station.headers, json=json_)
+		assert r.status_code == 409
+		assert len(await CRUDLog.get_station_logs(self.station, session, 100)) == logs_amount
+
+		generation = await station_auth_cache.generation(self.station.id)
+		r = await ac.post("/v1/logs/batch", headers=self.station.headers, json=json_)
+		assert r.status_code == 200
+		assert len(await CRUDLog.get_station_logs(self.station, session, 100)) == logs_amount + 1
+		assert await station_auth_cache.generation(self.station.id) != generation
+
+
+	async def test_create_log_write_behind(self, session: AsyncSession, ac: AsyncClient,
+										   monkeypatch: pytest.MonkeyPatch):
+		"""
+		Отложенная запись логов без действий.
+		- Лог сразу возвращается, а в БД записывается при сбросе очереди;
+		- Если очередь заполнена - лог записывается сразу.
+		"""
+		buffer = LogsWriteBehindBuffer(
+			session_maker=sessionmaker(session.bind, class_=AsyncSession, expire_on_commit=False),
+			maxsize=1, flush_interval=60, flush_batch_size=10, put_timeout=0.01, ids_block_size=10
+		)
+		monkeypatch.setattr(crud_logs, "logs_buffer", buffer)
+		await buffer.start()
+
+		log = next(l for l in [Log(code, "test", LogTypeEnum.LOG) for code in log_codes] if l.action is None)
+		created_logs = []
+		for _ in range(2):
+			r = await ac.post(
+				"/v1/logs/log",
+				headers=self.station.headers,
+				json=log.json()
+			)
+			assert r.status_code == 201
+			created_logs.append(schema.Log(**r.json()))
+		buffered_log, direct_log = created_logs
+		assert direct_log.id > buffered_log.id
+		assert not await Log.find_in_db(buffered_log, session)
+		assert await Log.find_in_db(direct_log, session)
+
+		await buffer.stop()
+		log_in_db = await Log.find_in_db(buffered_log, session)
+		assert log_in_db
+		assert log_in_db.timestamp == buffered_log.timestamp
+
+
+	async def test_create_log_write_behind_retry(self, session: AsyncSession, ac: AsyncClient,
+												 monkeypatch: pytest.MonkeyPatch):
+		"""
+		Отложенная запись логов при ошибках БД.
+		- Если пачку не удалось записать (соединение с БД потеряно), логи остаются в очереди и записываются позже;
+		- Отбрасываются только логи, которые не записываются сами по себе (станция не существует).
+		"""
+		buffer = LogsWriteBehindBuffer(
+			session_maker=sessionmaker(session.bind, class_=AsyncSession, expire_on_commit=False),
+			maxsize=10, flush_interval=60, flush_batch_size=10, put_timeout=0.01, ids_block_size=10
+		)
+		monkeypatch.setattr(crud_logs, "logs_buffer", buffer)
+		await buffer.start()
+
+		log = next(l for l in [Log(code, "test", LogTypeEnum.LOG) for code in log_codes] if l.action is None)
+		created_logs = []
+		for _ in range(2):
+			r = await ac.post("/v1/logs/log", headers=self.station.headers, json=log.json())
+			assert r.status_code == 201
+			created_logs.append(schema.Log(**r.json()))
+
+		async def connection_lost(*args) -> None:
+			raise OperationalError("INSERT", {}, ConnectionError("connection lost"))
+
+		with monkeypatch.context() as m:
+			m.setattr(LogsWriteBehindBuffer, "_insert", connection_lost)
+			with pytest.raises(OperationalError):
+				await buffer.flush()
+		assert buffer.pending == 2
+		assert not await Log.find_in_db(created_logs[0], session)
+
+		orphan_log = await buffer.prepare(dict(
+			created_logs[0].dict(exclude={"id", "timestamp"}), station_id=uuid.uuid4(), sended_from=LogFromEnum.STATION
+		))
+		assert await buffer.put(orphan_log)
+		assert await buffer.flush() == 3
+		assert buffer.pending == 0
+		for created_log in created_logs:
+			assert await Log.find_in_db(created_log, session)
+		assert not await session.scalar(select(LogModel).where(LogModel.id == orphan_log["id"]))
+		await buffer.stop()
+
+	async def test_create_monthly_partitions(self, session: AsyncSession, ac: AsyncClient):
+		"""
+		Создание месячных партиций логов/ошибок: логи из DEFAULT-партиции переносятся в новую,
+		 новые логи пишутся в нее же; повторно партиции не создаются.
+		"""
+		async def get_partition(log: schema.Log | schema.Error) -> str:
+			model = Error if isinstance(log, schema.Error) else LogModel
+			return await session.scalar(
+				select(text("tableoid::regclass::text")).select_from(model).where(model.id == log.id)
+			)
+
+		old_log, = await Log.generate(self.station, LogTypeEnum.LOG, [1], session, ac, amount=1)
+		old_error, = await Log.generate(self.station, LogTypeEnum.ERROR, [1], session, ac, amount=1,
+										scope=ErrorTypeEnum.SERVICE)
+		month = old_log.timestamp.astimezone(datetime.timezone.utc)
+		partitions = [f"{table}_y{month.year}m{month.month:02d}" for table in ("logs", "errors")]
+		assert await get_partition(old_log) == "logs_default"
+		assert await create_monthly_partitions(session, 1, month.date()) == partitions
+		assert await get_partition(old_log) == partitions[0]
+		assert await get_partition(old_error) == partitions[1]
+		assert await Log.find_in_db(old_log, session)
+
+		new_log, = await Log.generate(self.station, LogTypeEnum.LOG, [1], session, ac, amount=1)
+		assert await get_partition(new_log) == partitions[0]
+		assert await create_monthly_partitions(session, 1, month.date()) == []
+
+
+	async def test_logs_retention(self, session: AsyncSession, ac: AsyncClient, tmp_path: pathlib.Path):
+		"""
+		Удаление устаревших логов по срокам хранения (services) с сохранением в архив по дням.
+		"""
+		working_logs = await Log.generate(self.station, LogTypeEnum.LOG, [3.1], session, ac, amount=3)
+		server_log, station_log = [
+			(await Log.generate(self.station, LogTypeEnum.LOG, [code], session, ac, amount=1))[0]
+			for code in (6.1, 1.1)
+		]
+		expired_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=100)
+		expired_logs = working_logs[:2]
+		await session.execute(
+			update(LogModel).where(
+				LogModel.id.in_([log.id for log in (*expired_logs, server_log, station_log)])
+			).values(timestamp=expired_at)
+		)
+		await session.commit()
+
+		result = await apply_retention(session, str(tmp_path), batch_size=1)
+		assert result == {"logs": len(expired_logs), "errors": 0}
+		for log in expired_logs:
+			assert not await Log.find_in_db(log, session)
+		for log in (working_logs[-1], server_log, station_log):
+			assert await Log.find_in_db(log, session)
+
+		archive_file = tmp_path / "logs" / expired_at.strftime("%Y-%m") / f"{expired_at.date().isoformat()}.jsonl.gz"
+		with gzip.open(archive_file, "rt", encoding="utf-8") as archive:
+			archived_logs = [schema.Log.parse_raw(line) for line in archive]
+		assert sorted(log.id for log in archived_logs) == sorted(log.id for log in expired_logs)
+
 
 @pytest.mark.usefixtures("generate_default_station", "generate_users")
 class TestLogsGet:
@@ -213,6 +666,7 @@ class TestLogsGet:
 	manager: users_funcs.UserData
 	sysadmin: users_funcs.UserData
 	laundry: users_funcs.UserData
+	region_manager: users_funcs.UserData
 	station: stations_funcs.StationData
 
 	async def test_get_station_logs(self, session: AsyncSession, ac: AsyncClient):
@@ -252,6 +706,36 @@ class TestLogsGet:
 		assert r.status_code == 200
 		assert len(r.json()) == limit
 
+	async def test_get_station_logs_pagination(self, session: AsyncSession, ac: AsyncClient):
+		"""
+		Постраничное получение логов по курсору (X-Next-Cursor) и фильтры.
+		"""
+		logs = await Log.generate(self.station, LogTypeEnum.LOG, log_codes, session, ac, amount=30)
+		url = f"/v1/logs/log/station/{self.station.id}"
+		pages, params = [], {"limit": 7}
+		while True:
+			r = await ac.get(url, headers=self.laundry.headers, params=params)
+			assert r.status_code == 200
+			pages.append([schema.Log(**log) for log in r.json()])
+			if "X-Next-Cursor" not in r.headers:
+				break
+			params["cursor"] = r.headers["X-Next-Cursor"]
+		paged_logs = [log for page in pages for log in page]
+		assert len(paged_logs) == len(logs) + 1  # один лог - это создание станции
+		assert len({log.id for log in paged_logs}) == len(paged_logs)
+		assert paged_logs == sorted(paged_logs, key=lambda log: (log.timestamp, log.id), reverse=True)
+
+		codes = list({log.code for log in logs})[:2]
+		r = await ac.get(url, headers=self.laundry.headers,
+						 params={"code": codes, "sended_from": "station", "since": paged_logs[-1].timestamp.isoformat()})
+		assert r.status_code == 200
+		filtered_logs = [schema.Log(**log) for log in r.json()]
+		assert sorted(log.id for log in filtered_logs) == sorted(log.id for log in paged_logs
+																  if log.code in codes and log.sended_from.value == "station")
+
+		r = await ac.get(url, headers=self.laundry.headers, params={"cursor": "invalid"})
+		assert r.status_code == 422
+
 	async def test_get_station_logs_get_station_by_id_errors(self, session: AsyncSession, ac: AsyncClient):
 		url = "/v1/logs/log/station/{station_id}"
 		await auth_funcs.url_get_station_by_id_test(url, "get", self.sysadmin,
@@ -261,6 +745,128 @@ class TestLogsGet:
 		url = f"/v1/logs/log/station/{self.station.id}"
 		await auth_funcs.url_auth_test(url, "get", self.laundry, ac, session)
 
+	async def test_export_logs(self, session: AsyncSession, ac: AsyncClient):
+		"""
+		Выгрузка логов и ошибок станции/региона за период (NDJSON, CSV).
+		"""
+		since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=10)
+		logs = await Log.generate(self.station, LogTypeEnum.LOG, log_codes, session, ac, amount=20)
+		errors = await Log.generate(self.station, LogTypeEnum.ERROR, log_codes, session, ac, amount=5,
+									scope=ErrorTypeEnum.SERVICE)
+		params = {"since": since.isoformat(), "station_id": str(self.station.id)}
+
+		r = await ac.get("/v1/logs/export", headers=self.manager.headers, params=params)
+		assert r.status_code == 200
+		assert r.headers["content-type"] == "application/x-ndjson"
+		exported_logs = [schema.Log.parse_raw(line) for line in r.text.splitlines()]
+		assert len(exported_logs) == len(logs) + 1  # один лог - это создание станции
+		assert all(log.station_id == self.station.id for log in exported_logs)
+		assert exported_logs == sorted(exported_logs, key=lambda log: (log.timestamp, log.id))
+
+		r = await ac.get("/v1/logs/export", headers=self.sysadmin.headers,
+						 params=dict(params, log_type="error", scope="service", format="csv"))
+		assert r.status_code == 200
+		assert r.headers["content-type"].startswith("text/csv")
+		exported_errors = list(csv.DictReader(io.StringIO(r.text)))
+		assert sorted(int(error["id"]) for error in exported_errors) == sorted(error.id for error in errors)
+		assert all(error["scope"] == ErrorTypeEnum.SERVICE.value for error in exported_errors)
+
+		r = await ac.get("/v1/logs/export", headers=self.manager.headers,
+						 params={"since": since.isoformat(), "region": self.station.region.value})
+		assert r.status_code == 200
+		region_logs_ids = {schema.Log.parse_raw(line).id for line in r.text.splitlines()}
+		assert {log.id for log in exported_logs} <= region_logs_ids
+
+	async def test_export_logs_errors(self, session: AsyncSession, ac: AsyncClient):
+		since = datetime.datetime.now(datetime.timezone.utc).isoformat()
+		url = f"/v1/logs/export?station_id={self.station.id}"
+		r = await ac.get("/v1/logs/export", headers=self.manager.headers, params={"since": since})
+		assert r.status_code == 422
+		r = await ac.get(url, headers=self.manager.headers, params={"since": since, "scope": "service"})
+		assert r.status_code == 403
+		r = await ac.get("/v1/logs/export", headers=self.manager.headers,
+						 params={"since": since, "station_id": str(uuid.uuid4())})
+		assert r.status_code == 404
+		await auth_funcs.url_auth_roles_test(url + f"&since={since[:19]}", "get", RoleEnum.REGION_MANAGER,
+											 self.region_manager, session, ac)
+
+	async def test_get_logs_stats(self, session: AsyncSession, ac: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+		"""
+		Статистика логов/ошибок по периодам с группировкой (по почасовой статистике).
+		Если строк больше допустимого - ошибка (а не обрезанная статистика).
+		"""
+		since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+		logs = await Log.generate(self.station, LogTypeEnum.LOG, [1, 2.1, 3.1], session, ac, amount=15)
+		errors = await Log.generate(self.station, LogTypeEnum.ERROR, [1.1], session, ac, amount=3,
+									scope=ErrorTypeEnum.SERVICE)
+		assert await LogsHourlyStats.refresh(session)
+
+		r = await ac.get("/v1/logs/stats", headers=self.manager.headers, params={
+			"since": since.isoformat(), "station_id": str(self.station.id), "bucket": "day", "group_by": ["code"]
+		})
+		assert r.status_code == 200
+		stats = [schema.LogsStats(**item) for item in r.json()]
+		counts = {}
+		for item in stats:
+			assert item.station_id is None and item.region is None
+			counts[item.code] = counts.get(item.code, 0) + item.count
+		expected_counts = {6.4: 1}  # один лог - это создание станции
+		for log in logs:
+			expected_counts[log.code] = expected_counts.get(log.code, 0) + 1
+		assert counts == expected_counts
+
+		monkeypatch.setattr(config, "MAX_LOGS_STATS_ROWS", len(stats) - 1)
+		r = await ac.get("/v1/logs/stats", headers=self.manager.headers, params={
+			"since": since.isoformat(), "station_id": str(self.station.id), "bucket": "day", "group_by": ["code"]
+		})
+		assert r.status_code == 422
+		monkeypatch.setattr(config, "MAX_LOGS_STATS_ROWS", len(stats))
+		r = await ac.get("/v1/logs/stats", headers=self.manager.headers, params={
+			"since": since.isoformat(), "station_id": str(self.station.id), "bucket": "day", "group_by": ["code"]
+		})
+		assert len(r.json()) == len(stats)
+
+		params = {"since": since.isoformat(), "station_id": str(self.station.id), "log_type": "error"}
+		r = await ac.get("/v1/logs/stats", headers=self.manager.headers, params=params)
+		assert r.status_code == 200
+		assert r.json() == []  # служебные ошибки - только для сисадмина
+		r = await ac.get("/v1/logs/stats", headers=self.sysadmin.headers, params=dict(params, scope="service"))
+		assert sum(item["count"] for item in r.json()) == len(errors)
+		r = await ac.get("/v1/logs/stats", headers=self.manager.headers, params=dict(params, scope="service"))
+		assert r.status_code == 403
+
+		async with session.bind.connect() as conn:  # пересчет уже выполняется другим процессом
+			await conn.execute(select(func.pg_advisory_lock(LogsHourlyStats.ADVISORY_LOCK_KEY)))
+			assert not await LogsHourlyStats.refresh(session)
+			await conn.execute(select(func.pg_advisory_unlock(LogsHourlyStats.ADVISORY_LOCK_KEY)))
+
+	async def test_logs_stats_late_logs(self, session: AsyncSession, ac: AsyncClient):
+		"""
+		Пересчет статистики учитывает логи, закоммиченные позже более новых (например, отложенная запись
+		 после недоступности БД), - даже если новых логов больше нет.
+		"""
+		async def get_count(hour: datetime.datetime) -> int:
+			return await session.scalar(select(func.coalesce(func.sum(LogsHourlyStats.count), 0)).where(
+				(LogsHourlyStats.station_id == self.station.id) & (LogsHourlyStats.hour == hour)
+			))
+
+		await Log.generate(self.station, LogTypeEnum.LOG, [1], session, ac, amount=1)
+		assert await LogsHourlyStats.refresh(session)
+		late_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=5)
+		late_hour = late_at.replace(minute=0, second=0, microsecond=0)
+		count = await get_count(late_hour)
+
+		session.add_all([LogModel(
+			station_id=self.station.id, code=1, event="test", content="test", sended_from=LogFromEnum.STATION,
+			timestamp=late_at
+		) for _ in range(2)])
+		await session.commit()
+		assert await LogsHourlyStats.refresh(session)
+		assert await get_count(late_hour) == count + 2
+
+		assert await LogsHourlyStats.refresh(session)  # новых логов нет - статистика не меняется
+		assert await get_count(late_hour) == count + 2
+
 	async def test_get_station_errors(self, session: AsyncSession, ac: AsyncClient):
 		errors = await Log.generate(self.station, LogTypeEnum.ERROR, log_codes, session, ac, scope=ErrorTypeEnum.PUBLIC)
 		r = await ac.get(
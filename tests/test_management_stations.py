@@ -5,12 +5,14 @@ import random
 import pytest
 import pytz
 from httpx import AsyncClient
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import stations as stations_models
 from app.schemas import schemas_stations as stations, schemas_washing as washing
 from app.static.enums import StationParamsEnum, RoleEnum, RegionEnum, StationStatusEnum
-from app.utils.general import decrypt_data
+from app.utils.cache import station_data_cache
+from app.utils.general import decrypt_data, encode_etag
 from tests.additional import auth, stations as stations_funcs, logs as logs_funcs, users as users_funcs, strings
 
 
@@ -176,6 +178,12 @@ class TestManagement:
 
 		await stations_funcs.generate_station_control(self.station, session)
 
+		station_r = await ac.get(
+			"/v1/stations/me/" + StationParamsEnum.GENERAL.value,
+			headers=self.station.headers
+		)
+		assert station_r.status_code == 200
+
 		response = await ac.put(
 			f"/v1/manage/station/{self.station.id}/" + StationParamsEnum.GENERAL.value,
 			headers=self.sysadmin.headers,
@@ -197,6 +205,12 @@ class TestManagement:
 		) and control.washing_agents == []
 		assert control.updated_at is not None
 
+		inactive_station_r = await ac.get(
+			"/v1/stations/me/" + StationParamsEnum.GENERAL.value,
+			headers=self.station.headers
+		)
+		assert inactive_station_r.status_code == 403  # данные аутентификации станции не должны остаться в кэше
+
 		# _____________________________________________________________________________________
 
 		"""обновление комментария по станции"""
@@ -420,6 +434,69 @@ class TestManagement:
 			"put", self.sysadmin, self.station, session, ac, json=testing_data
 		)
 
+	async def test_update_station_control_if_match(self, ac: AsyncClient, session: AsyncSession):
+		"""
+		- В ответах на получение и изменение состояния/настроек - ETag (версия);
+		- С заголовком If-Match изменение проходит, только если версия не изменилась, иначе - 412;
+		- Невалидный If-Match - 422.
+		"""
+		url = f"/v1/manage/station/{self.station.id}/"
+		for dataset, updating_params in ((StationParamsEnum.CONTROL, {"status": StationStatusEnum.AWAITING.value}),
+										 (StationParamsEnum.SETTINGS, {"teh_power": True})):
+			get_r = await ac.get(url + dataset.value, headers=self.installer.headers)
+			etag = get_r.headers["ETag"]
+
+			r = await ac.put(url + dataset.value, headers=dict(self.installer.headers, **{"If-Match": etag}),
+							 json=dict(updating_params=updating_params))
+			assert r.status_code == 200
+			assert r.headers["ETag"] != etag
+			assert r.headers["ETag"] == (await ac.get(url + dataset.value, headers=self.installer.headers)).headers["ETag"]
+
+			outdated_r = await ac.put(url + dataset.value, headers=dict(self.installer.headers, **{"If-Match": etag}),
+									  json=dict(updating_params=updating_params))
+			assert outdated_r.status_code == 412
+
+			invalid_r = await ac.put(url + dataset.value, headers=dict(self.installer.headers, **{"If-Match": "abc"}),
+									 json=dict(updating_params=updating_params))
+			assert invalid_r.status_code == 422
+
+	async def test_station_data_cache(self, ac: AsyncClient, session: AsyncSession):
+		"""
+		Кэш наборов данных станции (station_data_cache):
+		- при чтении набор попадает в кэш, и дальше читается из него (а не из БД);
+		- изменение через API сразу записывается в кэш (write-through) с новой версией;
+		- набор, прочитанный или измененный до параллельного изменения (тег изменился), в кэш не попадает.
+		"""
+		url = f"/v1/manage/station/{self.station.id}/" + StationParamsEnum.SETTINGS.value
+		await station_data_cache.invalidate(self.station.id)
+		get_r = await ac.get(url, headers=self.installer.headers)
+		(cached,), tag = await station_data_cache.get(session, self.station.id, StationParamsEnum.SETTINGS)
+		assert cached["teh_power"] == get_r.json()["teh_power"]
+		assert encode_etag(cached["version"]) == get_r.headers["ETag"]
+
+		await session.execute(
+			update(stations_models.StationSettings).where(stations_models.StationSettings.station_id == self.station.id)
+			.values(teh_power=not cached["teh_power"])
+		)
+		await session.commit()
+		assert (await ac.get(url, headers=self.installer.headers)).json() == get_r.json()  # без сброса кэша
+
+		r = await ac.put(url, headers=self.installer.headers, json=dict(updating_params={"teh_power": cached["teh_power"]}))
+		assert r.status_code == 200
+		(cached,), new_tag = await station_data_cache.get(session, self.station.id, StationParamsEnum.SETTINGS)
+		assert new_tag != tag
+		assert encode_etag(cached["version"]) == r.headers["ETag"] != get_r.headers["ETag"]
+		get_r = await ac.get(url, headers=self.installer.headers)
+		assert get_r.headers["ETag"] == r.headers["ETag"]
+
+		await station_data_cache.invalidate(self.station.id, StationParamsEnum.SETTINGS)
+		await station_data_cache.fill(session, self.station.id, new_tag, {StationParamsEnum.SETTINGS: cached})
+		assert (await station_data_cache.get(session, self.station.id, StationParamsEnum.SETTINGS))[0] == [None]
+
+		await ac.get(url, headers=self.installer.headers)
+		await station_data_cache.set(session, self.station.id, new_tag, {StationParamsEnum.SETTINGS: cached})
+		assert (await station_data_cache.get(session, self.station.id, StationParamsEnum.SETTINGS))[0] == [None]
+
 	async def test_update_station_settings(self, ac: AsyncClient, session: AsyncSession):
 		"""
 		Обновление настроек станции.
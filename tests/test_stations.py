@@ -1,21 +1,29 @@
+import asyncio
 import copy
+import json
 import uuid
 
 import pytest
 from httpx import AsyncClient
-from sqlalchemy import delete
+from sqlalchemy import delete, update, event
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+import config
 import services
 from app.exceptions import CreatingError
+from app.crud.managers.relations import CRUDLaundryStation
 from app.models import stations
 from app.schemas import schemas_stations, schemas_washing
 from app.schemas import schemas_washing as washing
 # from app.utils.general import read_location
 from app.static.enums import RegionEnum, StationStatusEnum, RoleEnum, StationParamsEnum, \
 	StationsSortingEnum
+from app.database import redis_client
+from app.utils.cache import station_data_cache, station_auth_cache
+from app.utils.general import encode_etag
 from tests.additional import auth, users as users_funcs
+from tests.additional.users import create_authorized_user
 from tests.additional.stations import get_station_by_id, generate_station, StationData, change_station_params, \
 	rand_serial, delete_all_stations, generate_station_programs
 from tests.fills import stations as station_fills
@@ -477,6 +485,26 @@ class TestStations:
 		assert station.owner
 		assert station.control.status
 
+	async def test_read_all_stations_same_owner(self, session: AsyncSession, ac: AsyncClient,
+												sync_session: Session):
+		"""
+		У нескольких станций в списке один собственник.
+		"""
+		_, owner = await create_authorized_user(ac, sync_session, RoleEnum.LAUNDRY)
+		owned_stations = [await generate_station(ac, sync_session, self.sysadmin) for _ in range(2)]
+		for station in owned_stations:
+			await CRUDLaundryStation(owner, session, station.general_schema).create()
+
+		r = await ac.get(
+			"/v1/stations/",
+			headers=self.sysadmin.headers
+		)
+		assert r.status_code == 200
+		r = [schemas_stations.StationInList(**s) for s in r.json()]
+		owned = [s for s in r if s.general.id in (station.id for station in owned_stations)]
+		assert len(owned) == 2
+		assert all(s.owner.id == owner.id and s.owner.email == owner.email for s in owned)
+
 	async def test_read_all_stations_with_ordering(self, ac: AsyncClient, session: AsyncSession,
 												   sync_session: Session):
 		headers = self.sysadmin.headers
@@ -512,6 +540,65 @@ class TestStations:
 					del r[r.index(obj)]
 				assert r == sorted(r, **sorting_params)
 
+	async def test_read_all_stations_pagination(self, ac: AsyncClient, session: AsyncSession,
+												sync_session: Session):
+		"""
+		Постраничное получение списка станций (cursor - ИД последней станции страницы).
+		- Страницы вместе дают тот же список, что и без пагинации;
+		- Несуществующая станция в cursor - 404.
+		"""
+		headers = self.sysadmin.headers
+		await StationData.generate_stations_list(ac, sync_session, self.sysadmin, session,
+												 amount=7)
+		for order in (StationsSortingEnum.NAME, StationsSortingEnum.OWNER, StationsSortingEnum.LAST_WORK):
+			for desc in (True, False):
+				url = f"/v1/stations/?order_by={order.value}&desc={str(desc).lower()}"
+				full_r = await ac.get(url, headers=headers)
+				assert full_r.status_code == 200
+				full_list = [s["general"]["id"] for s in full_r.json()]
+
+				pages_list = []
+				cursor = None
+				while True:
+					page_url = url + "&limit=3" + (f"&cursor={cursor}" if cursor else "")
+					page_r = await ac.get(page_url, headers=headers)
+					assert page_r.status_code == 200
+					page = [s["general"]["id"] for s in page_r.json()]
+					assert len(page) <= 3
+					pages_list.extend(page)
+					if len(page) < 3:
+						break
+					cursor = page[-1]
+
+				assert pages_list == full_list
+
+		non_existing_cursor_r = await ac.get(f"/v1/stations/?limit=3&cursor={uuid.uuid4()}", headers=headers)
+		assert non_existing_cursor_r.status_code == 404
+
+	async def test_read_all_stations_cache(self, ac: AsyncClient, session: AsyncSession, sync_session: Session):
+		"""
+		Кэш списка станций:
+		- ответ общий для пользователей с одинаковыми ролью и регионом (не зависит от сессии и самого пользователя);
+		- при изменении станции кэш сбрасывается.
+		"""
+		other_sysadmin, _ = await users_funcs.create_authorized_user(ac, sync_session, RoleEnum.SYSADMIN)
+		r = await ac.get("/v1/stations/", headers=self.sysadmin.headers)
+		await session.execute(
+			update(stations.Station).where(stations.Station.id == self.station.id).values(comment="not cached")
+		)
+		await session.commit()
+
+		for user in (self.sysadmin, other_sysadmin):
+			cached_r = await ac.get("/v1/stations/", headers=user.headers)
+			assert cached_r.json() == r.json()
+
+		update_r = await ac.put(f"/v1/manage/station/{self.station.id}/" + StationParamsEnum.GENERAL.value,
+								headers=self.sysadmin.headers, json=dict(updating_params={"comment": "updated"}))
+		assert update_r.status_code == 200
+		r = await ac.get("/v1/stations/", headers=other_sysadmin.headers)
+		station = next(st for st in r.json() if st["general"]["id"] == str(self.station.id))
+		assert station["general"]["comment"] == "updated"
+
 	async def test_read_all_stations_by_not_permitted_user(self, ac: AsyncClient, session: AsyncSession):
 		r = await ac.get(
 			"/v1/stations/",
@@ -620,6 +707,7 @@ class TestStations:
 			delete(stations.StationControl).where(stations.StationControl.station_id == self.station.id)
 		)
 		await session.commit()
+		await station_data_cache.invalidate(self.station.id)
 
 		non_existing_data_r = await ac.get(
 			"/v1/stations/me/" + StationParamsEnum.CONTROL.value,
@@ -646,6 +734,54 @@ class TestStations:
 		assert response.status_code == 200
 		schemas_stations.StationForStation(**response.json())  # Validation error
 
+	async def test_read_stations_me_single_query(self, ac: AsyncClient, session: AsyncSession):
+		"""
+		Все данные станции (настройки, контроль, программы, машины и средства) читаются из БД одним запросом.
+		"""
+		await ac.get("/v1/stations/me", headers=self.station.headers)  # станция в кэше аутентификации
+		await station_data_cache.invalidate(self.station.id)
+		statements = []
+		engine = session.bind.sync_engine
+
+		def on_execute(conn, cursor, statement, *args):
+			statements.append(statement)
+
+		event.listen(engine, "before_cursor_execute", on_execute)
+		try:
+			response = await ac.get("/v1/stations/me", headers=self.station.headers)
+		finally:
+			event.remove(engine, "before_cursor_execute", on_execute)
+		assert response.status_code == 200
+		assert len([s for s in statements if s.startswith("SELECT")]) == 1
+
+		station = schemas_stations.StationForStation(**response.json())
+		assert station.station_settings == self.station.station_settings
+		assert [p.program_step for p in station.station_programs] == \
+			   sorted(p.program_step for p in self.station.station_programs)
+		assert len(station.station_washing_machines) == len(self.station.station_washing_machines)
+		assert len(station.station_washing_agents) == len(self.station.station_washing_agents)
+
+	async def test_station_auth_cache(self, ac: AsyncClient, session: AsyncSession):
+		"""
+		Кэш аутентификации станций: изменение станции в другом воркере (новое поколение в Redis)
+		 сбрасывает запись и в этом.
+		"""
+		url = "/v1/stations/me/" + StationParamsEnum.GENERAL.value
+		assert (await ac.get(url, headers=self.station.headers)).status_code == 200
+
+		await session.execute(update(stations.Station).where(stations.Station.id == self.station.id).values(
+			is_active=False
+		))
+		await session.commit()
+		cached_r = await ac.get(url, headers=self.station.headers)
+		assert cached_r.status_code == 200  # поколение не менялось - станция из кэша
+
+		await redis_client.set(station_auth_cache.generation_key(self.station.id), uuid.uuid4().hex)
+		inactive_r = await ac.get(url, headers=self.station.headers)
+		assert inactive_r.status_code == 403
+
+		await change_station_params(self.station, session, is_active=True)
+
 	async def test_read_station_me_errors(self, ac: AsyncClient, session: AsyncSession):
 		"""
 		- Отсутствие данных по станции;
@@ -660,6 +796,7 @@ class TestStations:
 			delete(stations.StationSettings).where(stations.StationSettings.station_id == self.station.id)
 		)
 		await session.commit()
+		await station_data_cache.invalidate(self.station.id)
 
 		non_existing_data_r = await ac.get(
 			"/v1/stations/me",
@@ -668,3 +805,106 @@ class TestStations:
 
 		assert non_existing_data_r.status_code == 404
 
+	async def test_read_stations_me_etag(self, ac: AsyncClient, session: AsyncSession):
+		"""
+		Условное чтение данных станции станцией: 304 по If-None-Match, пока данные (набор) не изменились.
+		"""
+		urls = ["/v1/stations/me"] + [
+			"/v1/stations/me/" + dataset.value for dataset in (
+				StationParamsEnum.GENERAL, StationParamsEnum.SETTINGS, StationParamsEnum.PROGRAMS
+			)
+		]
+		etags = {}
+		for url in urls:
+			await ac.get(url, headers=self.station.headers)  # запись в кэше данных станций
+			response = await ac.get(url, headers=self.station.headers)
+			assert response.status_code == 200
+			etags[url] = response.headers["etag"]
+
+			not_modified_r = await ac.get(url, headers=self.station.headers | {"If-None-Match": etags[url]})
+			assert not_modified_r.status_code == 304
+			assert not_modified_r.headers["etag"] == etags[url]
+			assert not not_modified_r.content
+
+			other_etag_r = await ac.get(url, headers=self.station.headers | {"If-None-Match": '"other"'})
+			assert other_etag_r.status_code == 200
+			assert other_etag_r.json() == response.json()
+
+		update_r = await ac.put(
+			f"/v1/manage/station/{self.station.id}/" + StationParamsEnum.SETTINGS.value,
+			headers=self.installer.headers,
+			json={"updating_params": {"teh_power": not self.station.station_settings.teh_power}}
+		)
+		assert update_r.status_code == 200
+
+		for url in urls:
+			response = await ac.get(url, headers=self.station.headers | {"If-None-Match": etags[url]})
+			if url.endswith(StationParamsEnum.SETTINGS.value) or url == "/v1/stations/me":
+				assert response.status_code == 200
+				assert response.headers["etag"] != etags[url]
+				settings = response.json() if url.endswith(StationParamsEnum.SETTINGS.value) \
+					else response.json()["station_settings"]
+				assert settings["teh_power"] is not self.station.station_settings.teh_power
+			else:
+				assert response.status_code == 304
+
+		# основные параметры изменены в другом воркере: там сбросился кэш и задано новое поколение станции
+		general_url = "/v1/stations/me/" + StationParamsEnum.GENERAL.value
+		await session.execute(update(stations.Station).where(stations.Station.id == self.station.id).values(
+			comment="changed in other worker"
+		))
+		await session.commit()
+		await redis_client.set(station_auth_cache.generation_key(self.station.id), uuid.uuid4().hex)
+		response = await ac.get(general_url, headers=self.station.headers | {"If-None-Match": etags[general_url]})
+		assert response.status_code == 200
+		assert response.json()["comment"] == "changed in other worker"
+		assert response.headers["etag"] != etags[general_url]
+		not_modified_r = await ac.get(general_url,
+									  headers=self.station.headers | {"If-None-Match": response.headers["etag"]})
+		assert not_modified_r.status_code == 304
+
+	async def test_read_stations_events(self, ac: AsyncClient, session: AsyncSession, monkeypatch):
+		"""
+		Поток изменений данных станции: изменение настроек доходит до станции событием с новыми данными и версией,
+		 сброс набора - событием без данных.
+		"""
+		monkeypatch.setattr(config, "STATION_EVENTS_STREAM_DURATION", 1.5)
+		stream = asyncio.create_task(ac.get("/v1/stations/me/events", headers=self.station.headers))
+		await asyncio.sleep(0.5)
+
+		update_r = await ac.put(
+			f"/v1/manage/station/{self.station.id}/" + StationParamsEnum.SETTINGS.value,
+			headers=self.installer.headers,
+			json={"updating_params": {"teh_power": not self.station.station_settings.teh_power}}
+		)
+		assert update_r.status_code == 200
+		await station_data_cache.invalidate(self.station.id, StationParamsEnum.PROGRAMS)
+
+		response = await stream
+		assert response.status_code == 200
+		assert response.headers["content-type"].startswith("text/event-stream")
+		events = [
+			(lines[0].removeprefix("event: "), json.loads(lines[1].removeprefix("data: ")))
+			for lines in (event.split("\n") for event in response.text.split("\n\n"))
+			if lines[0].startswith("event: ")
+		]
+		settings_events = [data for dataset, data in events if dataset == StationParamsEnum.SETTINGS.value]
+		assert len(settings_events) == 1
+		assert settings_events[0]["data"]["teh_power"] is not self.station.station_settings.teh_power
+		programs_events = [data for dataset, data in events if dataset == StationParamsEnum.PROGRAMS.value]
+		assert len(programs_events) == 1
+		assert programs_events[0]["data"] is None
+
+		# версия в событии - версия набора в ETag (станция может сразу сверить ее с If-None-Match)
+		for dataset, event in ((StationParamsEnum.SETTINGS, settings_events[0]),
+							   (StationParamsEnum.PROGRAMS, programs_events[0])):
+			url, etag = "/v1/stations/me/" + dataset.value, encode_etag(event["version"])
+			read_r = await ac.get(url, headers=self.station.headers)
+			assert read_r.headers["etag"] == etag
+			not_modified_r = await ac.get(url, headers=self.station.headers | {"If-None-Match": etag})
+			assert not_modified_r.status_code == 304
+
+		await auth.url_auth_stations_test(
+			"/v1/stations/me/events", "get", self.station, session, ac
+		)
+
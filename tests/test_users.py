@@ -1,12 +1,18 @@
+import asyncio
+import datetime
+
 import pytest
 from httpx import AsyncClient
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app import tasks
 from app.models.users import User
 from app.schemas import schemas_users as users
-from app.static.enums import RoleEnum, RegionEnum, UserSortingEnum
+from app.static.enums import RoleEnum, RegionEnum, UserSortingEnum, CacheTagEnum
+from app.utils.activity import users_activity
+from app.utils.cache import invalidate_cache
 from app.utils.general import verify_data_hash
 from tests.additional import auth, users as users_funcs, strings, other
 
@@ -70,6 +76,21 @@ class TestUsers:
 		)
 		assert len(r) == 1
 
+	async def test_read_users_cache(self, session: AsyncSession, ac: AsyncClient):
+		"""
+		Кэш списка пользователей: повторный запрос отдается из кэша, после изменения пользователя - кэш сброшен.
+		"""
+		r = await ac.get("/v1/users/", headers=self.manager.headers)
+		await session.execute(update(User).where(User.id == self.laundry.id).values(first_name="Cached"))
+		await session.commit()
+		assert (await ac.get("/v1/users/", headers=self.manager.headers)).json() == r.json()
+
+		update_r = await ac.put(f"/v1/users/{self.laundry.id}", headers=self.sysadmin.headers,
+								json=dict(user_update={"first_name": "Updated"}))
+		assert update_r.status_code == 200
+		r = await ac.get("/v1/users/", headers=self.manager.headers)
+		assert next(u for u in r.json() if u["id"] == self.laundry.id)["first_name"] == "Updated"
+
 	async def test_read_users_with_ordering(self, session: AsyncSession, ac: AsyncClient):
 		users_ = await users_funcs.get_all_users(session)
 		for u in users_:
@@ -470,6 +491,59 @@ class TestUsers:
 		user_exists = await users_funcs.get_user_by_id(self.manager.id, session)
 		assert not user_exists
 
+	async def test_current_user_cache(self, ac: AsyncClient, session: AsyncSession):
+		"""
+		Кэш пользователей по токенам: повторные запросы не читают пользователя из БД,
+		 изменение и удаление пользователя сразу сбрасывают кэш.
+		"""
+		r = await ac.get("/v1/auth/user", headers=self.laundry.headers)
+		assert r.status_code == 200
+		await session.execute(update(User).where(User.id == self.laundry.id).values(first_name="Cached"))
+		await session.commit()
+		await invalidate_cache(CacheTagEnum.USERS)
+		cached_r = await ac.get("/v1/auth/user", headers=self.laundry.headers)
+		assert cached_r.json()["first_name"] == r.json()["first_name"]
+
+		disable_r = await ac.put(f"/v1/users/{self.laundry.id}", headers=self.sysadmin.headers,
+								 json=dict(user_update={"disabled": True}))
+		assert disable_r.status_code == 200
+		assert (await ac.get("/v1/auth/user", headers=self.laundry.headers)).status_code == 403
+
+		assert (await ac.get("/v1/auth/user", headers=self.manager.headers)).status_code == 200
+		delete_r = await ac.delete(f"/v1/users/{self.manager.id}", headers=self.sysadmin.headers)
+		assert delete_r.status_code == 200
+		assert (await ac.get("/v1/auth/user", headers=self.manager.headers)).status_code == 401
+
+	async def test_users_activity(self, ac: AsyncClient, session: AsyncSession, monkeypatch: pytest.MonkeyPatch):
+		"""
+		Время последнего действия пользователя накапливается и записывается в БД пачкой (фоновой задачей);
+		 если запись прервана, записи не теряются.
+		"""
+		last_action_at = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+		await users_funcs.change_user_data(self.laundry, session, last_action_at=last_action_at)
+		started_at = datetime.datetime.now(datetime.timezone.utc)
+		for _ in range(3):
+			assert (await ac.get("/v1/auth/user", headers=self.laundry.headers)).status_code == 200
+		session.expire_all()
+		user = await users_funcs.get_user_by_id(self.laundry.id, session)
+		assert user.last_action_at == last_action_at
+
+		async def interrupted_update(*args) -> None:
+			await asyncio.sleep(10)
+
+		with monkeypatch.context() as m:  # запись прервана (отключение сервера) - записи возвращаются в Redis
+			m.setattr(User, "bulk_update_last_action", interrupted_update)
+			task = asyncio.create_task(tasks.flush_users_activity())
+			await asyncio.sleep(0.1)
+			task.cancel()
+			with pytest.raises(asyncio.CancelledError):
+				await task
+
+		await User.bulk_update_last_action(session, await users_activity.take())  # app.tasks.flush_users_activity
+		session.expire_all()
+		user = await users_funcs.get_user_by_id(self.laundry.id, session)
+		assert user.last_action_at >= started_at - datetime.timedelta(seconds=1)
+
 	async def test_delete_user_by_self(self, session: AsyncSession, ac: AsyncClient):
 		r = await ac.delete(
 			f"/v1/users/{self.manager.id}",